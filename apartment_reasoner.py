@@ -1,135 +1,169 @@
+import numpy as np
+from knowledge_graph_creation.analytics import AnalyticsEngine
 from knowledge_graph_creation.apartment_graph import ApartmentGraph
-from geopy.geocoders import Nominatim
+from knowledge_graph_creation.schema import index_usage
+from knowledge_graph_creation.price_buckets import assign_buckets, quantile_price_ranges
+from knowledge_graph_creation.spatial_index import neighbor_pairs
+from knowledge_graph_creation.geocoding import GeocodingCache, NominatimGeocoder, reverse_geocode
 
 class ApartmentReasoner:
 
-    def __init__(self, apartment_graph):
+    # With vectorized=True the analytics are answered by an AnalyticsEngine over a snapshot that is loaded once,
+    # call refresh() after the graph changed
+    def __init__(self, apartment_graph, vectorized=False):
         self.apartment_graph = apartment_graph
+        self.backend = apartment_graph.backend
+        self.vectorized = vectorized
+        self.engine = None
+        self.aggregates_checked = False
+
+    # Backend or snapshot engine the analytics are read from
+    def analytics(self):
+        if not self.vectorized:
+            self.ensure_aggregates()
+            return self.backend
+        if self.engine is None:
+            self.engine = AnalyticsEngine.from_backend(self.backend)
+        return self.engine
+
+    def refresh(self):
+        self.engine = None
+
+    # The backend analytics read the District / Owner aggregates and skip nodes without them. A graph imported
+    # before they were materialized gets them rebuilt once, before the first analytics query.
+    def ensure_aggregates(self):
+        if self.aggregates_checked:
+            return
+        stale = self.backend.stale_aggregates()
+        if stale:
+            print(f"Rebuilding aggregates, {stale} District and Owner nodes with apartments have none")
+            self.backend.rebuild_aggregates()
+        self.aggregates_checked = True
 
     # Find the average price of apartments in each district
     def find_average_price_of_apartments_each_district(self):
-        query = f'''
-                USE {self.apartment_graph.db_name}
-                MATCH (a:Apartment)-[:LOCATED_IN]->(d:District)
-                WHERE a.price IS NOT NULL
-                RETURN d.name AS district, AVG(a.price) AS average_price
-                ORDER BY average_price DESC;'''
-        with self.apartment_graph.driver.session() as session:
-            graph_response = session.run(query)
-            return [record.data() for record in graph_response]
-
-    # looks up addresses for apartments coordinates and adds new nodes
-    def add_addresses(self):
-        addresses = []
-        query = f''' 
-                USE {self.apartment_graph.db_name}
-                MATCH (a:Apartment)
-                WITH a.lon AS lon, a.lat AS lat
-                RETURN lon, lat'''
-        with self.apartment_graph.driver.session() as session:
-            graph_response = session.run(query)
-            for record in graph_response:
-                if not {"lon":record["lon"], "lat":record["lat"]} in addresses:
-                    addresses.append({"lon": record["lon"], "lat": record["lat"]})
-        geolocator = Nominatim(user_agent="address_converter")
-
-        for address in addresses:
-            location = geolocator.reverse(f'''{address["lat"]}, {address["lon"]}''')
-            address["name"] = location
-
-        for address in addresses:
-            query = f'''
-                   USE {self.apartment_graph.db_name}
-                   MERGE (ad:Address {{name: $name}})
-                    ON CREATE SET a.lon = $lon, a.lat = $lat
-                   '''
-            with self.apartment_graph.driver.session() as session:
-                session.run(query, name=address["name"], lon=address["lon"], lat=address["lat"])
-        query = f'''
-                USE {self.apartment_graph.db_name}
-                MATCH(a: Apartment), (address:Address)
-                WHERE a.lon = address.lon AND a.lat = address.lat
-                MERGE(a) - [: LOCATED_AT_ADDRESS]->(address)'''
-        with self.apartment_graph.driver.session() as session:
-            session.run(query)
-
-    # Add new relationship between apartments that have the same coordinates as neighbors
-    def add_neighbors(self):
-        query = f'''
-                USE {self.apartment_graph.db_name}
-                MATCH (a1:Apartment), (a2:Apartment)
-                WHERE a1 <> a2 AND a1.lon = a2.lon AND a1.lat = a2.lat
-                MERGE (a1)-[:NEIGHBOR_OF]->(a2)'''
-
-        with self.apartment_graph.driver.session() as session:
-            return session.run(query)
+        return self.analytics().average_price_per_district()
+
+    # looks up addresses for apartments coordinates and adds new nodes. Lookups go through the on-disk cache,
+    # so rerunning over the same apartments makes no geocoder calls.
+    def add_addresses(self, geocoder=None, cache=None, max_workers=4, calls_per_second=1.0):
+        apartments = {}
+        for apartment_id, lon, lat in self.backend.apartment_coordinates():
+            apartments.setdefault((lat, lon), []).append(apartment_id)
+
+        geocoder = geocoder or NominatimGeocoder()
+        own_cache = cache is None
+        cache = cache or GeocodingCache()
+        try:
+            names = reverse_geocode(apartments.keys(), geocoder, cache, max_workers, calls_per_second)
+        finally:
+            if own_cache:
+                cache.close()
+        addresses = [{"name": names[(lat, lon)], "lon": lon, "lat": lat, "apartment_ids": ids}
+                     for (lat, lon), ids in apartments.items() if names[(lat, lon)] is not None]
+        self.backend.merge_addresses(addresses)
+        return len(addresses)
+
+    # Add new relationship between apartments that have the same coordinates as neighbors, or that are at most
+    # radius meters apart. Neighbors are found with a spatial index on the client and written in batches.
+    def add_neighbors(self, radius=None, batch_size=10000):
+        points = self.backend.apartment_coordinates()
+        return self.backend.merge_neighbors(neighbor_pairs(points, radius), batch_size)
 
     # Find the district with the most apartments
     def find_district_with_most_apartments(self):
-        query = f'''
-                USE {self.apartment_graph.db_name}
-                MATCH(a: Apartment)-[: LOCATED_IN]->(d:District)
-                RETURN d.name AS district, COUNT(a) AS apartment_count
-                ORDER BY apartment_count DESC'''
-        with self.apartment_graph.driver.session() as session:
-            graph_response = session.run(query)
-            return [record.data() for record in graph_response]
+        return self.analytics().apartments_per_district()
 
     # Finding apartments with unusually high prices regarding the prices in the same district
-    def find_expensive_apartments(self):
-        query = f'''
-                USE {self.apartment_graph.db_name}
-                MATCH (a:Apartment)-[:LOCATED_IN]->(d:District)
-                WITH d, AVG(a.price) AS district_avg_price
-                
-                MATCH (a:Apartment)-[:LOCATED_IN]->(d)
-                WHERE a.price > (district_avg_price * 3) 
-                
-                RETURN a, district_avg_price;'''
-        with self.apartment_graph.driver.session() as session:
-            graph_response = session.run(query)
-            return [record.data() for record in graph_response]
+    def find_expensive_apartments(self, factor=3):
+        return self.analytics().expensive_apartments(factor)
 
     # Identifying potentially overcrowded districts
-    def find_overcrowded_districts(self):
-        query = f'''
-                USE {self.apartment_graph.db_name}
-                MATCH (a:Apartment)-[:LOCATED_IN]->(d:District)
-                WITH d, AVG(a.number_of_rooms) AS avgRooms
-
-                MATCH (a:Apartment)-[:LOCATED_IN]->(d)
-                WHERE avgRooms < 2.3
-
-                RETURN DISTINCT d, avgRooms;'''
-        with self.apartment_graph.driver.session() as session:
-            graph_response = session.run(query)
-            return [record.data() for record in graph_response]
+    def find_overcrowded_districts(self, max_average_rooms=2.3):
+        return self.analytics().overcrowded_districts(max_average_rooms)
+
+    # Verifies the materialized District / Owner aggregates the analytics read against a full recompute,
+    # with repair=True they are rebuilt if they drifted
+    def check_aggregates(self, repair=False):
+        mismatches = self.backend.check_aggregates()
+        for mismatch in mismatches:
+            print(f"{mismatch['label']} {mismatch['key']}: {mismatch['property']} is {mismatch['stored']}, "
+                  f"expected {mismatch['expected']}")
+        if mismatches and repair:
+            self.backend.rebuild_aggregates()
+            self.refresh()
+        print(f"{len(mismatches)} aggregate mismatches")
+        return mismatches
+
+    # Plans the reads behind the reasoner's queries without running them and reports, per query, the index lookups
+    # of its plans and the label scans left. Needs a backend with a query planner.
+    def index_usage(self, sample_ids=("sample",)):
+        reads = {
+            "average_price_per_district": self.backend.average_price_per_district,
+            "apartments_per_district": self.backend.apartments_per_district,
+            "expensive_apartments": self.backend.expensive_apartments,
+            "overcrowded_districts": self.backend.overcrowded_districts,
+            "owner_with_most_apartments": self.backend.owner_with_most_apartments,
+            "apartment_coordinates": self.backend.apartment_coordinates,
+            "read_prices": lambda: self.backend.read_prices(list(sample_ids)),
+            "read_price_ranges": lambda: self.backend.read_price_ranges(list(sample_ids)),
+        }
+        report = {}
+        for name, read in reads.items():
+            with self.backend.explain() as plans:
+                read()
+            usage = [index_usage(plan) for plan in plans]
+            report[name] = {"indexes": [index for plan in usage for index in plan["indexes"]],
+                            "scans": [scan for plan in usage for scan in plan["scans"]]}
+            print(f"{name}:")
+            for index in report[name]["indexes"]:
+                print(f"\tindex {index}")
+            for scan in report[name]["scans"]:
+                print(f"\tscan  {scan}")
+        return report
 
     # Find the organisation that owns the most apartments
     def find_owner_with_most_apartments(self):
-        query = f'''
-                USE {self.apartment_graph.db_name}
-                MATCH (o:Owner)<-[:OWNED_BY]-(a:Apartment)
-                WITH o, COUNT(a) AS apartmentCount
-                ORDER BY apartmentCount DESC
-                LIMIT 1
-                RETURN o, apartmentCount;'''
-        with self.apartment_graph.driver.session() as session:
-            graph_response = session.run(query)
-            return [record.data() for record in graph_response]
-
-    def add_price_ranges(self):
-        query = f'''
-                USE {self.apartment_graph.db_name}
-                UNWIND $price_ranges as price_range
-                MERGE (p:PriceRange {{name: price_range[0]}})
-                ON CREATE SET p.min_price = price_range[1][0], p.max_price = price_range[1][1]
-                WITH price_range, p
-                MATCH (a:Apartment)
-                WHERE a.price >= price_range[1][0] AND a.price <= price_range[1][1]
-                MERGE (a)-[:IN_PRICE_RANGE]->(p)'''
-        with self.apartment_graph.driver.session() as session:
-            return session.run(query, price_ranges=list(price_ranges.items()))
+        return self.analytics().owner_with_most_apartments()
+
+    # Puts every apartment into one of the price ranges after a single read of all prices: the module's
+    # price_ranges, the given name -> (min, max) ranges or, with quantiles set, that many ranges of about the same
+    # size. Only apartments whose range changed are rewritten. Returns the number of rewritten apartments.
+    # Without any valid price there are no quantile ranges, then nothing is written.
+    def add_price_ranges(self, ranges=None, quantiles=None, batch_size=10000):
+        ids, prices, valid = self.backend.read_prices()
+        if quantiles:
+            ranges = quantile_price_ranges(prices[valid], quantiles)
+            if not ranges:
+                print("No apartment has a valid price, no quantile price ranges written")
+                return 0
+        elif ranges is None:
+            ranges = price_ranges
+        _, current = self.backend.read_price_ranges()
+        return self.assign_price_ranges(ranges, ids, prices, valid, current, batch_size)
+
+    def assign_price_ranges(self, ranges, ids, prices, valid, current, batch_size=10000):
+        names, buckets = assign_buckets(prices, valid, ranges)
+        wanted = np.array(names + [None], dtype=object)[buckets]
+        have = np.array([current.get(apartment_id) for apartment_id in ids.tolist()], dtype=object)
+        moved = np.flatnonzero(wanted != have)
+        return self.backend.write_price_ranges(ranges, [(ids[row], wanted[row]) for row in moved], batch_size)
+
+    # Recomputes the IN_PRICE_RANGE and NEIGHBOR_OF edges of the given apartments only, e.g. with the
+    # upserted ids returned by ApartmentGraph.delta_import_json. Removed apartments lose their edges on removal.
+    def update_derived_edges(self, apartment_ids, update_price_ranges=True, update_neighbors=True, radius=None,
+                             batch_size=10000):
+        apartment_ids = list(apartment_ids)
+        if not apartment_ids:
+            return
+        if update_price_ranges:
+            definitions, current = self.backend.read_price_ranges(apartment_ids)
+            ids, prices, valid = self.backend.read_prices(apartment_ids)
+            self.assign_price_ranges(definitions or price_ranges, ids, prices, valid, current, batch_size)
+        if update_neighbors:
+            self.backend.delete_relationships(apartment_ids, ["NEIGHBOR_OF"])
+            points = self.backend.apartment_coordinates()
+            self.backend.merge_neighbors(neighbor_pairs(points, radius, set(apartment_ids)), batch_size)
 
 price_ranges = {
     "Low": (0, 400000),
@@ -141,8 +175,8 @@ price_ranges = {
 
 
 if __name__ == "__main__":
-    ag = ApartmentGraph("bolt://localhost:7687", "neo4j", "password", "neo4j")
-    ar = ApartmentReasoner(ag)
-    ar.add_neighbors()
-    ar.add_price_ranges()
+    from async_reasoner import run_full_report
 
+    ag = ApartmentGraph("bolt://localhost:7687", "neo4j", "password", "neo4j")
+    run_full_report(ag, enrichment=("neighbors", "price_ranges"))
+    ag.close()
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from apartment_reasoner import ApartmentReasoner
+from knowledge_graph_creation.apartment_graph import ApartmentGraph
+from knowledge_graph_creation.async_neo4j_backend import AsyncNeo4jBackend
+from knowledge_graph_creation.neo4j_backend import Neo4jBackend
+
+# report name -> (analytics method, labels and relationship types it reads)
+ANALYTICS = {
+    "average_price_per_district": ("average_price_per_district", {"District"}),
+    "district_with_most_apartments": ("apartments_per_district", {"District"}),
+    "expensive_apartments": ("expensive_apartments", {"District", "Apartment", "LOCATED_IN"}),
+    "overcrowded_districts": ("overcrowded_districts", {"District"}),
+    "owner_with_most_apartments": ("owner_with_most_apartments", {"Owner"}),
+}
+
+
+# One unit of a run plan. run is a coroutine function, after names the steps that have to finish first, reads and
+# writes the labels and relationship types the step touches. Two steps conflict if one writes what the other reads
+# or writes; conflicting steps never overlap.
+class Step:
+
+    def __init__(self, name, run, after=(), reads=(), writes=()):
+        self.name = name
+        self.run = run
+        self.after = set(after)
+        self.reads = set(reads)
+        self.writes = set(writes)
+
+    def conflicts(self, other):
+        return bool(self.writes & (other.reads | other.writes) or other.writes & self.reads)
+
+
+async def timed(step):
+    start = time.perf_counter()
+    result = await step.run()
+    return result, time.perf_counter() - start
+
+
+# Starts every step as soon as the steps it comes after are done and no conflicting step is running, in plan order
+# when several are ready. Returns name -> (result, seconds). If a step fails the running ones are cancelled.
+async def run_plan(steps):
+    pending = {step.name: step for step in steps}
+    for step in pending.values():
+        unknown = step.after - pending.keys()
+        if unknown:
+            raise ValueError(f"{step.name} comes after unknown steps {sorted(unknown)}")
+    results = {}
+    running = {}
+    try:
+        while pending or running:
+            for name, step in list(pending.items()):
+                if step.after <= results.keys() and not any(step.conflicts(other) for other in running.values()):
+                    del pending[name]
+                    running[asyncio.ensure_future(timed(step))] = step
+            if not running:
+                raise ValueError(f"Steps {sorted(pending)} can't run, their dependencies form a cycle")
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                results[running.pop(task).name] = task.result()
+    finally:
+        for task in running:
+            task.cancel()
+    return results
+
+
+# Runs the reasoner as a plan of concurrent steps. Against Neo4j the analytics are read over the async driver,
+# each on its own pooled connection; other backends and the vectorized engine answer them in worker threads.
+# The enrichment steps write through the synchronous backend in worker threads, its driver is thread safe.
+class AsyncApartmentReasoner:
+
+    def __init__(self, apartment_graph, max_connection_pool_size=16, vectorized=False):
+        self.reasoner = ApartmentReasoner(apartment_graph, vectorized)
+        self.async_backend = None
+        if isinstance(apartment_graph.backend, Neo4jBackend) and not vectorized:
+            self.async_backend = AsyncNeo4jBackend.from_backend(apartment_graph.backend, max_connection_pool_size)
+        self.engine_lock = asyncio.Lock()
+
+    async def close(self):
+        if self.async_backend is not None:
+            await self.async_backend.close()
+
+    async def analytics(self, name, *args):
+        if self.async_backend is not None:
+            return await getattr(self.async_backend, name)(*args)
+        async with self.engine_lock:
+            analytics = await asyncio.to_thread(self.reasoner.analytics)
+        return await asyncio.to_thread(getattr(analytics, name), *args)
+
+    # All analytics concurrently, returns report name -> result
+    async def run_analytics(self):
+        results = await asyncio.gather(*(self.analytics(method) for method, _ in ANALYTICS.values()))
+        return dict(zip(ANALYTICS, results))
+
+    # Steps of a full report: the enrichment steps named in enrichment ("addresses", "neighbors", "price_ranges"),
+    # a rebuild of missing District / Owner aggregates unless vectorized, with check_aggregates a verification and
+    # repair of them, and the analytics, which come after both. address_options are passed to
+    # ApartmentReasoner.add_addresses.
+    # The in-process backends are not safe to write from several threads, there the writing steps run one at a time
+    # and never next to the analytics.
+    def plan(self, enrichment=("neighbors", "price_ranges"), check_aggregates=False, address_options=None):
+        unknown = set(enrichment) - {"addresses", "neighbors", "price_ranges"}
+        if unknown:
+            raise ValueError(f"Unknown enrichment steps {sorted(unknown)}")
+        shared = set() if self.async_backend is not None else {"graph"}
+        steps = []
+        if "addresses" in enrichment:
+            steps.append(Step("addresses", lambda: asyncio.to_thread(self.reasoner.add_addresses,
+                                                                      **(address_options or {})),
+                              reads={"Apartment"}, writes={"Address", "LOCATED_AT_ADDRESS"}))
+        if "neighbors" in enrichment:
+            steps.append(Step("neighbors", lambda: asyncio.to_thread(self.reasoner.add_neighbors),
+                              reads={"Apartment", "NEIGHBOR_OF"}, writes={"NEIGHBOR_OF"}))
+        if "price_ranges" in enrichment:
+            steps.append(Step("price_ranges", lambda: asyncio.to_thread(self.reasoner.add_price_ranges),
+                              reads={"Apartment", "PriceRange", "IN_PRICE_RANGE"},
+                              writes={"PriceRange", "IN_PRICE_RANGE"}))
+        aggregates = {"Apartment", "LOCATED_IN", "OWNED_BY", "District", "Owner"}
+        analytics_after = set()
+        if not self.reasoner.vectorized:
+            steps.append(Step("ensure_aggregates", lambda: asyncio.to_thread(self.reasoner.ensure_aggregates),
+                              reads=aggregates, writes={"District", "Owner"}))
+            analytics_after.add("ensure_aggregates")
+        if check_aggregates:
+            steps.append(Step("aggregates", lambda: asyncio.to_thread(self.reasoner.check_aggregates, True),
+                              after=analytics_after.copy(), reads=aggregates, writes={"District", "Owner"}))
+            analytics_after.add("aggregates")
+        for name, (method, reads) in ANALYTICS.items():
+            steps.append(Step(name, lambda method=method: self.analytics(method), after=analytics_after,
+                              reads=reads))
+        for step in steps:
+            step.reads |= shared
+            if step.writes:
+                step.writes |= shared
+        return steps
+
+    # Runs the plan and returns every analytics result together with the seconds of every step and of the whole run
+    async def full_report(self, enrichment=("neighbors", "price_ranges"), check_aggregates=False,
+                          address_options=None):
+        start = time.perf_counter()
+        results = await run_plan(self.plan(enrichment, check_aggregates, address_options))
+        report = {"results": {name: result for name, (result, _) in results.items() if name in ANALYTICS},
+                  "enrichment": {name: result for name, (result, _) in results.items() if name not in ANALYTICS},
+                  "timings": {name: seconds for name, (_, seconds) in results.items()},
+                  "seconds": time.perf_counter() - start}
+        for name, seconds in report["timings"].items():
+            print(f"{name:<32} {seconds:>8.3f}s")
+        print(f"{'full report':<32} {report['seconds']:>8.3f}s")
+        return report
+
+
+# Synchronous entry point: full_report on a new event loop, closing the async driver afterwards
+def run_full_report(apartment_graph, max_connection_pool_size=16, vectorized=False, **options):
+    async def run():
+        reasoner = AsyncApartmentReasoner(apartment_graph, max_connection_pool_size, vectorized)
+        try:
+            return await reasoner.full_report(**options)
+        finally:
+            await reasoner.close()
+    return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    ag = ApartmentGraph("bolt://localhost:7687", "neo4j", "password", "neo4j")
+    run_full_report(ag)
+    ag.close()
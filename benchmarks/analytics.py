@@ -0,0 +1,146 @@
+import argparse
+import math
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+from apartment_reasoner import ApartmentReasoner
+from benchmarks.json_ingestion import scaled_listings
+from knowledge_graph_creation.analytics import AnalyticsEngine
+from knowledge_graph_creation.apartment_graph import ApartmentGraph
+from knowledge_graph_creation.listings_io import write_listings
+
+METHODS = ["find_average_price_of_apartments_each_district", "find_district_with_most_apartments",
+           "find_expensive_apartments", "find_overcrowded_districts", "find_owner_with_most_apartments"]
+
+
+def row_average(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+
+# Row-at-a-time evaluation of the reasoner queries with the same result shapes, one scan per query and
+# two for the ones that match apartments again after aggregating, the way the Cypher versions are evaluated
+def row_at_a_time(backend, factor=3, max_average_rooms=2.3):
+    apartments = backend.nodes["Apartment"]
+    districts = backend.nodes["District"]
+    located_in = list(zip(*backend.edges["LOCATED_IN"].arrays()))
+
+    prices = defaultdict(list)
+    for apartment, district in located_in:
+        prices[district].append(apartments.columns["price"].get(apartment))
+    district_prices = {district: row_average(values) for district, values in prices.items()}
+    average_prices = sorted(({"district": districts.columns["name"].get(district), "average_price": average}
+                             for district, average in district_prices.items() if average is not None),
+                            key=lambda item: -item["average_price"])
+
+    counts = defaultdict(int)
+    for _, district in located_in:
+        counts[district] += 1
+    apartment_counts = sorted(({"district": districts.columns["name"].get(district), "apartment_count": count}
+                               for district, count in counts.items()), key=lambda item: -item["apartment_count"])
+
+    prices = defaultdict(list)
+    for apartment, district in located_in:
+        prices[district].append(apartments.columns["price"].get(apartment))
+    district_prices = {district: row_average(values) for district, values in prices.items()}
+    expensive = []
+    for apartment, district in located_in:
+        price = apartments.columns["price"].get(apartment)
+        average = district_prices[district]
+        if price is not None and average is not None and price > average * factor:
+            expensive.append({"a": apartments.node(apartment), "district_avg_price": average})
+
+    rooms = defaultdict(list)
+    for apartment, district in located_in:
+        rooms[district].append(apartments.columns["number_of_rooms"].get(apartment))
+    district_rooms = {district: row_average(values) for district, values in rooms.items()}
+    overcrowded = {}
+    for _, district in located_in:
+        average = district_rooms[district]
+        if average is not None and average < max_average_rooms:
+            overcrowded[district] = {"d": districts.node(district), "avgRooms": average}
+
+    owners = defaultdict(int)
+    for _, owner in zip(*backend.edges["OWNED_BY"].arrays()):
+        owners[owner] += 1
+    top_owner = max(owners, key=owners.get, default=None)
+    return {
+        "find_average_price_of_apartments_each_district": average_prices,
+        "find_district_with_most_apartments": apartment_counts,
+        "find_expensive_apartments": expensive,
+        "find_overcrowded_districts": [overcrowded[district] for district in sorted(overcrowded)],
+        "find_owner_with_most_apartments": [] if top_owner is None else [
+            {"o": backend.nodes["Owner"].node(top_owner), "apartmentCount": owners[top_owner]}],
+    }
+
+
+def same_results(expected, actual):
+    if isinstance(expected, float) and isinstance(actual, float):
+        return math.isclose(expected, actual, rel_tol=1e-9)
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        return expected.keys() == actual.keys() and all(same_results(expected[k], actual[k]) for k in expected)
+    if isinstance(expected, list) and isinstance(actual, list):
+        return len(expected) == len(actual) and all(same_results(e, a) for e, a in zip(expected, actual))
+    return expected == actual
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def offline_benchmark(source, scales):
+    print(f"{'apartments':>10} {'row-at-a-time s':>16} {'snapshot s':>11} {'engine s':>9} {'speedup':>8}")
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "listings.jsonl")
+            write_listings(path, scaled_listings(source, scale))
+            ag = ApartmentGraph(backend="memory")
+            ag.import_json(path, bulk=True)
+        expected, row_seconds = timed(lambda: row_at_a_time(ag.backend))
+        engine, snapshot_seconds = timed(lambda: AnalyticsEngine.from_backend(ag.backend))
+        report, engine_seconds = timed(engine.report)
+        assert same_results(expected, report)
+        total = snapshot_seconds + engine_seconds
+        print(f"{len(ag.backend.nodes['Apartment']):>10} {row_seconds:>16.3f} {snapshot_seconds:>11.3f} "
+              f"{engine_seconds:>9.3f} {row_seconds / total:>7.1f}x")
+
+
+# Runs every reasoner query in Cypher and through the engine on an imported database and checks the results
+def server_benchmark(uri, user, password, db_name):
+    ag = ApartmentGraph(uri, user, password, db_name)
+    cypher = ApartmentReasoner(ag)
+    vectorized = ApartmentReasoner(ag, vectorized=True)
+    cypher_results, cypher_seconds = timed(lambda: {method: getattr(cypher, method)() for method in METHODS})
+    engine_results, engine_seconds = timed(lambda: {method: getattr(vectorized, method)() for method in METHODS})
+    for method in METHODS:
+        expected, actual = cypher_results[method], engine_results[method]
+        if method in ("find_expensive_apartments", "find_overcrowded_districts"):
+            expected = sorted(expected, key=repr)
+            actual = sorted(actual, key=repr)
+        print(f"{method}: {'identical' if same_results(expected, actual) else 'DIFFERENT'}")
+    print(f"cypher: {cypher_seconds:.3f}s, engine including snapshot: {engine_seconds:.3f}s "
+          f"({cypher_seconds / engine_seconds:.1f}x)")
+    ag.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the vectorized analytics engine with per-row evaluation")
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--uri", help="also compare against the Cypher queries of a live database")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--db-name", default="neo4j")
+    args = parser.parse_args()
+
+    offline_benchmark(args.source, args.scale)
+    if args.uri:
+        server_benchmark(args.uri, args.user, args.password, args.db_name)
+
+
+if __name__ == "__main__":
+    main()
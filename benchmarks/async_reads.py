@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import sys
+
+from knowledge_graph_creation.async_neo4j_backend import ASYNC_READS, AsyncNeo4jBackend
+from knowledge_graph_creation.neo4j_backend import Neo4jBackend
+
+
+class FakeRecord:
+
+    def __init__(self, data):
+        self.values = data
+
+    def data(self):
+        return self.values
+
+
+# Drivers that record every query run on their sessions and answer it with one fixed record, no server needed
+class FakeResult:
+
+    def __init__(self, records):
+        self.records = records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        for record in self.records:
+            yield record
+
+    def consume(self):
+        return None
+
+
+class FakeAsyncResult(FakeResult):
+
+    async def consume(self):
+        return None
+
+
+class FakeSession:
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def run(self, query, parameters):
+        self.driver.queries.append((query, parameters))
+        return FakeResult([FakeRecord({"query": len(self.driver.queries)})])
+
+
+class FakeAsyncSession(FakeSession):
+
+    async def run(self, query, parameters):
+        self.driver.queries.append((query, parameters))
+        return FakeAsyncResult([FakeRecord({"query": len(self.driver.queries)})])
+
+
+class FakeDriver:
+
+    def __init__(self, session=FakeSession):
+        self.queries = []
+        self.session_class = session
+
+    def session(self, **options):
+        return self.session_class(self)
+
+    def close(self):
+        pass
+
+
+class FakeAsyncDriver(FakeDriver):
+
+    def __init__(self):
+        super().__init__(FakeAsyncSession)
+
+    async def close(self):
+        pass
+
+
+# Awaits every read of ASYNC_READS on an AsyncNeo4jBackend over a fake driver and compares the query and the
+# parameters it ran with the ones of the same method of Neo4jBackend. Returns the names that differ or failed.
+async def check_async_reads(db_name="neo4j"):
+    backend = Neo4jBackend(db_name=db_name)
+    backend.driver.close()
+    backend.driver = FakeDriver()
+    async_backend = AsyncNeo4jBackend(db_name=db_name)
+    await async_backend.driver.close()
+    async_backend.driver = FakeAsyncDriver()
+    failed = []
+    for name in ASYNC_READS:
+        try:
+            result = await getattr(async_backend, name)()
+        except Exception as e:
+            print(f"{name:<32} failed: {e!r}")
+            failed.append(name)
+            continue
+        getattr(backend, name)()
+        expected = [{"query": len(async_backend.driver.queries)}]
+        same = result == expected and async_backend.driver.queries[-1] == backend.driver.queries[-1]
+        print(f"{name:<32} {'ok' if same else 'differs from Neo4jBackend'}")
+        if not same:
+            failed.append(name)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Await every async analytics read against a fake driver")
+    parser.add_argument("--db-name", default="neo4j")
+    args = parser.parse_args()
+    failed = asyncio.run(check_async_reads(args.db_name))
+    print(f"{len(ASYNC_READS) - len(failed)} of {len(ASYNC_READS)} async reads ok")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
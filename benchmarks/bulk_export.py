@@ -0,0 +1,102 @@
+import argparse
+import math
+import os
+import tempfile
+import time
+
+from apartment_reasoner import ApartmentReasoner, price_ranges
+from knowledge_graph_creation.aggregates import AGGREGATE_PROPERTIES
+from knowledge_graph_creation.apartment_graph import ApartmentGraph
+from knowledge_graph_creation.bulk_export import RELATIONSHIP_TYPES, read_export
+from knowledge_graph_creation.listings_io import write_listings
+
+
+# The graph of a MemoryBackend in the form of bulk_export.read_export, with the District and Owner aggregates
+# as node properties like the Neo4j import sets them
+def memory_graph(backend):
+    graph = {"nodes": {}, "relationships": {}}
+    for label, table in backend.nodes.items():
+        keys = [str(key) for key in table.column(table.key)]
+        nodes = graph["nodes"][label] = {key: table.node(row) for row, key in enumerate(keys)}
+        if label in backend.aggregates:
+            values = backend.aggregates[label].values
+            for row, key in enumerate(keys):
+                if row < values.shape[1] and values[0, row] > 0:
+                    nodes[key].update({name: values[index, row] for index, name in enumerate(AGGREGATE_PROPERTIES)})
+    for relation in RELATIONSHIP_TYPES:
+        edges = backend.edges[relation]
+        sources = edges.source.column(edges.source.key)
+        targets = edges.target.column(edges.target.key)
+        graph["relationships"][relation] = {(str(sources[source]), str(targets[target]))
+                                            for source, target in zip(*edges.arrays())}
+    return graph
+
+
+def same_value(first, second):
+    if isinstance(first, float) or isinstance(second, float):
+        return math.isclose(first, second, rel_tol=1e-12)
+    return first == second
+
+
+# Differences between two graphs in read_export form, at most limit per label or relationship type
+def differences(expected, exported, limit=5):
+    found = []
+    for label, nodes in expected["nodes"].items():
+        other = exported["nodes"].get(label, {})
+        if nodes.keys() != other.keys():
+            found.append(f"{label}: {len(nodes.keys() - other.keys())} missing, "
+                         f"{len(other.keys() - nodes.keys())} extra nodes")
+        mismatched = [key for key in nodes.keys() & other.keys()
+                      if {name: value for name, value in other[key].items() if name != "location"}.keys()
+                      != nodes[key].keys()
+                      or not all(same_value(value, other[key][name]) for name, value in nodes[key].items())]
+        found += [f"{label} {key}: {nodes[key]} != {other[key]}" for key in mismatched[:limit]]
+    for relation, edges in expected["relationships"].items():
+        other = exported["relationships"].get(relation, set())
+        if edges != other:
+            found.append(f"{relation}: {len(edges - other)} missing, {len(other - edges)} extra relationships")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the neo4j-admin CSV export against the in-process import "
+                                                 "and check that both build the same graph")
+    parser.add_argument("source", nargs="?", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1], help="sizes as multiples of the sample, "
+                                                                          "with synthetic listings beyond 1")
+    parser.add_argument("--radius", type=float, help="neighbor radius in meters, same coordinates if not set")
+    parser.add_argument("--no-neighbors", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'listings':>10} {'export s':>9} {'import s':>9} {'CSV MB':>8} {'differences':>12}")
+    for scale in args.scale:
+        with tempfile.TemporaryDirectory() as directory:
+            source = args.source
+            if scale > 1:
+                from benchmarks.synthetic import ListingModel
+                source = os.path.join(directory, "listings.jsonl")
+                write_listings(source, ListingModel.from_sample(args.source).listings(scale * 10000))
+            export_directory = os.path.join(directory, "import")
+            ag = ApartmentGraph(backend="memory")
+            start = time.perf_counter()
+            result = ag.export_bulk_csv(source, export_directory, price_ranges, not args.no_neighbors, args.radius)
+            exported = time.perf_counter() - start
+
+            start = time.perf_counter()
+            ag.import_json(source, bulk=True)
+            reasoner = ApartmentReasoner(ag)
+            reasoner.add_price_ranges()
+            if not args.no_neighbors:
+                reasoner.add_neighbors(args.radius)
+            imported = time.perf_counter() - start
+
+            found = differences(memory_graph(ag.backend), read_export(export_directory))
+            for difference in found:
+                print(f"\t{difference}")
+            size = sum(os.path.getsize(os.path.join(export_directory, name)) for name in os.listdir(export_directory))
+            print(f"{result['listings']:>10} {exported:>9.2f} {imported:>9.2f} {size / 1024 ** 2:>8.1f} "
+                  f"{len(found):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import tempfile
+import time
+import numpy as np
+
+from gnn.embedding_index import EmbeddingIndex
+
+
+# Clustered random vectors, roughly shaped like GraphSAGE embeddings of apartments in a few hundred areas
+def synthetic_embeddings(size, dimension, clusters=200, seed=420):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    return (centers[rng.integers(0, clusters, size)] + 0.3 * rng.normal(size=(size, dimension))).astype(np.float32)
+
+
+def recall(expected, found):
+    hits = [len({key for key, _ in a} & {key for key, _ in b}) / max(len(a), 1) for a, b in zip(expected, found)]
+    return float(np.mean(hits))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Top-k lookup latency of the sage_embeddings index backends")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    vectors = synthetic_embeddings(args.size, args.dimension)
+    keys = [str(i) for i in range(args.size)]
+    queries = keys[:args.queries]
+    exact = None
+    print(f"{'backend':>12} {'build s':>8} {'single ms':>10} {'batch ms/q':>11} {'mmap single ms':>15} {'recall':>7}")
+    for backend in ["brute_force", "ivf"]:
+        start = time.perf_counter()
+        index = EmbeddingIndex(keys, vectors, backend)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key in queries[:100]:
+            index.similar([key], args.k)
+        single = (time.perf_counter() - start) / 100 * 1000
+
+        start = time.perf_counter()
+        found = index.similar(queries, args.k)
+        batch = (time.perf_counter() - start) / len(queries) * 1000
+        exact = exact or found
+
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            mapped = EmbeddingIndex.load(directory)
+            start = time.perf_counter()
+            for key in queries[:100]:
+                mapped.similar([key], args.k)
+            mapped_single = (time.perf_counter() - start) / 100 * 1000
+            del mapped
+
+        print(f"{backend:>12} {build:>8.2f} {single:>10.2f} {batch:>11.3f} {mapped_single:>15.2f} "
+              f"{recall(exact, found):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
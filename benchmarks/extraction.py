@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from knowledge_graph_creation.extractor import expand, extract
+from knowledge_graph_creation.listings_io import iter_listings
+
+PAGE_SIZE = 90
+
+
+# Turns the extracted sample back into crawler pages of 90 adverts with willhaben's coordinates attribute
+def write_pages(source, directory, pages):
+    adverts = []
+    for listing in iter_listings(source):
+        advert = {key: value for key, value in listing.items() if key not in ("lat", "lon")}
+        advert["coordinates"] = f"{listing['lat']},{listing['lon']}"
+        advert["description"] = "x" * 500
+        adverts.append(advert)
+    for page in range(pages):
+        start = (page * PAGE_SIZE) % len(adverts)
+        page_adverts = [dict(advert, id=f"{advert['id']}-{page // (len(adverts) // PAGE_SIZE + 1)}")
+                        for advert in adverts[start:start + PAGE_SIZE]]
+        with open(os.path.join(directory, f"{page + 1}.json"), 'w', encoding='utf-8') as file:
+            json.dump(page_adverts, file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling of the extractor over worker processes")
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_pages(args.source, directory, args.pages)
+        file_paths = expand([os.path.join(directory, "*.json")])
+        print(f"{'workers':>7} {'adverts':>8} {'seconds':>8} {'adverts/s':>10} {'speedup':>8}")
+        baseline = None
+        for workers in dict.fromkeys(args.workers):
+            start = time.perf_counter()
+            count = sum(1 for _ in extract(file_paths, workers))
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{workers:>7} {count:>8} {elapsed:>8.2f} {count / elapsed:>10.0f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from knowledge_graph_creation.listings_io import iter_listings, write_listings
+
+MODES = ["json.load", "stream"]
+
+
+def consume(mode, path):
+    count = 0
+    if mode == "json.load":
+        with open(path, 'r', encoding='utf-8') as file:
+            for _ in json.load(file):
+                count += 1
+    else:
+        for _ in iter_listings(path):
+            count += 1
+    return count
+
+
+# Runs one mode in the current process and reports its own peak RSS, used as the child of run_mode
+def worker(mode, path):
+    start = time.perf_counter()
+    count = consume(mode, path)
+    elapsed = time.perf_counter() - start
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "listings": count, "seconds": elapsed, "max_rss_kb": max_rss_kb}))
+
+
+# Every mode runs in a fresh interpreter, otherwise the peak RSS of one mode would leak into the next
+def run_mode(mode, path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-m", "benchmarks.json_ingestion", "--worker", mode, path],
+                            cwd=root, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Repeats the listings of the source file until the requested size is reached
+def scaled_listings(source, scale):
+    for i in range(scale):
+        for listing in iter_listings(source):
+            if i:
+                listing = dict(listing, id=f"{listing.get('id')}-{i}")
+            yield listing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak RSS and throughput of json.load and streaming ingestion")
+    parser.add_argument("source", nargs="?", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--worker", choices=MODES)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.source)
+        return
+
+    print(f"{'listings':>10} {'format':>6} {'mode':>10} {'seconds':>8} {'listings/s':>11} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scale:
+            for extension in ["json", "jsonl"]:
+                path = os.path.join(directory, f"listings_{scale}.{extension}")
+                write_listings(path, scaled_listings(args.source, scale))
+                for mode in MODES:
+                    if mode == "json.load" and extension == "jsonl":
+                        continue
+                    result = run_mode(mode, path)
+                    rate = result["listings"] / result["seconds"] if result["seconds"] > 0 else 0.0
+                    print(f"{result['listings']:>10} {extension:>6} {mode:>10} {result['seconds']:>8.2f} "
+                          f"{rate:>11.0f} {result['max_rss_kb'] / 1024:>12.1f}")
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
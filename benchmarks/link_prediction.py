@@ -0,0 +1,54 @@
+import argparse
+import tempfile
+import time
+from pykeen.models import RotatE
+from pykeen.predict import predict_target
+
+from apartment_reasoner import ApartmentReasoner
+from embedding.dataset_cache import DatasetCache
+from embedding.prediction import BatchPredictor
+from knowledge_graph_creation.apartment_graph import ApartmentGraph
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+# Throughput of predicting the district of many apartments with predict_target per pair and with the
+# BatchPredictor. An untrained RotatE model of the sample graph is enough, scoring costs the same.
+def main():
+    parser = argparse.ArgumentParser(description="Per-call predict_target against batched link prediction")
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--pairs", type=int, default=2000)
+    parser.add_argument("--relation", default="LOCATED_IN")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    ag = ApartmentGraph(backend="memory")
+    ag.import_json(args.source, bulk=True)
+    ApartmentReasoner(ag).add_price_ranges()
+    with tempfile.TemporaryDirectory() as directory:
+        triples_factory = DatasetCache(directory).load(ag).triples_factories()[0]
+    model = RotatE(triples_factory=triples_factory, embedding_dim=50, random_seed=42)
+    heads = [str(apartment_id) for apartment_id in ag.backend.nodes["Apartment"].column("id")[:args.pairs]]
+    pairs = [(head, args.relation) for head in heads]
+
+    per_call, loop_seconds = timed(lambda: [
+        predict_target(model, head=head, relation=relation, triples_factory=triples_factory).df
+        .nlargest(args.k, "score")["tail_label"].tolist() for head, relation in pairs])
+    predictor = BatchPredictor(model, triples_factory)
+    batch, batch_seconds = timed(lambda: predictor.predict(pairs, args.k, restrict=False))
+    _, cached_seconds = timed(lambda: predictor.predict(pairs, args.k, restrict=False))
+    _, restricted_seconds = timed(lambda: BatchPredictor(model, triples_factory).predict(pairs, args.k))
+    assert per_call == [list(group) for _, group in batch.groupby("head", sort=False)["tail"]]
+
+    print(f"{'mode':>24} {'seconds':>8} {'pairs/s':>10}")
+    for mode, seconds in [("predict_target loop", loop_seconds), ("batch, all entities", batch_seconds),
+                          ("batch, cached", cached_seconds), ("batch, relation targets", restricted_seconds)]:
+        print(f"{mode:>24} {seconds:>8.3f} {len(pairs) / seconds:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
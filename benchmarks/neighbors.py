@@ -0,0 +1,104 @@
+import argparse
+import random
+import time
+
+from knowledge_graph_creation.listings_io import iter_listings
+from knowledge_graph_creation.spatial_index import haversine, neighbor_pairs
+
+LEGACY_QUERY = '''
+                USE {db_name}
+                MATCH (a1:Apartment), (a2:Apartment)
+                WHERE a1 <> a2 AND a1.lon = a2.lon AND a1.lat = a2.lat
+                MERGE (a1)-[:NEIGHBOR_OF]->(a2)'''
+
+
+# Pairwise scan with the same semantics as the legacy cartesian Cypher query
+def naive_pairs(points, radius=None):
+    for first_id, first_lon, first_lat in points:
+        for second_id, second_lon, second_lat in points:
+            if first_id == second_id:
+                continue
+            if radius:
+                if haversine(first_lon, first_lat, second_lon, second_lat) <= radius:
+                    yield first_id, second_id
+            elif first_lon == second_lon and first_lat == second_lat:
+                yield first_id, second_id
+
+
+# Coordinates of the sample dump, repeated with a few meters of jitter to reach the requested size
+def sample_points(source, size, seed=420):
+    rng = random.Random(seed)
+    coordinates = [(float(listing["lon"]), float(listing["lat"])) for listing in iter_listings(source)
+                   if "lon" in listing and "lat" in listing]
+    points = []
+    for i in range(size):
+        lon, lat = coordinates[i % len(coordinates)]
+        if i >= len(coordinates):
+            lon += rng.uniform(-5e-5, 5e-5)
+            lat += rng.uniform(-5e-5, 5e-5)
+        points.append((str(i), lon, lat))
+    return points
+
+
+def timed(pairs):
+    start = time.perf_counter()
+    count = sum(1 for _ in pairs)
+    return count, time.perf_counter() - start
+
+
+def client_benchmark(source, sizes, radius, naive_max):
+    print(f"{'apartments':>10} {'radius':>7} {'pairs':>10} {'naive s':>9} {'grid s':>9} {'speedup':>8}")
+    for size in sizes:
+        points = sample_points(source, size)
+        count, grid_seconds = timed(neighbor_pairs(points, radius))
+        if size <= naive_max:
+            naive_count, naive_seconds = timed(naive_pairs(points, radius))
+            assert naive_count == count
+            speedup = f"{naive_seconds / grid_seconds:>7.1f}x"
+            naive_seconds = f"{naive_seconds:>9.3f}"
+        else:
+            naive_seconds, speedup = f"{'-':>9}", f"{'-':>8}"
+        print(f"{size:>10} {radius or 0:>7} {count:>10} {naive_seconds} {grid_seconds:>9.3f} {speedup}")
+
+
+# Times the legacy query against ApartmentReasoner.add_neighbors on an imported database
+def server_benchmark(uri, user, password, db_name, radius):
+    from apartment_reasoner import ApartmentReasoner
+    from knowledge_graph_creation.apartment_graph import ApartmentGraph
+
+    ag = ApartmentGraph(uri, user, password, db_name)
+    ar = ApartmentReasoner(ag)
+    clear = f"USE {db_name} MATCH ()-[r:NEIGHBOR_OF]->() DELETE r"
+    with ag.driver.session() as session:
+        ag.queries.run(session, "neighbors.clear", clear)
+        start = time.perf_counter()
+        ag.queries.run(session, "neighbors.legacy", LEGACY_QUERY.format(db_name=db_name))
+        legacy_seconds = time.perf_counter() - start
+        ag.queries.run(session, "neighbors.clear", clear)
+    start = time.perf_counter()
+    count = ar.add_neighbors(radius=radius)
+    index_seconds = time.perf_counter() - start
+    print(f"legacy query: {legacy_seconds:.3f}s, spatial index: {index_seconds:.3f}s "
+          f"({count} edges, {legacy_seconds / index_seconds:.1f}x)")
+    ag.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the spatial index neighbor builder with a pairwise scan")
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 100000])
+    parser.add_argument("--radius", type=float, default=None)
+    parser.add_argument("--naive-max", type=int, default=5000)
+    parser.add_argument("--uri", help="also time the legacy Cypher query against a live database")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--db-name", default="neo4j")
+    args = parser.parse_args()
+
+    client_benchmark(args.source, args.sizes, args.radius, args.naive_max)
+    if args.uri:
+        server_benchmark(args.uri, args.user, args.password, args.db_name, args.radius)
+
+
+if __name__ == "__main__":
+    main()
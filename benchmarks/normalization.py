@@ -0,0 +1,76 @@
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.synthetic import ListingModel
+from knowledge_graph_creation.apartment_graph import vienna_districts
+from knowledge_graph_creation.normalization import RejectionReport, iter_normalized
+
+MODES = ["per_dict", "columnar"]
+
+
+# The normalization the importer did before normalization.py, one listing dict at a time, for comparison.
+# It keeps the rows it accepts as dicts, the way delta_import_json collected them.
+def normalize_per_dict(listings, postal_codes):
+    rows = {}
+    for apartment in listings:
+        if type(apartment.get("location_quality")) != int:
+            continue
+        if type(apartment.get("price")) not in (int, float) or type(apartment.get("floor")) not in (int, float):
+            continue
+        if "estate_size" not in apartment or "number_of_rooms" not in apartment:
+            continue
+        if apartment["postcode"] not in postal_codes or apartment["id"] in rows:
+            continue
+        rows[apartment["id"]] = {
+            "apartment_id": apartment["id"], "owner_name": apartment.get("orgname"),
+            "postal_code": apartment["postcode"], "price": int(apartment["price"]), "floor": int(apartment["floor"]),
+            "lon": float(apartment["lon"]) if "lon" in apartment else None,
+            "lat": float(apartment["lat"]) if "lat" in apartment else None,
+            "quality": apartment["location_quality"], "size": apartment["estate_size"],
+            "number_of_rooms": apartment["number_of_rooms"]}
+    return list(rows.values())
+
+
+def normalize_columnar(listings, postal_codes):
+    return list(iter_normalized(listings, postal_codes, RejectionReport()))
+
+
+# Normalizes the listings with mode and returns the accepted rows, the seconds it took and the MB still allocated
+# for the result when it is done
+def run(mode, listings, postal_codes):
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "per_dict":
+        result = normalize_per_dict(listings, postal_codes)
+        accepted = len(result)
+    else:
+        result = normalize_columnar(listings, postal_codes)
+        accepted = sum(len(columns) for columns in result)
+    elapsed = time.perf_counter() - start
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return accepted, elapsed, retained / 1024 ** 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per listing and the columnar normalization of listings")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json",
+                        help="sample the synthetic listings are drawn from")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    model = ListingModel.from_sample(args.source)
+    postal_codes = {district["postal_code"] for district in vienna_districts}
+    print(f"{'listings':>10} {'mode':>9} {'accepted':>9} {'seconds':>8} {'us/listing':>11} {'result MB':>10}")
+    for size in args.sizes:
+        listings = list(model.listings(size, args.seed))
+        for mode in MODES:
+            accepted, elapsed, megabytes = run(mode, listings, postal_codes)
+            print(f"{size:>10} {mode:>9} {accepted:>9} {elapsed:>8.2f} {elapsed / size * 1e6:>11.2f} "
+                  f"{megabytes:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+
+from apartment_reasoner import ApartmentReasoner
+from benchmarks.synthetic import ListingModel, write_pages
+from knowledge_graph_creation.apartment_graph import ApartmentGraph
+from knowledge_graph_creation.extractor import expand, extract
+from knowledge_graph_creation.listings_io import write_listings
+from knowledge_graph_creation.query_recorder import QueryRecorder
+from knowledge_graph_creation.triple_export import EMBEDDING_RELATIONS
+
+STAGES = ["extraction", "import", "add_neighbors", "add_price_ranges", "analytics", "triple_export",
+          "embedding_training"]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ru_maxrss is the peak of the whole process and only ever grows. On Linux writing 5 to /proc/self/clear_refs resets
+# it to the current resident memory, so a stage gets its own peak; elsewhere only the growth of the process peak over
+# the stage is known.
+class StageMemory:
+
+    def __init__(self):
+        try:
+            with open("/proc/self/clear_refs", 'w') as file:
+                file.write("5")
+            self.resettable = True
+        except OSError:
+            self.resettable = False
+        self.start_rss = max_rss_mb()
+
+    def as_dict(self):
+        rss = max_rss_mb()
+        return {"peak_rss_mb": rss if self.resettable else None, "rss_growth_mb": rss - self.start_rss}
+
+
+# Runs the stages in pipeline order over size synthetic listings, every stage function returns the number of
+# items it processed. A stage whose dependencies are not installed, e.g. pykeen for the embedding training,
+# is recorded as skipped.
+class PipelineBenchmark:
+
+    def __init__(self, args, model, directory):
+        self.args = args
+        self.model = model
+        self.directory = directory
+        self.apartment_graph = None
+        self.reasoner = None
+        self.listings_path = None
+        self.queries = QueryRecorder(profile=args.profile)
+
+    def graph(self):
+        if self.args.uri:
+            ag = ApartmentGraph(self.args.uri, self.args.user, self.args.password, self.args.db_name,
+                                queries=self.queries)
+            ag.clear_db()
+            return ag
+        return ApartmentGraph(backend="memory")
+
+    def generate(self, size):
+        self.listings_path = os.path.join(self.directory, "listings.jsonl")
+        return write_listings(self.listings_path, self.model.listings(size, self.args.seed))
+
+    # Writes the generated listings as crawler pages first, untimed, and times the extractor on them.
+    # The stages after it import the extracted file.
+    def extraction(self, size):
+        pages = os.path.join(self.directory, "pages")
+        os.makedirs(pages, exist_ok=True)
+        write_pages(self.model.listings(size, self.args.seed), pages)
+        start = time.perf_counter()
+        extracted = os.path.join(self.directory, "extracted.jsonl")
+        count = write_listings(extracted, extract(expand([os.path.join(pages, "*.json")]), self.args.workers))
+        self.listings_path = extracted
+        return count, time.perf_counter() - start
+
+    def run_import(self):
+        self.apartment_graph = self.graph()
+        self.reasoner = ApartmentReasoner(self.apartment_graph)
+        return self.apartment_graph.import_json(self.listings_path, bulk=True,
+                                                batch_size=self.args.batch_size)["imported"]
+
+    def analytics(self):
+        results = [self.reasoner.find_average_price_of_apartments_each_district(),
+                   self.reasoner.find_district_with_most_apartments(),
+                   self.reasoner.find_expensive_apartments(),
+                   self.reasoner.find_overcrowded_districts(),
+                   self.reasoner.find_owner_with_most_apartments()]
+        return sum(len(result) for result in results)
+
+    def triple_export(self):
+        triples = self.apartment_graph.backend.read_triples(EMBEDDING_RELATIONS)
+        triples.save(os.path.join(self.directory, "triples.parquet"))
+        return len(triples)
+
+    def embedding_training(self):
+        from embedding.dataset_cache import DatasetCache
+        from embedding.training import train_model
+
+        dataset = DatasetCache(os.path.join(self.directory, "embedding_cache")).load(self.apartment_graph,
+                                                                                   refresh=True)
+        train_model('Rotate', dataset, num_epochs=self.args.epochs, batch_size=self.args.embedding_batch_size,
+                    checkpoint_directory=os.path.join(self.directory, "checkpoints"))
+        return len(dataset.mapped_triples)
+
+    def stage(self, name):
+        if name == "import":
+            return self.run_import()
+        if name == "add_neighbors":
+            return self.reasoner.add_neighbors()
+        if name == "add_price_ranges":
+            return self.reasoner.add_price_ranges()
+        return getattr(self, name)()
+
+    def run(self, size, stages):
+        records = []
+
+        def record(stage, seconds, items, memory, status="ok"):
+            records.append(dict({"size": size, "stage": stage, "status": status, "seconds": seconds, "items": items,
+                                 "items_per_second": items / seconds if seconds and items else None},
+                                **memory.as_dict()))
+            print(f"{size:>9} {stage:<20} {status:<8} {seconds or 0:>9.2f} {items or 0:>10}")
+
+        memory = StageMemory()
+        start = time.perf_counter()
+        count = self.generate(size)
+        record("generate", time.perf_counter() - start, count, memory)
+        for name in stages:
+            if name == "extraction":
+                memory = StageMemory()
+                count, seconds = self.extraction(size)
+                record(name, seconds, count, memory)
+                continue
+            if self.apartment_graph is None and name != "import":
+                self.run_import()
+            memory = StageMemory()
+            start = time.perf_counter()
+            try:
+                count = self.stage(name)
+            except ImportError as error:
+                record(name, None, None, memory, f"skipped ({error.name})")
+                continue
+            record(name, time.perf_counter() - start, count, memory)
+        if self.apartment_graph is not None:
+            self.apartment_graph.close()
+        if self.args.uri:
+            self.queries.report(top=15)
+            if self.args.metrics:
+                self.queries.write_prometheus(self.args.metrics)
+        return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times every stage of the pipeline on synthetic Vienna listings")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--output", default="benchmark_results.jsonl", help="JSON Lines file the results are "
+                                                                            "appended to")
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json",
+                        help="sample the distributions are taken from")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="extractor processes")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--embedding-batch-size", type=int, default=1024)
+    parser.add_argument("--uri", help="run against this Neo4j database instead of the memory backend, "
+                                      "it is cleared first")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--db-name", default="neo4j")
+    parser.add_argument("--profile", action="store_true", help="run the Cypher queries as PROFILE to count db hits")
+    parser.add_argument("--metrics", help="Prometheus text file for the per query metrics of a Neo4j run")
+    args = parser.parse_args()
+
+    model = ListingModel.from_sample(args.source)
+    run = {"run": datetime.datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+           "backend": "neo4j" if args.uri else "memory", "python": platform.python_version(),
+           "cpus": os.cpu_count()}
+    stages = [stage for stage in STAGES if stage in args.stages]
+    print(f"{'size':>9} {'stage':<20} {'status':<8} {'seconds':>9} {'items':>10}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            records = PipelineBenchmark(args, model, directory).run(size, stages)
+        with open(args.output, 'a', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(dict(run, **record)) + "\n")
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
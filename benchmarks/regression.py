@@ -0,0 +1,64 @@
+import argparse
+import os
+import tempfile
+import time
+
+from apartment_reasoner import ApartmentReasoner
+from benchmarks.json_ingestion import scaled_listings
+from gnn.local_regression import LocalRegressionModel
+from knowledge_graph_creation.apartment_graph import ApartmentGraph
+from knowledge_graph_creation.listings_io import write_listings
+
+
+def local_benchmark(source, scales):
+    print(f"{'apartments':>10} {'export s':>9} {'fastRP s':>9} {'ridge cv s':>11} {'total s':>8} {'test RMSE':>12}")
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "listings.jsonl")
+            write_listings(path, scaled_listings(source, scale))
+            ag = ApartmentGraph(backend="memory")
+            ag.import_json(path, bulk=True)
+        ApartmentReasoner(ag).add_neighbors()
+        model = LocalRegressionModel(ag)
+        start = time.perf_counter()
+        model.train()
+        total = time.perf_counter() - start
+        print(f"{len(ag.backend.nodes['Apartment']):>10} {model.timings['export']:>9.3f} "
+              f"{model.timings['fast_rp']:>9.3f} {model.timings['regression']:>11.3f} {total:>8.3f} "
+              f"{model.metrics['ROOT_MEAN_SQUARED_ERROR']:>12.0f}")
+
+
+# Trains the GDS pipeline and the local model on the same imported database
+def server_benchmark(uri, user, password, db_name):
+    from gnn.regression_model import NodeRegressionModel
+
+    start = time.perf_counter()
+    NodeRegressionModel(uri, user, password, db_name).train()
+    gds_seconds = time.perf_counter() - start
+
+    ag = ApartmentGraph(uri, user, password, db_name)
+    model = LocalRegressionModel(ag)
+    start = time.perf_counter()
+    model.train()
+    local_seconds = time.perf_counter() - start
+    ag.close()
+    print(f"GDS pipeline: {gds_seconds:.1f}s, local: {local_seconds:.1f}s ({gds_seconds / local_seconds:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline FastRP + ridge price regression, optionally against GDS")
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--uri", help="also train the GDS pipeline of a live database")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--db-name", default="neo4j")
+    args = parser.parse_args()
+
+    local_benchmark(args.source, args.scale)
+    if args.uri:
+        server_benchmark(args.uri, args.user, args.password, args.db_name)
+
+
+if __name__ == "__main__":
+    main()
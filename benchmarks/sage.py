@@ -0,0 +1,88 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+from apartment_reasoner import ApartmentReasoner
+from benchmarks.json_ingestion import scaled_listings
+from gnn.local_sage import LABELS, LocalSageModel, embedding_quality
+from knowledge_graph_creation.apartment_graph import ApartmentGraph
+from knowledge_graph_creation.listings_io import write_listings
+
+HEADER = f"{'nodes':>8} {'model':>12} {'workers':>8} {'export s':>9} {'train s':>8} {'s/epoch':>8} {'embed s':>8} " \
+         f"{'link AUC':>9} {'price RMSE':>11}"
+
+
+def report(nodes, name, workers, timings, epochs, quality):
+    train = timings.get("train", 0.0)
+    print(f"{nodes:>8} {name:>12} {workers:>8} {timings.get('export', 0.0):>9.2f} {train:>8.2f} "
+          f"{train / epochs:>8.2f} {timings.get('embed', 0.0):>8.2f} {quality['link_auc']:>9.3f} "
+          f"{quality['price_rmse']:>11.3f}")
+
+
+def train_local(ag, directory, epochs, workers):
+    model = LocalSageModel(ag, directory=directory, epochs=epochs, workers=workers)
+    model.train()
+    return model, embedding_quality(model.graph, model.embeddings)
+
+
+def local_benchmark(source, scales, epochs, workers):
+    print(HEADER)
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "listings.jsonl")
+            write_listings(path, scaled_listings(source, scale))
+            ag = ApartmentGraph(backend="memory")
+            ag.import_json(path, bulk=True)
+            ApartmentReasoner(ag).add_neighbors()
+            for count in workers:
+                model, quality = train_local(ag, os.path.join(directory, "graph"), epochs, count)
+                report(len(model.graph), "local", count, model.timings, epochs, quality)
+
+
+# Trains SageModel in the GDS server and the local model on the same database and rates both embeddings on the
+# exported graph of the local model. The GDS embeddings are read back from the sage_embeddings properties.
+def server_benchmark(uri, user, password, db_name, epochs, workers):
+    from gnn.sage_model import SageModel
+
+    sage = SageModel(uri, user, password, db_name)
+    start = time.perf_counter()
+    sage.train()
+    gds_seconds = time.perf_counter() - start
+
+    ag = ApartmentGraph(uri, user, password, db_name)
+    with tempfile.TemporaryDirectory() as directory:
+        model, quality = train_local(ag, os.path.join(directory, "graph"), epochs, workers)
+        vectors = np.zeros((len(model.graph), 64), dtype=np.float32)
+        for label in LABELS:
+            index = sage.get_index(label)
+            first, _ = model.graph.labels[label]
+            for row, key in enumerate(model.graph.keys[label]):
+                if key in index.positions:
+                    vectors[first + row] = index.vectors[index.positions[key]]
+        print(HEADER)
+        report(len(model.graph), "gds", "-", {"train": gds_seconds}, 100, embedding_quality(model.graph, vectors))
+        report(len(model.graph), "local", workers, model.timings, epochs, quality)
+    ag.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local GraphSAGE on an exported CSR graph, optionally against GDS")
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--uri", help="also train SageModel in the GDS server of a live, enriched database")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--db-name", default="neo4j")
+    args = parser.parse_args()
+
+    local_benchmark(args.source, args.scale, args.epochs, args.workers)
+    if args.uri:
+        server_benchmark(args.uri, args.user, args.password, args.db_name, args.epochs, max(args.workers))
+
+
+if __name__ == "__main__":
+    main()
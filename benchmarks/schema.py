@@ -0,0 +1,68 @@
+import argparse
+import os
+import tempfile
+import time
+
+from apartment_reasoner import ApartmentReasoner
+from benchmarks.json_ingestion import scaled_listings
+from knowledge_graph_creation.apartment_graph import ApartmentGraph
+from knowledge_graph_creation.listings_io import write_listings
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+# Imports into an empty database with or without the constraints and indexes, then imports the same listings
+# again, which only MERGEs into existing nodes, and times the reasoner on the result
+def run(args, path, schema):
+    ag = ApartmentGraph(args.uri, args.user, args.password, args.db_name, schema=schema)
+    ag.clear_db()
+    ag.backend.drop_schema()
+    reasoner = ApartmentReasoner(ag)
+    timings = {
+        "import": timed(ag.import_json, path, bulk=True, batch_size=args.batch_size),
+        "reimport": timed(ag.import_json, path, bulk=True, batch_size=args.batch_size),
+        "neighbors": timed(reasoner.add_neighbors),
+        "price ranges": timed(reasoner.add_price_ranges),
+    }
+    ids = ag.backend.read_prices()[0][:args.sample]
+    timings["derived edges"] = timed(reasoner.update_derived_edges, ids)
+    timings["analytics"] = sum(timed(query) for query in [reasoner.find_average_price_of_apartments_each_district,
+                                                           reasoner.find_district_with_most_apartments,
+                                                           reasoner.find_expensive_apartments,
+                                                           reasoner.find_overcrowded_districts,
+                                                           reasoner.find_owner_with_most_apartments])
+    report = reasoner.index_usage(ids[:1]) if schema else None
+    ag.close()
+    return timings, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import and reasoner query times with and without the graph schema")
+    parser.add_argument("--uri", required=True)
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--db-name", default="neo4j")
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--sample", type=int, default=1000, help="apartments for update_derived_edges")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "listings.jsonl")
+        write_listings(path, scaled_listings(args.source, args.scale))
+        without, _ = run(args, path, schema=False)
+        with_schema, _ = run(args, path, schema=True)
+
+    print(f"{'step':<14} {'no schema s':>12} {'schema s':>9} {'speedup':>8}")
+    for step in without:
+        print(f"{step:<14} {without[step]:>12.2f} {with_schema[step]:>9.2f} "
+              f"{without[step] / with_schema[step] if with_schema[step] > 0 else 0.0:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import numpy as np
+
+from knowledge_graph_creation.listings_io import iter_listings, write_listings
+
+PAGE_SIZE = 90
+CHUNK_SIZE = 100000
+
+# Standard deviation in degrees, about 150 m, of the apartments around their building cluster
+COORDINATE_JITTER = 0.0015
+
+
+def empirical(values):
+    labels, counts = np.unique(np.array([json.dumps(value) for value in values]), return_counts=True)
+    return [json.loads(label) for label in labels], counts / counts.sum()
+
+
+# Distributions of the real listings the synthetic ones are drawn from: postcode shares, the coordinates of the
+# listings of every postcode as building clusters with the floors given there, owner shares, rooms distribution,
+# log size per number of rooms and a log price ~ postcode + log size regression, plus the rates of missing or textual
+# values
+class ListingModel:
+
+    def __init__(self, listings):
+        listings = list(listings)
+        self.sample_size = len(listings)
+        self.postcodes, self.postcode_weights = empirical([listing["postcode"] for listing in listings])
+        # Coordinates shared by several listings, like the flats of a new building, are kept exact in the synthetic
+        # listings, the ones of a single listing are jittered. Whether the floor is given mostly depends on the
+        # building, so the floor of a synthetic listing is drawn from the sample listings at its coordinates.
+        floors = {}
+        for listing in listings:
+            if "lon" in listing and "lat" in listing:
+                floors.setdefault((float(listing["lon"]), float(listing["lat"])), []).append(listing.get("floor"))
+        self.floors = []
+        self.clusters = {}
+        for postcode in self.postcodes:
+            points, weights = empirical([(float(listing["lon"]), float(listing["lat"])) for listing in listings
+                                         if listing["postcode"] == postcode and "lon" in listing and "lat" in listing])
+            point_floors = [floors[tuple(point)] for point in points]
+            shared = np.array([len(values) > 1 for values in point_floors], dtype=bool)
+            floor_counts = np.array([len(values) for values in point_floors], dtype=np.int64)
+            floor_starts = len(self.floors) + np.cumsum(floor_counts) - floor_counts
+            self.floors += [floor for values in point_floors for floor in values]
+            self.clusters[postcode] = (np.array(points, dtype=np.float64).reshape(-1, 2), weights, shared,
+                                       floor_starts, floor_counts)
+
+        self.owners, self.owner_weights = empirical([listing.get("orgname") for listing in listings])
+        self.rooms, self.room_weights = empirical([listing["number_of_rooms"] for listing in listings])
+        self.location_qualities, self.location_quality_weights = empirical(
+            [listing["location_quality"] for listing in listings])
+        published = [listing["published"] for listing in listings]
+        self.published = (min(published), max(published))
+
+        sized = [listing for listing in listings if isinstance(listing.get("estate_size"), (int, float))
+                 and listing["estate_size"] > 0]
+        self.size_missing_rate = 1 - len(sized) / len(listings)
+        log_sizes = np.log([listing["estate_size"] for listing in sized])
+        rooms = np.array([listing["number_of_rooms"] for listing in sized])
+        self.log_size = {}
+        for room in self.rooms:
+            values = log_sizes[rooms == room] if np.sum(rooms == room) > 1 else log_sizes
+            self.log_size[room] = (values.mean(), values.std())
+
+        priced = [listing for listing in sized if isinstance(listing.get("price"), (int, float))
+                  and listing["price"] >= 1000]
+        prices = [listing.get("price") for listing in listings]
+        self.price_on_request_rate = sum(isinstance(price, str) for price in prices) / len(listings)
+        self.price_missing_rate = sum(price is None for price in prices) / len(listings)
+        self.fractional_price_rate = sum(isinstance(price, float) for price in prices) / len(listings)
+        postcode_rows = {postcode: row for row, postcode in enumerate(self.postcodes)}
+        x = np.zeros((len(priced), len(self.postcodes) + 1))
+        x[np.arange(len(priced)), [postcode_rows[listing["postcode"]] for listing in priced]] = 1
+        x[:, -1] = np.log([listing["estate_size"] for listing in priced])
+        y = np.log([listing["price"] for listing in priced])
+        coefficients = np.linalg.lstsq(x, y, rcond=None)[0]
+        self.log_price_intercepts = coefficients[:-1]
+        self.log_price_slope = coefficients[-1]
+        self.log_price_std = float(np.std(y - x @ coefficients))
+
+    @classmethod
+    def from_sample(cls, path="knowledge_graph_creation/result_for_db.json"):
+        return cls(iter_listings(path))
+
+    # Yields count listings in the schema of result_for_db.json. Every sample_size listings get their own copy of
+    # the owners and buildings, so the number of apartments per owner and per building stays as in the sample.
+    def listings(self, count, seed=42, first_id=900000000):
+        rng = np.random.default_rng(seed)
+        for start in range(0, count, CHUNK_SIZE):
+            yield from self.chunk(rng, start, min(CHUNK_SIZE, count - start), first_id)
+
+    # Every copy of the sample gets its own buildings, the clusters moved by a few hundred meters, so the number of
+    # apartments at the same coordinates, and with it the NEIGHBOR_OF edges per apartment, stays as in the sample
+    def building_offsets(self, postcode, copy, count):
+        if copy == 0:
+            return np.zeros((count, 2))
+        return np.random.default_rng([int(copy), int(postcode)]).normal(0, 2 * COORDINATE_JITTER, (count, 2))
+
+    def chunk(self, rng, start, size, first_id):
+        postcode_rows = rng.choice(len(self.postcodes), size, p=self.postcode_weights)
+        lon = np.empty(size)
+        lat = np.empty(size)
+        floor_rows = np.empty(size, dtype=np.int64)
+        copies = (start + np.arange(size)) // self.sample_size
+        for row, postcode in enumerate(self.postcodes):
+            selected = np.flatnonzero(postcode_rows == row)
+            points, weights, shared, floor_starts, floor_counts = self.clusters[postcode]
+            picked = rng.choice(len(points), len(selected), p=weights)
+            floor_rows[selected] = floor_starts[picked] + (rng.random(len(selected)) * floor_counts[picked]).astype(
+                np.int64)
+            located = points[picked]
+            for copy in np.unique(copies[selected]):
+                in_copy = copies[selected] == copy
+                located[in_copy] += self.building_offsets(postcode, copy, len(points))[picked[in_copy]]
+            located += rng.normal(0, COORDINATE_JITTER, (len(selected), 2)) * ~shared[picked, None]
+            lon[selected] = located[:, 0]
+            lat[selected] = located[:, 1]
+
+        rooms = np.array(self.rooms)[rng.choice(len(self.rooms), size, p=self.room_weights)]
+        size_parameters = np.array([self.log_size[room] for room in rooms])
+        log_sizes = rng.normal(size_parameters[:, 0], size_parameters[:, 1])
+        sizes = np.maximum(np.rint(np.exp(log_sizes)), 10).astype(np.int64)
+        prices = np.exp(self.log_price_intercepts[postcode_rows] + self.log_price_slope * np.log(sizes)
+                        + rng.normal(0, self.log_price_std, size))
+        fractional = rng.random(size) < self.fractional_price_rate
+        price_kind = rng.random(size)
+        size_missing = rng.random(size) < self.size_missing_rate
+        owners = rng.choice(len(self.owners), size, p=self.owner_weights)
+        qualities = rng.choice(len(self.location_qualities), size, p=self.location_quality_weights)
+        published = rng.integers(self.published[0], self.published[1] + 1, size)
+
+        for row in range(size):
+            index = start + row
+            listing = {"id": str(first_id + index), "postcode": int(self.postcodes[postcode_rows[row]]),
+                       "lon": f"{lon[row]:.7f}", "lat": f"{lat[row]:.7f}",
+                       "location_quality": self.location_qualities[qualities[row]],
+                       "published": int(published[row]), "number_of_rooms": int(rooms[row])}
+            if price_kind[row] < self.price_on_request_rate:
+                listing["price"] = "Preis auf Anfrage"
+            elif price_kind[row] >= self.price_on_request_rate + self.price_missing_rate:
+                listing["price"] = round(float(prices[row]), 2) if fractional[row] else int(round(prices[row], -2))
+            if not size_missing[row]:
+                listing["estate_size"] = int(sizes[row])
+                listing["estate_size/living_area"] = int(sizes[row])
+            if rooms[row]:
+                listing["rooms"] = f"{rooms[row]}X{rooms[row]}"
+            owner = self.owners[owners[row]]
+            if owner is not None:
+                listing["orgname"] = f"{owner} {copies[row]}" if copies[row] else owner
+            floor = self.floors[floor_rows[row]]
+            if floor is not None:
+                listing["floor"] = floor
+            yield listing
+
+
+# Writes listings as crawler pages of PAGE_SIZE adverts, with willhaben's coordinates attribute, for the extractor
+def write_pages(listings, directory):
+    pages = 0
+    page = []
+    for listing in listings:
+        advert = {key: value for key, value in listing.items() if key not in ("lat", "lon")}
+        advert["coordinates"] = f"{listing['lat']},{listing['lon']}"
+        page.append(advert)
+        if len(page) == PAGE_SIZE:
+            pages += 1
+            with open(os.path.join(directory, f"{pages}.json"), 'w', encoding='utf-8') as file:
+                json.dump(page, file)
+            page = []
+    if page:
+        pages += 1
+        with open(os.path.join(directory, f"{pages}.json"), 'w', encoding='utf-8') as file:
+            json.dump(page, file)
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic Vienna listings drawn from the distributions of a sample")
+    parser.add_argument("count", type=int)
+    parser.add_argument("output", help="a .json or .jsonl file")
+    parser.add_argument("--source", default="knowledge_graph_creation/result_for_db.json")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    count = write_listings(args.output, ListingModel.from_sample(args.source).listings(args.count, args.seed))
+    print(f"Wrote {count} listings to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
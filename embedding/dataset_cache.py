@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import numpy as np
+import torch
+from pykeen.triples import TriplesFactory
+from knowledge_graph_creation.triple_export import EMBEDDING_RELATIONS
+
+SPLIT_NAMES = ["training", "validation", "testing"]
+
+
+# Relabels the triples with sorted entity and relation vocabularies, the ids TriplesFactory.from_labeled_triples
+# would assign, and sorts them so the same graph always gives the same arrays and content hash
+def canonical_triples(triple_buffer):
+    triples = triple_buffer.triples()
+    entities = np.array(triple_buffer.entities.labels, dtype=object)
+    relations = np.array(triple_buffer.relations.labels, dtype=object)
+    entity_order = np.argsort(entities.astype(str), kind='stable')
+    relation_order = np.argsort(relations.astype(str), kind='stable')
+    entity_ids = np.empty(len(entities), dtype=np.int64)
+    entity_ids[entity_order] = np.arange(len(entities))
+    relation_ids = np.empty(len(relations), dtype=np.int64)
+    relation_ids[relation_order] = np.arange(len(relations))
+    mapped = np.column_stack([entity_ids[triples[:, 0]], relation_ids[triples[:, 1]], entity_ids[triples[:, 2]]])
+    mapped = mapped[np.lexsort((mapped[:, 2], mapped[:, 1], mapped[:, 0]))]
+    return np.ascontiguousarray(mapped), entities[entity_order].tolist(), relations[relation_order].tolist()
+
+
+def content_hash(mapped_triples, entity_labels, relation_labels):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([entity_labels, relation_labels]).encode('utf-8'))
+    digest.update(mapped_triples.tobytes())
+    return digest.hexdigest()
+
+
+# A dataset read out of the graph once: integer mapped triples, label maps and fixed splits, stored per
+# content hash as .npy files that are memory mapped on later loads
+class CachedDataset:
+
+    def __init__(self, directory, mapped_triples, entity_labels, relation_labels, splits, split_key=None):
+        self.directory = directory
+        self.split_key = split_key
+        self.mapped_triples = mapped_triples
+        self.entity_to_id = {label: index for index, label in enumerate(entity_labels)}
+        self.relation_to_id = {label: index for index, label in enumerate(relation_labels)}
+        self.splits = splits
+
+    @property
+    def digest(self):
+        return os.path.basename(self.directory)
+
+    def factory(self, mapped_triples):
+        return TriplesFactory(mapped_triples=torch.from_numpy(mapped_triples),
+                              entity_to_id=self.entity_to_id, relation_to_id=self.relation_to_id)
+
+    # Returns the factory over all triples, used for predictions, and the training, validation and testing factories
+    def triples_factories(self):
+        return self.factory(self.mapped_triples), *(self.factory(self.splits[name]) for name in SPLIT_NAMES)
+
+    # Copy-on-write mapping, torch needs writable arrays but nothing is read from disk before it is used
+    @classmethod
+    def load(cls, directory, split_key):
+        with open(os.path.join(directory, "labels.json"), encoding='utf-8') as file:
+            labels = json.load(file)
+        splits = {name: np.load(os.path.join(directory, split_key, f"{name}.npy"), mmap_mode='c')
+                  for name in SPLIT_NAMES}
+        return cls(directory, np.load(os.path.join(directory, "triples.npy"), mmap_mode='c'),
+                   labels["entities"], labels["relations"], splits, split_key)
+
+
+# Directory of CachedDatasets, one subdirectory per content hash of the exported triples with one split
+# subdirectory per ratios and seed. latest.json remembers the last dataset per graph, the identity of the backend,
+# and relation set, which lets warm starts skip the database entirely; load with refresh=True after the graph
+# changed.
+class DatasetCache:
+
+    def __init__(self, directory="embedding_cache"):
+        self.directory = directory
+
+    def latest_path(self):
+        return os.path.join(self.directory, "latest.json")
+
+    def read_latest(self):
+        if not os.path.exists(self.latest_path()):
+            return {}
+        with open(self.latest_path(), encoding='utf-8') as file:
+            return json.load(file)
+
+    def write_latest(self, latest_key, digest):
+        latest = self.read_latest()
+        latest[latest_key] = digest
+        write_json(self.latest_path(), latest)
+
+    def load(self, apartment_graph, relations=EMBEDDING_RELATIONS, ratios=(.8, .1, .1), seed=42, refresh=False):
+        split_key = "split_" + "_".join(str(ratio) for ratio in ratios) + f"_seed{seed}"
+        latest_key = f"{apartment_graph.backend.identity()}|{','.join(relations)}"
+        digest = None if refresh else self.read_latest().get(latest_key)
+        if digest and os.path.exists(os.path.join(self.directory, digest, split_key)):
+            return CachedDataset.load(os.path.join(self.directory, digest), split_key)
+
+        mapped_triples, entity_labels, relation_labels = canonical_triples(
+            apartment_graph.backend.read_triples(relations))
+        digest = content_hash(mapped_triples, entity_labels, relation_labels)
+        directory = os.path.join(self.directory, digest)
+        if not os.path.exists(os.path.join(directory, "triples.npy")):
+            os.makedirs(directory, exist_ok=True)
+            write_json(os.path.join(directory, "labels.json"),
+                       {"entities": entity_labels, "relations": relation_labels})
+            write_npy(os.path.join(directory, "triples.npy"), mapped_triples)
+        if not os.path.exists(os.path.join(directory, split_key)):
+            dataset = CachedDataset(directory, mapped_triples, entity_labels, relation_labels, {})
+            splits = dataset.factory(mapped_triples).split(list(ratios), random_state=seed)
+            os.makedirs(os.path.join(directory, split_key), exist_ok=True)
+            for name, split in zip(SPLIT_NAMES, splits):
+                write_npy(os.path.join(directory, split_key, f"{name}.npy"), split.mapped_triples.numpy())
+        self.write_latest(latest_key, digest)
+        return CachedDataset.load(directory, split_key)
+
+
+# Writes through a temporary file so an interrupted run never leaves a truncated file behind
+def write_npy(path, array):
+    with open(path + ".tmp", 'wb') as file:
+        np.save(file, array)
+    os.replace(path + ".tmp", path)
+
+
+def write_json(path, data):
+    with open(path + ".tmp", 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,69 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import torch
+
+
+# Scores many (head, relation) pairs against the candidate tails in chunks of at most memory_budget bytes of
+# scores and keeps the top k per pair. Answers are kept in an LRU cache, create a new predictor for a new model.
+class BatchPredictor:
+
+    def __init__(self, model, triples_factory, memory_budget=64 * 2 ** 20, cache_size=100000):
+        self.model = model.eval()
+        self.entity_to_id = triples_factory.entity_to_id
+        self.relation_to_id = triples_factory.relation_to_id
+        self.entity_labels = np.empty(len(self.entity_to_id), dtype=object)
+        for label, entity_id in self.entity_to_id.items():
+            self.entity_labels[entity_id] = label
+        self.mapped_triples = triples_factory.mapped_triples
+        self.memory_budget = memory_budget
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.targets = {}
+
+    # Tail entities the relation has in the graph, e.g. the districts for LOCATED_IN
+    def relation_targets(self, relation_id):
+        if relation_id not in self.targets:
+            self.targets[relation_id] = torch.unique(self.mapped_triples[self.mapped_triples[:, 1] == relation_id, 2])
+        return self.targets[relation_id]
+
+    # Returns a DataFrame with the k best (head, relation, tail, score) rows per pair, in order of the pairs.
+    # With restrict only tails the relation already points to are candidates, otherwise all entities.
+    def predict(self, pairs, k=5, restrict=True):
+        keys = [(str(head), relation, k, restrict) for head, relation in pairs]
+        answers = {}
+        missing = {}
+        for key in keys:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                answers[key] = self.cache[key]
+            else:
+                missing.setdefault(key[1], {})[key] = None
+        for relation, relation_keys in missing.items():
+            answers.update(self.score(relation, list(relation_keys), k, restrict))
+        for key in answers.keys() - self.cache.keys():
+            self.cache[key] = answers[key]
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        rows = [(key[0], key[1], tail, score) for key in keys for tail, score in answers[key]]
+        return pd.DataFrame(rows, columns=["head", "relation", "tail", "score"])
+
+    def score(self, relation, keys, k, restrict):
+        relation_id = self.relation_to_id[relation]
+        targets = self.relation_targets(relation_id) if restrict else None
+        n_targets = len(self.entity_labels) if targets is None else len(targets)
+        chunk_size = max(1, self.memory_budget // (4 * n_targets))
+        answers = {}
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            hr_batch = torch.tensor([[self.entity_to_id[key[0]], relation_id] for key in chunk], dtype=torch.long)
+            with torch.inference_mode():
+                scores = self.model.score_t(hr_batch, tails=targets)
+                top = torch.topk(scores, min(k, n_targets), dim=1)
+            tails = top.indices if targets is None else targets[top.indices]
+            for key, tail_ids, tail_scores in zip(chunk, tails.numpy(), top.values.numpy()):
+                answers[key] = list(zip(self.entity_labels[tail_ids].tolist(), tail_scores.tolist()))
+        return answers
+
+    def clear(self):
+        self.cache.clear()
@@ -0,0 +1,115 @@
+import itertools
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import pandas as pd
+import torch
+from knowledge_graph_creation.apartment_graph import ApartmentGraph
+from embedding.dataset_cache import CachedDataset, DatasetCache
+from embedding.training import train_model
+
+search_space = {
+    "model": ["RotatE", "RGCN"],
+    "embedding_dim": [32, 50, 100],
+    "lr": [0.01, 0.001],
+    "batch_size": [32, 256],
+    "num_epochs": [50],
+}
+
+
+# Every combination of the values in space
+def grid(space):
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+# n configurations drawn from space, a list is sampled from, a (low, high) tuple log-uniformly in between
+def random_configs(space, n, seed=42):
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                value = math.exp(rng.uniform(math.log(low), math.log(high)))
+                config[name] = round(value) if isinstance(low, int) and isinstance(high, int) else value
+            else:
+                config[name] = rng.choice(values)
+        configs.append(config)
+    return configs
+
+
+# Runs in every worker before its first trial, torch would otherwise start a thread per core in each worker
+def limit_threads(threads):
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    torch.set_num_threads(threads)
+
+
+def run_trial(trial, config, dataset_directory, split_key, seed, checkpoint_directory):
+    dataset = CachedDataset.load(dataset_directory, split_key)
+    start = time.perf_counter()
+    options = {name: value for name, value in config.items() if name != "model"}
+    result, _ = train_model(config["model"], dataset, seed=seed,
+                            checkpoint_directory=os.path.join(checkpoint_directory, f"trial_{trial}"), **options)
+    epochs = len(result.losses)
+    return {
+        "trial": trial,
+        **config,
+        "epochs_run": epochs,
+        "final_loss": result.losses[-1] if epochs else None,
+        "mrr": result.metric_results.get_metric("inverse_harmonic_mean_rank"),
+        "hits@1": result.metric_results.get_metric("hits@1"),
+        "hits@10": result.metric_results.get_metric("hits@10"),
+        "train_seconds": result.train_seconds,
+        "evaluate_seconds": result.evaluate_seconds,
+        "wall_seconds": time.perf_counter() - start,
+        "triples_per_second": len(dataset.splits["training"]) * epochs / result.train_seconds,
+    }
+
+
+def write_results(rows, output):
+    results = pd.DataFrame(rows)
+    if "hits@10" in results:
+        results = results.sort_values("hits@10", ascending=False, na_position="last")
+    if output.endswith(".parquet"):
+        results.to_parquet(output, index=False)
+    else:
+        results.to_csv(output, index=False)
+    return results
+
+
+# Trains every configuration in workers processes with threads_per_worker torch threads each, all on the same
+# cached dataset of the graph. The results table is rewritten to output after every finished trial, a failed
+# trial is recorded with its error instead of stopping the sweep.
+def run_sweep(apartment_graph, configs, workers=2, threads_per_worker=None, output="sweep_results.csv",
+              dataset_cache=None, refresh_data=False, seed=42, checkpoint_directory="checkpoints/sweep"):
+    dataset = (dataset_cache or DatasetCache()).load(apartment_graph, seed=seed, refresh=refresh_data)
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=limit_threads, initargs=(threads,)) as executor:
+        futures = {executor.submit(run_trial, trial, config, dataset.directory, dataset.split_key, seed,
+                                   checkpoint_directory): (trial, config)
+                   for trial, config in enumerate(configs)}
+        for future in as_completed(futures):
+            trial, config = futures[future]
+            try:
+                row = future.result()
+            except Exception as error:
+                row = {"trial": trial, **config, "error": repr(error)}
+            rows.append(row)
+            print(f"Trial {trial + 1}/{len(configs)}: {row}")
+            write_results(rows, output)
+    results = write_results(rows, output)
+    print(results)
+    return results
+
+
+if __name__ == "__main__":
+    ag = ApartmentGraph("bolt://localhost:7687", "neo4j", "password", "neo4j")
+    run_sweep(ag, grid(search_space), workers=4)
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import torch
+from matplotlib import pyplot as plt
+from pykeen.pipeline import pipeline
+from pykeen.triples import TriplesFactory
+
+
+# Short hash of the settings a checkpoint depends on, so a run with another config doesn't resume from it
+def config_hash(config):
+    return hashlib.blake2b(json.dumps(config, sort_keys=True).encode('utf-8'), digest_size=6).hexdigest()
+
+
+# Runs the PyKEEN pipeline on a CachedDataset with periodic checkpoints. The checkpoint is named after the model,
+# the dataset hash, the seed and a hash of the training config, so rerunning an interrupted training with the same
+# data and settings picks up where it stopped.
+# It is deleted once the training finished, the next run starts from scratch again.
+# With patience set, training stops early when the validation metric didn't improve in that many evaluations.
+def train_model(model, dataset, num_epochs=50, batch_size=32, embedding_dim=50, lr=0.001, seed=42,
+                checkpoint_directory="checkpoints", checkpoint_frequency=10, patience=None,
+                stopping_metric="hits@10", evaluation_frequency=5):
+    triples_factory, training, validation, testing = dataset.triples_factories()
+    config = config_hash(dict(num_epochs=num_epochs, batch_size=batch_size, embedding_dim=embedding_dim, lr=lr,
+                              patience=patience, stopping_metric=stopping_metric,
+                              evaluation_frequency=evaluation_frequency))
+    checkpoint_name = f"{model.lower()}_{dataset.digest}_seed{seed}_{config}.pt"
+    stopper_kwargs = {}
+    if patience:
+        stopper_kwargs = dict(stopper='early', stopper_kwargs=dict(
+            frequency=evaluation_frequency, patience=patience, metric=stopping_metric, relative_delta=0.002))
+    result = pipeline(
+        model=model,
+        loss="BCEWithLogitsLoss",
+        training=training,
+        testing=testing,
+        validation=validation,
+        random_seed=seed,
+        model_kwargs=dict(embedding_dim=embedding_dim),
+        optimizer_kwargs=dict(lr=lr),
+        training_kwargs=dict(num_epochs=num_epochs, use_tqdm_batch=False, batch_size=batch_size,
+                             checkpoint_name=checkpoint_name, checkpoint_directory=checkpoint_directory,
+                             checkpoint_frequency=checkpoint_frequency, checkpoint_on_failure=True),
+        **stopper_kwargs,
+    )
+    checkpoint = os.path.join(checkpoint_directory, checkpoint_name)
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return result, triples_factory
+
+
+# Writes the model, the triples factory and the metrics of a pipeline result into directory
+def save_model(result, triples_factory, directory):
+    result.save_to_directory(directory, save_training=False)
+    triples_factory.to_path_binary(os.path.join(directory, "triples_factory"))
+
+
+def load_model(directory):
+    model = torch.load(os.path.join(directory, "trained_model.pkl"), map_location="cpu", weights_only=False)
+    return model, TriplesFactory.from_path_binary(os.path.join(directory, "triples_factory"))
+
+
+def plot_losses(losses, title, file_path):
+    plt.figure()
+    plt.plot(losses)
+    plt.xlabel("Epoch")
+    plt.ylabel("Loss")
+    plt.title(title)
+    plt.savefig(file_path)
@@ -0,0 +1,237 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Upper bound for the number of float32 distances computed at once for a batch of queries
+MAX_DISTANCES_PER_CHUNK = 1 << 24
+
+
+def squared_distances(queries, vectors, vector_norms):
+    distances = vector_norms[None, :] - 2 * (queries @ vectors.T)
+    distances += np.einsum('ij,ij->i', queries, queries)[:, None]
+    return np.maximum(distances, 0, out=distances)
+
+
+# Returns the indices and squared distances of the k smallest entries of every row, sorted ascending
+def top_k(distances, k):
+    k = min(k, distances.shape[1])
+    if k == 0:
+        return np.empty((len(distances), 0), dtype=np.int64), np.empty((len(distances), 0), dtype=np.float32)
+    candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+    order = np.argsort(candidate_distances, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_distances, order, axis=1)
+
+
+# Exact search, distances to all vectors are computed as one matrix product per chunk of queries
+class BruteForceBackend:
+    name = "brute_force"
+
+    def __init__(self, vectors, norms=None):
+        self.vectors = vectors
+        self.norms = np.einsum('ij,ij->i', vectors, vectors) if norms is None else norms
+
+    def search(self, queries, k):
+        chunk = max(1, MAX_DISTANCES_PER_CHUNK // max(len(self.vectors), 1))
+        indices, distances = [], []
+        for start in range(0, len(queries), chunk):
+            chunk_indices, chunk_distances = top_k(
+                squared_distances(queries[start:start + chunk], self.vectors, self.norms), k)
+            indices.append(chunk_indices)
+            distances.append(chunk_distances)
+        return np.concatenate(indices), np.concatenate(distances)
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "norms.npy"), self.norms)
+        return {}
+
+    @classmethod
+    def load(cls, directory, vectors, mmap_mode, **params):
+        return cls(vectors, np.load(os.path.join(directory, "norms.npy"), mmap_mode=mmap_mode))
+
+
+def kmeans(vectors, n_clusters, iterations=20, seed=420, sample_size=64):
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), n_clusters * sample_size), replace=False))]
+    centroids = np.array(sample[rng.choice(len(sample), n_clusters, replace=False)], dtype=np.float32)
+    for _ in range(iterations):
+        assignment = BruteForceBackend(centroids).search(sample, 1)[0][:, 0]
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=n_clusters)
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = np.add.reduceat(sample[order], starts, axis=0) / counts[filled, None]
+    return centroids
+
+
+# Approximate search with an inverted file: vectors are grouped by their nearest k-means centroid and
+# a query is only compared with the vectors in the n_probe lists whose centroids are closest to it
+class IVFBackend:
+    name = "ivf"
+
+    def __init__(self, vectors, n_lists=None, n_probe=8, seed=420, centroids=None, offsets=None, items=None):
+        self.vectors = vectors
+        self.n_probe = n_probe
+        self.norms = np.einsum('ij,ij->i', vectors, vectors)
+        if centroids is None:
+            n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+            centroids = kmeans(vectors, min(n_lists, len(vectors)), seed=seed)
+            assignment = BruteForceBackend(centroids).search(vectors, 1)[0][:, 0]
+            items = np.argsort(assignment, kind='stable')
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))])
+        self.centroids = centroids
+        self.offsets = offsets
+        self.items = items
+
+    def search(self, queries, k):
+        probes = BruteForceBackend(self.centroids).search(queries, self.n_probe)[0]
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for row, lists in enumerate(probes):
+            candidates = np.concatenate([self.items[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+            candidate_distances = squared_distances(queries[row:row + 1], self.vectors[candidates],
+                                                    self.norms[candidates])
+            found, found_distances = top_k(candidate_distances, k)
+            indices[row, :found.shape[1]] = candidates[found[0]]
+            distances[row, :found.shape[1]] = found_distances[0]
+        return indices, distances
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "items.npy"), self.items)
+        return {"n_probe": self.n_probe}
+
+    @classmethod
+    def load(cls, directory, vectors, mmap_mode, n_probe=8):
+        return cls(vectors, n_probe=n_probe,
+                   centroids=np.load(os.path.join(directory, "centroids.npy")),
+                   offsets=np.load(os.path.join(directory, "offsets.npy")),
+                   items=np.load(os.path.join(directory, "items.npy"), mmap_mode=mmap_mode))
+
+
+BACKENDS = {backend.name: backend for backend in [BruteForceBackend, IVFBackend]}
+
+
+# Top-k euclidean similarity index over the embeddings of one node label. The embeddings are kept
+# in one contiguous float32 matrix, the keys are the node ids or names the rows belong to.
+class EmbeddingIndex:
+
+    def __init__(self, keys, vectors, backend="brute_force", backend_instance=None, **backend_kwargs):
+        self.keys = [str(key) for key in keys]
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+        self.vectors = vectors if isinstance(vectors, np.memmap) else np.ascontiguousarray(vectors, dtype=np.float32)
+        self.backend = backend_instance or BACKENDS[backend](self.vectors, **backend_kwargs)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Returns, for every query vector, the k closest keys with their euclidean distance
+    def search(self, queries, k=5):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        indices, distances = self.backend.search(queries, k)
+        return [[(self.keys[i], float(np.sqrt(d))) for i, d in zip(row, row_distances) if i >= 0]
+                for row, row_distances in zip(indices, distances)]
+
+    # Returns the k most similar other keys for every given key, keys without embedding get an empty list
+    def similar(self, keys, k=5):
+        keys = [str(key) for key in keys]
+        known = [key for key in keys if key in self.positions]
+        results = {}
+        if known:
+            queries = self.vectors[[self.positions[key] for key in known]]
+            for key, neighbors in zip(known, self.search(queries, k + 1)):
+                results[key] = [(other, distance) for other, distance in neighbors if other != key][:k]
+        return [results.get(key, []) for key in keys]
+
+    # Returns the k closest pairs of distinct keys, each pair in both orders like a cartesian MATCH
+    def closest_pairs(self, k=5):
+        pairs = [(key, other, distance) for key, neighbors in zip(self.keys, self.similar(self.keys, k))
+                 for other, distance in neighbors]
+        return sorted(pairs, key=lambda pair: pair[2])[:k]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "vectors.npy"), self.vectors)
+        params = self.backend.save(directory)
+        with open(os.path.join(directory, "index.json"), 'w', encoding='utf-8') as file:
+            json.dump({"backend": self.backend.name, "params": params, "keys": self.keys}, file)
+
+    # Loads a saved index, the vectors are memory mapped instead of read into memory
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, "index.json"), encoding='utf-8') as file:
+            meta = json.load(file)
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode=mmap_mode)
+        backend = BACKENDS[meta["backend"]].load(directory, vectors, mmap_mode, **meta["params"])
+        return cls(meta["keys"], vectors, backend_instance=backend)
+
+
+# Deletes the saved indexes of the labels under directory. Only the label subdirectories that hold an index.json
+# written by EmbeddingIndex.save are removed, anything else in directory is left alone.
+def remove_indexes(directory, labels):
+    for label in labels:
+        path = os.path.join(directory, label)
+        if os.path.exists(os.path.join(path, "index.json")):
+            shutil.rmtree(path)
+
+
+# Node property the embeddings of every label are keyed by
+index_keys = {
+    "Apartment": "id",
+    "Owner": "name",
+    "District": "name"
+}
+
+
+# Similarity queries over the embeddings of a model. The model provides the keys and vectors of a label with
+# label_embeddings(label) and sets indexes to {}, index_backend, index_kwargs and index_directory. The index of a label
+# is built once and cached; with index_directory set, it is saved there after building and memory mapped from there
+# on later calls.
+class SimilarityQueries:
+
+    def label_embeddings(self, label):
+        raise NotImplementedError
+
+    def get_index(self, label):
+        if label in self.indexes:
+            return self.indexes[label]
+        directory = os.path.join(self.index_directory, label) if self.index_directory else None
+        if directory and os.path.exists(os.path.join(directory, "index.json")):
+            index = EmbeddingIndex.load(directory)
+        else:
+            index = EmbeddingIndex(*self.label_embeddings(label), self.index_backend, **self.index_kwargs)
+            if directory:
+                index.save(directory)
+        self.indexes[label] = index
+        return index
+
+    # Drops the cached indexes and the saved ones, e.g. after the embeddings were trained again
+    def clear_indexes(self):
+        self.indexes = {}
+        if self.index_directory:
+            remove_indexes(self.index_directory, index_keys)
+
+    # Takes a single apartment id or a list of ids and returns the k most similar apartments for each of them
+    def get_similar_apartments(self, apartment_ids, k=5):
+        if isinstance(apartment_ids, (str, int)):
+            apartment_ids = [apartment_ids]
+        index = self.get_index("Apartment")
+        rows = [(str(apartment_id), other, distance)
+                for apartment_id, neighbors in zip(apartment_ids, index.similar(apartment_ids, k))
+                for other, distance in neighbors]
+        result = pd.DataFrame(rows, columns=["a1.id", "a2.id", "distance"])
+        print(result)
+        return result
+
+    def get_similar_owners(self, k=5):
+        result = pd.DataFrame(self.get_index("Owner").closest_pairs(k), columns=["o1.name", "o2.name", "distance"])
+        print(result)
+        return result
+
+    def get_similar_districts(self, k=5):
+        result = pd.DataFrame(self.get_index("District").closest_pairs(k), columns=["d1.name", "d2.name", "distance"])
+        print(result)
+        return result
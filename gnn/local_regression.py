@@ -0,0 +1,172 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from gnn.projection import regression_features
+
+
+# Standardized apartment feature matrix, missing values are imputed with the mean of the column
+def feature_matrix(snapshot, features):
+    columns = []
+    for name in features:
+        values, valid = snapshot.apartments[name]
+        column = np.zeros(len(valid))
+        column[valid] = values[valid].astype(np.float64)
+        mean = column[valid].mean() if valid.any() else 0.0
+        column[~valid] = mean
+        columns.append((column - mean) / (column.std() or 1.0))
+    return np.column_stack(columns) if columns else np.zeros((len(snapshot.apartments["id"][1]), 0))
+
+
+# Undirected 0/1 adjacency over apartments, then districts, then owners, from the LOCATED_IN, OWNED_BY and
+# NEIGHBOR_OF edges of the snapshot
+def adjacency_matrix(snapshot):
+    n_apartments = len(snapshot.apartments["id"][1])
+    n_districts = len(snapshot.district_names)
+    size = n_apartments + n_districts + len(snapshot.owner_names)
+    neighbor_of = snapshot.neighbor_of or (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    sources = np.concatenate([snapshot.located_in[0], snapshot.owned_by[0], neighbor_of[0]])
+    targets = np.concatenate([snapshot.located_in[1] + n_apartments, snapshot.owned_by[1] + n_apartments + n_districts,
+                              neighbor_of[1]])
+    matrix = sparse.csr_matrix((np.ones(2 * len(sources), dtype=np.float32),
+                                (np.concatenate([sources, targets]), np.concatenate([targets, sources]))),
+                               shape=(size, size))
+    matrix.data[:] = 1
+    return matrix
+
+
+# Achlioptas' sparse random projection, a third of the entries are +-sqrt(3), the rest 0
+def sparse_projection(rng, rows, columns):
+    return (rng.choice([-1.0, 0.0, 1.0], size=(rows, columns), p=[1 / 6, 2 / 3, 1 / 6]) * np.sqrt(3)).astype(np.float32)
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+# FastRP as in GDS: random node vectors plus the projected features of the first nodes, propagated
+# len(iteration_weights) times over the degree normalized adjacency and summed with the given weights
+def fast_rp(adjacency, features, dimension=256, property_ratio=0.8, iteration_weights=(0.0, 1.0, 1.0), seed=420):
+    rng = np.random.default_rng(seed)
+    property_dimension = int(dimension * property_ratio) if features.shape[1] else 0
+    node_dimension = dimension - property_dimension
+    current = np.zeros((adjacency.shape[0], dimension), dtype=np.float32)
+    current[:, :node_dimension] = sparse_projection(rng, adjacency.shape[0], node_dimension)
+    current[:len(features), node_dimension:] = features @ sparse_projection(rng, features.shape[1], property_dimension)
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    transition = sparse.diags((1 / np.maximum(degrees, 1)).astype(np.float32)) @ adjacency
+    embedding = np.zeros_like(current)
+    for weight in iteration_weights:
+        current = normalize_rows(transition @ current)
+        embedding += weight * current
+    return embedding
+
+
+# Ridge weights and intercepts of x -> y for every alpha at once, from one eigendecomposition of x'x
+def ridge_path(x, y, alphas):
+    x_mean = x.mean(axis=0)
+    y_mean = y.mean()
+    centered = x - x_mean
+    eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered)
+    projected = eigenvectors.T @ (centered.T @ (y - y_mean))
+    weights = (eigenvectors @ (projected[:, None] / (eigenvalues[:, None] + alphas[None, :]))).T
+    return weights, y_mean - weights @ x_mean
+
+
+# Mean squared validation error of every alpha over k folds, returns the best alpha and the error curve
+def cross_validate(x, y, alphas, folds=5, seed=420):
+    fold_of = np.random.default_rng(seed).permutation(len(y)) % folds
+    errors = np.zeros(len(alphas))
+    for fold in range(folds):
+        train, validation = fold_of != fold, fold_of == fold
+        weights, intercepts = ridge_path(x[train], y[train], alphas)
+        predictions = x[validation] @ weights.T + intercepts
+        errors += ((predictions - y[validation, None]) ** 2).sum(axis=0)
+    errors /= len(y)
+    return alphas[np.argmin(errors)], errors
+
+
+def regression_metrics(y, predictions):
+    mse = float(np.mean((predictions - y) ** 2))
+    return {"MEAN_SQUARED_ERROR": mse, "MEAN_ABSOLUTE_ERROR": float(np.mean(np.abs(predictions - y))),
+            "ROOT_MEAN_SQUARED_ERROR": float(np.sqrt(mse))}
+
+
+# Local counterpart of NodeRegressionModel: pulls the apartment features and the adjacency out of the backend once,
+# embeds the graph with FastRP and fits a ridge regression on features and embeddings, picking the penalty by
+# k-fold cross validation on the training part and reporting the same metrics on the held out test part.
+# price is only the target, it is not a feature.
+class LocalRegressionModel:
+
+    def __init__(self, apartment_graph, features=regression_features, embedding_dimension=256, property_ratio=0.8,
+                 iteration_weights=(0.0, 1.0, 1.0), alphas=np.logspace(-3, 5, 17), folds=5, test_fraction=0.2,
+                 seed=420):
+        self.apartment_graph = apartment_graph
+        self.features = features
+        self.embedding_dimension = embedding_dimension
+        self.property_ratio = property_ratio
+        self.iteration_weights = iteration_weights
+        self.alphas = np.asarray(alphas, dtype=np.float64)
+        self.folds = folds
+        self.test_fraction = test_fraction
+        self.seed = seed
+        self.snapshot = None
+        self.adjacency = None
+        self.feature_values = None
+        self.weights = None
+        self.intercept = None
+        self.metrics = None
+        self.timings = {}
+
+    def export(self):
+        start = time.perf_counter()
+        self.snapshot = self.apartment_graph.backend.read_snapshot(neighbors=True)
+        self.adjacency = adjacency_matrix(self.snapshot)
+        self.feature_values = feature_matrix(self.snapshot, self.features)
+        self.timings["export"] = time.perf_counter() - start
+
+    def design_matrix(self):
+        start = time.perf_counter()
+        embedding = fast_rp(self.adjacency, self.feature_values, self.embedding_dimension, self.property_ratio,
+                            self.iteration_weights, self.seed)
+        self.timings["fast_rp"] = time.perf_counter() - start
+        return np.hstack([self.feature_values, embedding[:len(self.feature_values)].astype(np.float64)])
+
+    # Trains and predicts the price of every apartment. Returns the predictions next to the real prices and,
+    # if output is set, writes them to a .parquet or .csv file.
+    def train(self, output=None):
+        if self.snapshot is None:
+            self.export()
+        x = self.design_matrix()
+        prices, price_valid = self.snapshot.apartments["price"]
+        labelled = np.flatnonzero(price_valid)
+        y = prices[labelled].astype(np.float64)
+        test = np.random.default_rng(self.seed).random(len(labelled)) < self.test_fraction
+
+        start = time.perf_counter()
+        alpha, errors = cross_validate(x[labelled[~test]], y[~test], self.alphas, self.folds, self.seed)
+        weights, intercepts = ridge_path(x[labelled[~test]], y[~test], np.array([alpha]))
+        self.weights, self.intercept = weights[0], intercepts[0]
+        self.timings["regression"] = time.perf_counter() - start
+
+        predicted = x @ self.weights + self.intercept
+        metrics = regression_metrics(y[test], predicted[labelled[test]])
+        print(f"Model parameters: \n\t\talpha: {alpha}, validation MSE: {errors.min()}")
+        for name, value in metrics.items():
+            print(f"{name:<28} test score: {value}")
+        print("Seconds: " + ", ".join(f"{step} {seconds:.3f}" for step, seconds in self.timings.items()))
+
+        predictions = pd.DataFrame({
+            "id": self.snapshot.apartments["id"][0],
+            "price": np.where(price_valid, prices, np.nan).astype(np.float64),
+            "predictedValue": predicted,
+        })
+        self.metrics = metrics
+        if output:
+            if os.path.splitext(output)[1].lower() == ".parquet":
+                predictions.to_parquet(output, index=False)
+            else:
+                predictions.to_csv(output, index=False)
+        return predictions
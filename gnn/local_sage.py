@@ -0,0 +1,375 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from gnn.embedding_index import SimilarityQueries, index_keys
+from gnn.local_regression import adjacency_matrix, cross_validate, feature_matrix, regression_metrics, ridge_path
+from gnn.projection import apartment_features
+
+# Node labels in the order their nodes are numbered in the exported graph, as adjacency_matrix numbers them
+LABELS = ["Apartment", "District", "Owner"]
+
+# Epoch number of the sampling seeds of the inference pass, out of the range of training epochs
+INFERENCE_EPOCH = 1 << 30
+
+
+# The apartment graph exported once to directory: an undirected CSR adjacency over apartments, districts and
+# owners (indptr.npy, indices.npy) and a float32 feature matrix (features.npy) with the standardized apartment
+# features plus a one-hot column per label, so districts and owners are told apart by more than their edges.
+# Loaded with mmap_mode, the arrays are memory mapped, so sampling workers share them through the page cache.
+class CsrGraph:
+
+    def __init__(self, indptr, indices, features, labels, keys):
+        self.indptr = indptr
+        self.indices = indices
+        self.features = features
+        self.labels = labels
+        self.keys = keys
+        degrees = np.diff(np.asarray(indptr)).astype(np.float64)
+        self.negative_cdf = np.cumsum(degrees ** 0.75)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @classmethod
+    def export(cls, snapshot, directory):
+        os.makedirs(directory, exist_ok=True)
+        adjacency = adjacency_matrix(snapshot)
+        keys = {"Apartment": [str(key) for key in snapshot.apartments["id"][0]],
+                "District": [str(name) for name in snapshot.district_names],
+                "Owner": [str(name) for name in snapshot.owner_names]}
+        labels = {}
+        start = 0
+        for label in LABELS:
+            labels[label] = (start, len(keys[label]))
+            start += len(keys[label])
+        features = np.zeros((len(adjacency.indptr) - 1, len(apartment_features) + len(LABELS)), dtype=np.float32)
+        features[:len(keys["Apartment"]), :len(apartment_features)] = feature_matrix(snapshot, apartment_features)
+        for column, label in enumerate(LABELS):
+            first, count = labels[label]
+            features[first:first + count, len(apartment_features) + column] = 1
+        np.save(os.path.join(directory, "indptr.npy"), adjacency.indptr.astype(np.int64))
+        np.save(os.path.join(directory, "indices.npy"), adjacency.indices.astype(np.int32))
+        np.save(os.path.join(directory, "features.npy"), features)
+        with open(os.path.join(directory, "graph.json"), 'w', encoding='utf-8') as file:
+            json.dump({"labels": labels, "keys": keys}, file)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, "graph.json"), encoding='utf-8') as file:
+            meta = json.load(file)
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ("indptr", "indices", "features")]
+        return cls(*arrays, {label: tuple(value) for label, value in meta["labels"].items()}, meta["keys"])
+
+    # count neighbors of every node drawn with replacement, a node without edges samples itself
+    def sample_neighbors(self, rng, nodes, count):
+        starts = self.indptr[nodes]
+        degrees = self.indptr[nodes + 1] - starts
+        if len(self.indices) == 0:
+            return np.repeat(nodes[:, None], count, axis=1)
+        positions = starts[:, None] + (rng.random((len(nodes), count)) * degrees[:, None]).astype(np.int64)
+        sampled = self.indices[np.minimum(positions, len(self.indices) - 1)]
+        return np.where(degrees[:, None] > 0, sampled, nodes[:, None])
+
+    # Positive examples: the node a random walk of 1 to depth steps from every node ends at
+    def walk(self, rng, nodes, depth):
+        current = np.array(nodes)
+        steps = rng.integers(1, depth + 1, len(nodes))
+        for step in range(depth):
+            moving = np.flatnonzero(steps > step)
+            current[moving] = self.sample_neighbors(rng, current[moving], 1)[:, 0]
+        return current
+
+    # Negative examples drawn in proportion to degree ** 0.75
+    def negatives(self, rng, shape):
+        return np.searchsorted(self.negative_cdf, rng.random(shape) * self.negative_cdf[-1], side='right')
+
+    def gather(self, nodes):
+        return np.asarray(self.features)[nodes]
+
+    # The input of one mini-batch: the features of the target nodes and of their sampled first hop neighbors,
+    # each next to the mean features of its sampled second hop neighbors. For training the targets are the anchors
+    # followed by one positive and negatives negative examples per anchor.
+    def sample_batch(self, job):
+        entropy, anchors, train, sample_sizes, depth, negatives = job
+        rng = np.random.default_rng(entropy)
+        targets = anchors
+        if train:
+            targets = np.concatenate([anchors, self.walk(rng, anchors, depth),
+                                      self.negatives(rng, len(anchors) * negatives)])
+        first_hop = np.concatenate([targets, self.sample_neighbors(rng, targets, sample_sizes[0]).ravel()])
+        second_hop = self.sample_neighbors(rng, first_hop, sample_sizes[1])
+        return len(targets), self.gather(first_hop), self.gather(second_hop).mean(axis=1)
+
+
+worker_graph = None
+
+
+def open_worker_graph(directory):
+    global worker_graph
+    worker_graph = CsrGraph.load(directory)
+
+
+def sample_in_worker(job):
+    return worker_graph.sample_batch(job)
+
+
+def activate(values, activation):
+    if activation == "sigmoid":
+        return 1 / (1 + np.exp(-values))
+    return np.maximum(values, 0)
+
+
+# Derivative of the activation from its output
+def activation_gradient(outputs, activation):
+    if activation == "sigmoid":
+        return outputs * (1 - outputs)
+    return (outputs > 0).astype(outputs.dtype)
+
+
+def softplus(values):
+    return np.logaddexp(0, values)
+
+
+def sigmoid(values):
+    return 1 / (1 + np.exp(-values))
+
+
+class Adam:
+
+    def __init__(self, parameters, learning_rate=0.001, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        self.learning_rate = learning_rate
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.moments = [(np.zeros_like(parameter), np.zeros_like(parameter)) for parameter in parameters]
+        self.steps = 0
+
+    def step(self, parameters, gradients):
+        self.steps += 1
+        correction1 = 1 - self.beta1 ** self.steps
+        correction2 = 1 - self.beta2 ** self.steps
+        for parameter, gradient, (first, second) in zip(parameters, gradients, self.moments):
+            first *= self.beta1
+            first += (1 - self.beta1) * gradient
+            second *= self.beta2
+            second += (1 - self.beta2) * gradient * gradient
+            parameter -= self.learning_rate * (first / correction1) / (np.sqrt(second / correction2) + self.epsilon)
+
+
+# Two layer GraphSAGE with mean aggregation: every layer maps [own representation || mean of the sampled neighbors']
+# through a weight matrix and the activation, the output is L2 normalized. Trained unsupervised like the GDS
+# version, pulling anchors towards the end of random walks from them and pushing them away from degree sampled
+# negatives, with the gradients written out by hand.
+class SageNetwork:
+
+    def __init__(self, input_dimension, embedding_dimension=64, activation="sigmoid", seed=420):
+        rng = np.random.default_rng(seed)
+        self.activation = activation
+        self.weights = [self.glorot(rng, 2 * input_dimension, embedding_dimension),
+                        self.glorot(rng, 2 * embedding_dimension, embedding_dimension)]
+
+    @staticmethod
+    def glorot(rng, rows, columns):
+        limit = np.sqrt(6 / (rows + columns))
+        return rng.uniform(-limit, limit, (rows, columns)).astype(np.float32)
+
+    # Returns the embeddings of the targets and what backward needs
+    def forward(self, targets, first_hop, second_hop_mean):
+        inputs1 = np.hstack([first_hop, second_hop_mean])
+        hidden = activate(inputs1 @ self.weights[0], self.activation)
+        sample_size = len(hidden) // targets - 1
+        inputs2 = np.hstack([hidden[:targets], hidden[targets:].reshape(targets, sample_size, -1).mean(axis=1)])
+        outputs = activate(inputs2 @ self.weights[1], self.activation)
+        norms = np.maximum(np.linalg.norm(outputs, axis=1, keepdims=True), 1e-12)
+        embeddings = outputs / norms
+        return embeddings, (inputs1, hidden, inputs2, outputs, norms, embeddings, sample_size)
+
+    def backward(self, gradient, cache, penalty_l2=0.0):
+        inputs1, hidden, inputs2, outputs, norms, embeddings, sample_size = cache
+        gradient = (gradient - embeddings * np.sum(gradient * embeddings, axis=1, keepdims=True)) / norms
+        gradient = gradient * activation_gradient(outputs, self.activation)
+        weights2 = inputs2.T @ gradient
+        gradient = gradient @ self.weights[1].T
+        dimension = hidden.shape[1]
+        hidden_gradient = np.concatenate([
+            gradient[:, :dimension],
+            np.repeat(gradient[:, dimension:] / sample_size, sample_size, axis=0)])
+        hidden_gradient *= activation_gradient(hidden, self.activation)
+        weights1 = inputs1.T @ hidden_gradient
+        return [weights1 + 2 * penalty_l2 * self.weights[0], weights2 + 2 * penalty_l2 * self.weights[1]]
+
+    # Mean over the anchors of -log sigmoid(anchor . positive) - weight * mean log sigmoid(-anchor . negative)
+    # and its gradient with respect to the embeddings
+    @staticmethod
+    def loss(embeddings, anchors, negative_sample_weight):
+        anchor = embeddings[:anchors]
+        positive = embeddings[anchors:2 * anchors]
+        negative = embeddings[2 * anchors:].reshape(anchors, -1, embeddings.shape[1])
+        positive_scores = np.sum(anchor * positive, axis=1)
+        negative_scores = np.einsum('ad,and->an', anchor, negative)
+        loss = np.mean(softplus(-positive_scores) + negative_sample_weight * softplus(negative_scores).mean(axis=1))
+        positive_gradient = -sigmoid(-positive_scores) / anchors
+        negative_gradient = negative_sample_weight * sigmoid(negative_scores) / (anchors * negative.shape[1])
+        gradient = np.zeros_like(embeddings)
+        gradient[:anchors] = positive_gradient[:, None] * positive + np.einsum('an,and->ad', negative_gradient,
+                                                                                negative)
+        gradient[anchors:2 * anchors] = positive_gradient[:, None] * anchor
+        gradient[2 * anchors:] = (negative_gradient[:, :, None] * anchor[:, None, :]).reshape(-1, embeddings.shape[1])
+        return float(loss), gradient
+
+
+# Local counterpart of SageModel: exports the apartment graph once with CsrGraph and trains GraphSAGE on the CPU
+# in mini-batches of sampled neighborhoods instead of inside the GDS server. With workers > 1 the batches are
+# sampled and their features gathered in that many processes over the memory mapped export while the main process
+# trains, a few batches ahead. The defaults follow the GDS configuration of SageModel, except for epochs, which
+# here are full passes over all nodes. Embeddings are kept per label in the order of CsrGraph.keys, write_embeddings
+# stores them as sage_embeddings like the GDS write, and the similarity queries answer from them directly.
+class LocalSageModel(SimilarityQueries):
+
+    def __init__(self, apartment_graph, directory="sage_graph", embedding_dimension=64, sample_sizes=(25, 10),
+                 search_depth=10, negatives=5, negative_sample_weight=20, batch_size=100, epochs=10,
+                 learning_rate=0.001, penalty_l2=1e-5, activation="sigmoid", workers=1, seed=420,
+                 index_backend="brute_force", index_directory=None, **index_kwargs):
+        self.apartment_graph = apartment_graph
+        self.directory = directory
+        self.embedding_dimension = embedding_dimension
+        self.sample_sizes = tuple(sample_sizes)
+        self.search_depth = search_depth
+        self.negatives = negatives
+        self.negative_sample_weight = negative_sample_weight
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.penalty_l2 = penalty_l2
+        self.activation = activation
+        self.workers = workers
+        self.seed = seed
+        self.index_backend = index_backend
+        self.index_directory = index_directory
+        self.index_kwargs = index_kwargs
+        self.graph = None
+        self.network = None
+        self.embeddings = None
+        self.epoch_losses = []
+        self.indexes = {}
+        self.timings = {}
+
+    def export(self):
+        start = time.perf_counter()
+        snapshot = self.apartment_graph.backend.read_snapshot(neighbors=True)
+        self.graph = CsrGraph.export(snapshot, self.directory)
+        self.timings["export"] = time.perf_counter() - start
+
+    def jobs(self, epoch, nodes, train):
+        return [((self.seed, epoch, batch), nodes[start:start + self.batch_size], train, self.sample_sizes,
+                 self.search_depth, self.negatives)
+                for batch, start in enumerate(range(0, len(nodes), self.batch_size))]
+
+    # Yields the sampled batches of jobs in order, from the worker processes if there are any
+    def batches(self, jobs, executor):
+        if executor is None:
+            for job in jobs:
+                yield self.graph.sample_batch(job)
+            return
+        pending = deque()
+        jobs = iter(jobs)
+        for job in jobs:
+            pending.append(executor.submit(sample_in_worker, job))
+            if len(pending) >= 2 * self.workers:
+                break
+        while pending:
+            batch = pending.popleft().result()
+            for job in jobs:
+                pending.append(executor.submit(sample_in_worker, job))
+                break
+            yield batch
+
+    def executor(self):
+        if self.workers <= 1:
+            return None
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=open_worker_graph,
+                                   initargs=(self.directory,))
+
+    def train(self):
+        if self.graph is None:
+            self.export()
+        self.network = SageNetwork(self.graph.features.shape[1], self.embedding_dimension, self.activation,
+                                   self.seed)
+        optimizer = Adam(self.network.weights, self.learning_rate)
+        executor = self.executor()
+        self.epoch_losses = []
+        start = time.perf_counter()
+        try:
+            for epoch in range(self.epochs):
+                nodes = np.random.default_rng((self.seed, epoch)).permutation(len(self.graph))
+                losses = []
+                for targets, first_hop, second_hop_mean in self.batches(self.jobs(epoch, nodes, True), executor):
+                    embeddings, cache = self.network.forward(targets, first_hop, second_hop_mean)
+                    loss, gradient = self.network.loss(embeddings, targets // (2 + self.negatives),
+                                                       self.negative_sample_weight)
+                    optimizer.step(self.network.weights, self.network.backward(gradient, cache, self.penalty_l2))
+                    losses.append(loss)
+                self.epoch_losses.append(float(np.mean(losses)))
+                print(f"Epoch {epoch + 1}/{self.epochs}: loss {self.epoch_losses[-1]:.4f}")
+            self.timings["train"] = time.perf_counter() - start
+            start = time.perf_counter()
+            self.embeddings = self.embed(executor)
+            self.timings["embed"] = time.perf_counter() - start
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.clear_indexes()
+        print("Seconds: " + ", ".join(f"{step} {seconds:.3f}" for step, seconds in self.timings.items()))
+        return self.epoch_losses
+
+    # Embeddings of all nodes, their neighborhoods sampled like in training
+    def embed(self, executor=None):
+        vectors = np.zeros((len(self.graph), self.embedding_dimension), dtype=np.float32)
+        nodes = np.arange(len(self.graph))
+        start = 0
+        for targets, first_hop, second_hop_mean in self.batches(self.jobs(INFERENCE_EPOCH, nodes, False), executor):
+            vectors[start:start + targets] = self.network.forward(targets, first_hop, second_hop_mean)[0]
+            start += targets
+        return vectors
+
+    def label_embeddings(self, label):
+        first, count = self.graph.labels[label]
+        return self.graph.keys[label], self.embeddings[first:first + count]
+
+    # Writes the embeddings to the sage_embeddings property of the nodes, for the queries on the database
+    def write_embeddings(self, batch_size=1000):
+        for label in LABELS:
+            keys, vectors = self.label_embeddings(label)
+            self.apartment_graph.backend.write_embeddings(label, index_keys[label], keys, vectors, "sage_embeddings",
+                                                          batch_size)
+
+
+# Quality of embeddings given as one row per node of graph: the ROC AUC of telling the graph's edges from random
+# node pairs by the dot product of their embeddings, and the test RMSE of a cross validated ridge regression of the
+# standardized apartment prices on the apartment embeddings. price is one of the input features, so the RMSE shows
+# how much of it the embeddings keep rather than how well they predict it.
+def embedding_quality(graph, vectors, samples=100000, seed=420):
+    rng = np.random.default_rng(seed)
+    indptr = np.asarray(graph.indptr)
+    edges = rng.integers(0, indptr[-1], min(samples, int(indptr[-1])))
+    sources = np.searchsorted(indptr, edges, side='right') - 1
+    targets = np.asarray(graph.indices)[edges]
+    random_pairs = rng.integers(0, len(graph), (len(edges), 2))
+    scores = np.concatenate([np.sum(vectors[sources] * vectors[targets], axis=1),
+                             np.sum(vectors[random_pairs[:, 0]] * vectors[random_pairs[:, 1]], axis=1)])
+    ranks = np.argsort(np.argsort(scores, kind='stable'), kind='stable') + 1
+    auc = (ranks[:len(edges)].sum() - len(edges) * (len(edges) + 1) / 2) / (len(edges) * len(edges))
+
+    first, count = graph.labels["Apartment"]
+    prices = np.asarray(graph.features[first:first + count, apartment_features.index("price")], dtype=np.float64)
+    x = vectors[first:first + count].astype(np.float64)
+    test = rng.random(count) < 0.2
+    alpha, _ = cross_validate(x[~test], prices[~test], np.logspace(-3, 5, 17))
+    weights, intercepts = ridge_path(x[~test], prices[~test], np.array([alpha]))
+    metrics = regression_metrics(prices[test], x[test] @ weights[0] + intercepts[0])
+    return {"link_auc": float(auc), "price_rmse": metrics["ROOT_MEAN_SQUARED_ERROR"]}
@@ -0,0 +1,78 @@
+import json
+import os
+from knowledge_graph_creation.query_recorder import QueryRecorder
+
+apartment_features = ["floor", "number_of_rooms", "price", "quality", "size"]
+
+# Features of the price regression, price itself is the target
+regression_features = [feature for feature in apartment_features if feature != "price"]
+
+apartment_node_projection = [{"Apartment": {"properties": apartment_features}}, "Owner", "District"]
+
+apartment_relationship_projection = [{"LOCATED_IN": {"orientation": "UNDIRECTED", "properties": []}},
+                                     {"OWNED_BY": {"orientation": "UNDIRECTED", "properties": []}},
+                                     {"NEIGHBOR_OF": {"orientation": "UNDIRECTED", "properties": []}}]
+
+
+# Hands out the in-memory GDS projection of the apartment graph. The node and relationship counts of the projected
+# labels and types, read from the count store, are kept in state_path next to the projection name; as long as the
+# projection exists and the counts didn't change it is reused instead of dropped and projected again.
+# Pass a version (e.g. the hash of the last import manifest) to also catch property-only changes.
+class ProjectionManager:
+
+    def __init__(self, gds, graph_name="apartment-graph", node_projection=None, relationship_projection=None,
+                 state_path="projection_state.json", queries=None):
+        self.gds = gds
+        self.queries = queries or QueryRecorder()
+        self.graph_name = graph_name
+        self.node_projection = node_projection or apartment_node_projection
+        self.relationship_projection = relationship_projection or apartment_relationship_projection
+        self.state_path = state_path
+
+    def labels(self):
+        return [label if isinstance(label, str) else next(iter(label)) for label in self.node_projection]
+
+    def relationship_types(self):
+        return [next(iter(relation)) for relation in self.relationship_projection]
+
+    def signature(self, version=None):
+        counts = {}
+        for label in self.labels():
+            counts[label] = int(self.queries.run_cypher(self.gds, "projection.count_nodes",
+                                                        f"MATCH (n:{label}) RETURN count(n) AS count")["count"][0])
+        for relation in self.relationship_types():
+            counts[relation] = int(self.queries.run_cypher(
+                self.gds, "projection.count_relationships",
+                f"MATCH ()-[r:{relation}]->() RETURN count(r) AS count")["count"][0])
+        return {"database": self.gds.database(), "counts": counts, "version": version,
+                "node_projection": self.node_projection, "relationship_projection": self.relationship_projection}
+
+    def read_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, encoding='utf-8') as file:
+            return json.load(file)
+
+    def write_state(self, signature):
+        state = self.read_state()
+        state[self.graph_name] = signature
+        with open(self.state_path + ".tmp", 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def get(self, version=None, force=False):
+        signature = self.signature(version)
+        if not force and self.gds.graph.exists(self.graph_name)["exists"] \
+                and self.read_state().get(self.graph_name) == signature:
+            print(f"Reusing projection {self.graph_name}")
+            return self.gds.graph.get(self.graph_name)
+        self.drop()
+        with self.queries.timed("projection.project"):
+            graph, _ = self.gds.graph.project(self.graph_name, self.node_projection, self.relationship_projection)
+        self.write_state(signature)
+        return graph
+
+    def drop(self):
+        self.queries.run_cypher(self.gds, "projection.drop", f"""
+            CALL gds.graph.drop('{self.graph_name}', False) YIELD graphName;
+        """)
@@ -1,25 +1,28 @@
+import re
 from graphdatascience import GraphDataScience
+from gnn.projection import ProjectionManager, regression_features
+from knowledge_graph_creation.query_recorder import QueryRecorder
+from knowledge_graph_creation.batching import batched
+
+
+# Property names are put into the Cypher as is, so only plain identifiers are allowed
+def check_property_name(name):
+    if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+        raise ValueError(f"Invalid property name for the predictions: {name!r}")
+
 
 class NodeRegressionModel:
 
-    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password", db_name="neo4j"):
+    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password", db_name="neo4j",
+                 projection_version=None, queries=None):
         self.gds = GraphDataScience(uri, auth=(user, password))
         self.gds.set_database(db_name)
+        self.queries = queries or QueryRecorder()
+        self.projections = ProjectionManager(self.gds, queries=self.queries)
         self.clear()
-        self.model_info = self.project()
+        self.model_info = self.projections.get(projection_version)
         self.pipeline = self.create_pipeline()
 
-    def project(self):
-        model_info, _ = self.gds.graph.project(
-            "apartment-graph",
-            [{"Apartment": {"properties": ["floor", "number_of_rooms", "price", "quality", "size"]}},
-             "Owner", "District"],
-            [{"LOCATED_IN": {"orientation": "UNDIRECTED", "properties": []}},
-             {"OWNED_BY": {"orientation": "UNDIRECTED", "properties": []}},
-             {"NEIGHBOR_OF": {"orientation": "UNDIRECTED", "properties": []}}]
-        )
-        return model_info
-
     def create_pipeline(self):
         pipeline = self.gds.nr_pipe("regression_pipeline_apartments")
         pipeline.configureSplit(validationFolds=5, testFraction=0.2)
@@ -36,22 +39,27 @@ class NodeRegressionModel:
             "fastRP",
             embeddingDimension=256,
             propertyRatio=0.8,
-            featureProperties=["floor", "number_of_rooms", "price", "quality", "size"],
+            featureProperties=regression_features,
             mutateProperty="frp_embedding",
             randomSeed=420,
         )
-        pipeline.selectFeatures(["price", "frp_embedding"])
+        pipeline.selectFeatures(regression_features + ["frp_embedding"])
         return pipeline
 
-    def train(self):
-        model, train_result = self.pipeline.train(
-            self.model_info,
-            modelName="regression_apartment_model",
-            targetNodeLabels=["Apartment"],
-            targetProperty="price",
-            metrics=["MEAN_SQUARED_ERROR", "MEAN_ABSOLUTE_ERROR", "ROOT_MEAN_SQUARED_ERROR"],
-            randomSeed=420,
-        )
+    # Trains the pipeline and predicts the price of every apartment in one pass. The predictions next to the real
+    # prices are returned, written to a .parquet file if path is set and as a node property if property is set.
+    def train(self, path=None, property=None, batch_size=10000):
+        if property:
+            check_property_name(property)
+        with self.queries.timed("regression.train"):
+            model, train_result = self.pipeline.train(
+                self.model_info,
+                modelName="regression_apartment_model",
+                targetNodeLabels=["Apartment"],
+                targetProperty="price",
+                metrics=["MEAN_SQUARED_ERROR", "MEAN_ABSOLUTE_ERROR", "ROOT_MEAN_SQUARED_ERROR"],
+                randomSeed=420,
+            )
         print("Model parameters: \n\t\t" + str(train_result["modelInfo"]["bestParameters"]))
         print("MEAN_SQUARED_ERROR      test score: " + str(
             train_result["modelInfo"]["metrics"]["MEAN_SQUARED_ERROR"]["test"]))
@@ -60,31 +68,45 @@ class NodeRegressionModel:
         print("ROOT_MEAN_SQUARED_ERROR     test score: " + str(
             train_result["modelInfo"]["metrics"]["ROOT_MEAN_SQUARED_ERROR"]["test"]))
 
-        predicted_targets_sample = model.predict_stream(self.model_info)
-
-        predicted_targets_full = model.predict_stream(self.model_info)
-
-        real_targets = self.gds.graph.nodeProperty.stream(self.model_info, "price")
+        with self.queries.timed("regression.predict") as entry:
+            predicted_targets = model.predict_stream(self.model_info)
+            entry["rows"] = len(predicted_targets)
+        with self.queries.timed("regression.stream_prices") as entry:
+            real_targets = self.gds.graph.nodeProperty.stream(self.model_info, "price")
+            entry["rows"] = len(real_targets)
+        predictions = real_targets[["nodeId", "propertyValue"]].rename(columns={"propertyValue": "price"}) \
+            .merge(predicted_targets, on="nodeId")
+        if path:
+            predictions.to_parquet(path, index=False)
+            print(f"Wrote {len(predictions)} predictions to {path}")
+        if property:
+            self.write_predictions(predictions, property, batch_size)
+        return predictions
 
-        merged_full = real_targets.merge(predicted_targets_full, left_on="nodeId", right_on="nodeId")
-        merged_all = merged_full.merge(predicted_targets_sample, left_on="nodeId", right_on="nodeId")
-
-        print(merged_all.tail(10))
+    # Sets the predicted price of every apartment as property, the node ids of the projection are resolved with
+    # gds.util.asNode
+    def write_predictions(self, predictions, property, batch_size=10000):
+        check_property_name(property)
+        rows = predictions[["nodeId", "predictedValue"]].to_dict("records")
+        for batch in batched(rows, batch_size):
+            self.queries.run_cypher(self.gds, "regression.write_predictions", f"""
+            UNWIND $rows AS row
+            WITH gds.util.asNode(row.nodeId) AS a, row
+            SET a.{property} = row.predictedValue
+            """, {"rows": batch})
+        print(f"Wrote {len(predictions)} predictions to the {property} property")
 
     def clear(self):
-        self.gds.run_cypher("""
+        self.queries.run_cypher(self.gds, "regression.drop_model", """
             CALL gds.beta.model.drop('regression_apartment_model-REG', False)
             YIELD modelInfo, loaded, shared, stored
             RETURN modelInfo.modelName AS modelName, loaded, shared, stored
         """)
-        self.gds.run_cypher("""
-            CALL gds.graph.drop('apartment-graph', False) YIELD graphName;
-        """)
-        self.gds.run_cypher("""
+        self.queries.run_cypher(self.gds, "regression.drop_pipeline", """
         CALL gds.beta.pipeline.drop('regression_pipeline_apartments', False)
         """)
 
 
 if __name__ == '__main__':
     r = NodeRegressionModel()
-    r.train()
\ No newline at end of file
+    r.train(path="price_predictions.parquet")
\ No newline at end of file
@@ -1,43 +1,45 @@
-from pykeen.pipeline import pipeline
-from matplotlib import pyplot as plt
 from knowledge_graph_creation.apartment_graph import ApartmentGraph
-from pykeen.triples import TriplesFactory
 from pykeen.predict import predict_target
+from embedding.dataset_cache import DatasetCache
+from embedding.prediction import BatchPredictor
+from embedding.training import load_model, plot_losses, save_model, train_model
 
 class RGCN:
 
-    def __init__(self, apartment_graph):
+    def __init__(self, apartment_graph, dataset_cache=None):
         self.model = None
         self.apartment_graph = apartment_graph
+        self.dataset_cache = dataset_cache or DatasetCache()
         self.triples_factory = None
+        self.predictor = None
 
-    def train(self):
-        data = self.apartment_graph.get_data_for_embedding()
-        self.triples_factory = TriplesFactory.from_labeled_triples(
-            triples=data[['subject', 'predicate', 'object']].values,
-        )
-        training, testing, validation = self.triples_factory.split([.8, .1, .1])
-        result = pipeline(
-            model='RGCN',
-            loss="BCEWithLogitsLoss",
-            training=training,
-            testing=testing,
-            validation=validation,
-            model_kwargs=dict(embedding_dim=50),
-            optimizer_kwargs=dict(lr=0.001),
-            training_kwargs=dict(num_epochs=50, use_tqdm_batch=False, batch_size=32),
-        )
+    # Trains on the cached dataset of the graph, refresh_data re-reads the triples after the graph changed.
+    # training_options are passed on to training.train_model (epochs, batch size, checkpoints, early stopping),
+    # with model_directory set the trained model is saved there for load in another process.
+    def train(self, refresh_data=False, seed=42, model_directory=None, **training_options):
+        dataset = self.dataset_cache.load(self.apartment_graph, seed=seed, refresh=refresh_data)
+        result, self.triples_factory = train_model('RGCN', dataset, seed=seed, **training_options)
         self.model = result.model
-        plt.plot(result.losses)
-        plt.xlabel("Epoch")
-        plt.ylabel("Loss")
-        plt.title('RGCN')
-        plt.savefig('rgcn.png')
+        self.predictor = None
+        if model_directory:
+            save_model(result, self.triples_factory, model_directory)
+        plot_losses(result.losses, 'RGCN', 'rgcn.png')
+
+    def load(self, model_directory):
+        self.model, self.triples_factory = load_model(model_directory)
+        self.predictor = None
 
     def predict(self, subject, relation):
         return predict_target(self.model, head=subject, relation=relation,
                               triples_factory=self.triples_factory)
 
+    # Top k tails for many (head, relation) pairs at once, e.g. the district of thousands of listings.
+    # Answers are cached until the model is retrained or loaded again.
+    def predict_batch(self, pairs, k=5, restrict=True):
+        if self.predictor is None:
+            self.predictor = BatchPredictor(self.model, self.triples_factory)
+        return self.predictor.predict(pairs, k, restrict)
+
 
 if __name__ == "__main__":
     ag = ApartmentGraph("bolt://localhost:7687", "neo4j", "password", "neo4j")
@@ -0,0 +1,84 @@
+import math
+import numpy as np
+
+AGGREGATE_PROPERTIES = ["apartment_count", "price_count", "price_sum", "price_sum_squares", "rooms_count", "rooms_sum"]
+
+# Relations whose target nodes carry the aggregates of the apartments linked to them, with the target label
+AGGREGATED_RELATIONS = {"LOCATED_IN": "District", "OWNED_BY": "Owner"}
+
+
+# Contribution of every apartment row to the AGGREGATE_PROPERTIES of a node it is linked to, as a
+# (properties x rows) matrix. apartments maps property names to (values, valid) arrays like ApartmentSnapshot.
+def contributions(apartments, rows):
+    prices, price_valid = apartments["price"]
+    rooms, rooms_valid = apartments["number_of_rooms"]
+    price_valid = price_valid[rows]
+    rooms_valid = rooms_valid[rows]
+    price = np.where(price_valid, prices[rows], 0).astype(np.float64)
+    room = np.where(rooms_valid, rooms[rows], 0).astype(np.float64)
+    return np.vstack([np.ones(len(rows)), price_valid, price, price * price, rooms_valid, room])
+
+
+# Sums over the apartments linked to each node, in float64 columns indexed by node row: number of apartments,
+# count, sum and sum of squares of price and count and sum of number_of_rooms. Averages and variances follow
+# from these, and removing an apartment is subtracting its contribution again.
+class Aggregates:
+
+    def __init__(self, values=None):
+        self.values = np.zeros((len(AGGREGATE_PROPERTIES), 0)) if values is None else values
+
+    # Adds (sign=1) or removes (sign=-1) the contributions of the apartments linked to the target rows
+    def add(self, target_rows, contributions, sign=1):
+        target_rows = np.asarray(target_rows, dtype=np.int64)
+        if len(target_rows) == 0:
+            return
+        self.reserve(int(target_rows.max()) + 1)
+        size = self.values.shape[1]
+        for index, weights in enumerate(contributions):
+            self.values[index] += sign * np.bincount(target_rows, weights=weights, minlength=size)
+
+    # Single apartment version of add, for the row at a time import
+    def add_one(self, target_row, price, rooms, sign=1):
+        self.reserve(target_row + 1)
+        price = None if price is None else float(price)
+        rooms = None if rooms is None else float(rooms)
+        self.values[:, target_row] += sign * np.array([1.0, price is not None, price or 0.0, (price or 0.0) ** 2,
+                                                       rooms is not None, rooms or 0.0])
+
+    def reserve(self, size):
+        if size > self.values.shape[1]:
+            self.values = np.pad(self.values, ((0, 0), (0, max(size, 2 * self.values.shape[1]) - self.values.shape[1])))
+
+    # Full recompute from (apartment rows, target rows) edges
+    @classmethod
+    def recompute(cls, apartments, edges, size):
+        aggregates = cls(np.zeros((len(AGGREGATE_PROPERTIES), size)))
+        aggregates.add(edges[1], contributions(apartments, edges[0]))
+        return aggregates
+
+    def get(self, name, size):
+        values = self.values[AGGREGATE_PROPERTIES.index(name)]
+        return np.pad(values, (0, max(0, size - len(values))))[:size]
+
+    # Mean of price or rooms per node, NaN where there is nothing to average
+    def mean(self, name, size):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.get(f"{name}_sum", size) / self.get(f"{name}_count", size)
+
+    # Returns a dict per node and property where the values differ from expected beyond float rounding
+    def mismatches(self, expected, keys, label):
+        found = []
+        for name in AGGREGATE_PROPERTIES:
+            stored, recomputed = self.get(name, len(keys)), expected.get(name, len(keys))
+            for row in np.flatnonzero(~np.isclose(stored, recomputed, rtol=1e-9, atol=1e-6)):
+                key = keys[row].item() if isinstance(keys[row], np.generic) else keys[row]
+                found.append(mismatch(label, key, name, float(stored[row]), float(recomputed[row])))
+        return found
+
+
+def mismatch(label, key, name, stored, expected):
+    return {"label": label, "key": key, "property": name, "stored": stored, "expected": expected}
+
+
+def same_aggregate(stored, expected):
+    return math.isclose(stored or 0, expected or 0, rel_tol=1e-9, abs_tol=1e-6)
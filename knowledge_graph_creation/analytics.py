@@ -0,0 +1,106 @@
+import numpy as np
+from knowledge_graph_creation.aggregates import Aggregates
+
+APARTMENT_PROPERTIES = ["id", "price", "floor", "lon", "lat", "quality", "size", "number_of_rooms"]
+
+
+# Converts a list of values with None for missing ones to (values, valid) arrays of the narrowest fitting dtype
+def to_column(values):
+    valid = np.array([value is not None for value in values], dtype=bool)
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        dtype, fill = np.int64, 0
+    elif all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        dtype, fill = np.float64, np.nan
+    else:
+        dtype, fill = object, None
+    return np.array([fill if value is None else value for value in values], dtype=dtype), valid
+
+
+# Column snapshot of the apartment graph: apartment properties as (values, valid) arrays,
+# district and owner names, and the LOCATED_IN / OWNED_BY edges as pairs of row arrays.
+# neighbor_of holds the NEIGHBOR_OF edges between apartment rows if they were asked for.
+class ApartmentSnapshot:
+
+    def __init__(self, apartments, district_postal_codes, district_names, owner_names, located_in, owned_by,
+                 neighbor_of=None):
+        self.apartments = apartments
+        self.district_postal_codes = district_postal_codes
+        self.district_names = district_names
+        self.owner_names = owner_names
+        self.located_in = located_in
+        self.owned_by = owned_by
+        self.neighbor_of = neighbor_of
+
+    # The listing properties of an apartment like the Cypher map projection a {.id, .price, ...}, None if missing
+    def apartment_node(self, row):
+        return {name: (values[row].item() if isinstance(values[row], np.generic) else values[row]) if valid[row]
+                else None for name, (values, valid) in self.apartments.items()}
+
+    def district_node(self, row):
+        return {"postal_code": int(self.district_postal_codes[row]), "name": self.district_names[row]}
+
+
+# Answers the reasoner analytics from a snapshot. The per-district and per-owner Aggregates are either the
+# materialized ones of the backend or computed in one grouped pass over the edges, the queries then only
+# filter and sort them.
+class AnalyticsEngine:
+
+    def __init__(self, snapshot, district_aggregates=None, owner_aggregates=None):
+        self.snapshot = snapshot
+        district_count = len(snapshot.district_names)
+        owner_count = len(snapshot.owner_names)
+        if district_aggregates is None:
+            district_aggregates = Aggregates.recompute(snapshot.apartments, snapshot.located_in, district_count)
+        if owner_aggregates is None:
+            owner_aggregates = Aggregates.recompute(snapshot.apartments, snapshot.owned_by, owner_count)
+        self.apartment_counts = district_aggregates.get("apartment_count", district_count)
+        self.price_counts = district_aggregates.get("price_count", district_count)
+        self.average_prices = district_aggregates.mean("price", district_count)
+        self.rooms_counts = district_aggregates.get("rooms_count", district_count)
+        self.average_rooms = district_aggregates.mean("rooms", district_count)
+        self.owner_counts = owner_aggregates.get("apartment_count", owner_count)
+
+    @classmethod
+    def from_backend(cls, backend):
+        return cls(backend.read_snapshot())
+
+    def average_price_per_district(self):
+        rows = [row for row in np.argsort(-self.average_prices, kind='stable') if self.price_counts[row] > 0]
+        return [{"district": self.snapshot.district_names[row], "average_price": float(self.average_prices[row])}
+                for row in rows]
+
+    def apartments_per_district(self):
+        rows = [row for row in np.argsort(-self.apartment_counts, kind='stable') if self.apartment_counts[row] > 0]
+        return [{"district": self.snapshot.district_names[row], "apartment_count": int(self.apartment_counts[row])}
+                for row in rows]
+
+    def expensive_apartments(self, factor=3):
+        apartments, districts = self.snapshot.located_in
+        prices, price_valid = self.snapshot.apartments["price"]
+        edge_averages = self.average_prices[districts]
+        with np.errstate(invalid='ignore'):
+            expensive = np.flatnonzero(price_valid[apartments] & (prices[apartments] > edge_averages * factor))
+        return [{"a": self.snapshot.apartment_node(apartments[edge]),
+                 "district_avg_price": float(edge_averages[edge])} for edge in expensive]
+
+    def overcrowded_districts(self, max_average_rooms=2.3):
+        with np.errstate(invalid='ignore'):
+            rows = np.flatnonzero((self.rooms_counts > 0) & (self.average_rooms < max_average_rooms))
+        return [{"d": self.snapshot.district_node(row), "avgRooms": float(self.average_rooms[row])} for row in rows]
+
+    def owner_with_most_apartments(self):
+        if not self.owner_counts.any():
+            return []
+        row = int(np.argmax(self.owner_counts))
+        return [{"o": {"name": self.snapshot.owner_names[row]}, "apartmentCount": int(self.owner_counts[row])}]
+
+    # All analytics at once, keyed by the name of the ApartmentReasoner method they answer
+    def report(self, factor=3, max_average_rooms=2.3):
+        return {
+            "find_average_price_of_apartments_each_district": self.average_price_per_district(),
+            "find_district_with_most_apartments": self.apartments_per_district(),
+            "find_expensive_apartments": self.expensive_apartments(factor),
+            "find_overcrowded_districts": self.overcrowded_districts(max_average_rooms),
+            "find_owner_with_most_apartments": self.owner_with_most_apartments(),
+        }
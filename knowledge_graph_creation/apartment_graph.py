@@ -1,168 +1,183 @@
+import hashlib
 import json
-import pandas as pd
-from neo4j import GraphDatabase
+import os
+import time
+from knowledge_graph_creation.bulk_export import BulkCsvExporter
+from knowledge_graph_creation.listings_io import iter_listings
+from knowledge_graph_creation.memory_backend import MemoryBackend
+from knowledge_graph_creation.neo4j_backend import Neo4jBackend
+from knowledge_graph_creation.normalization import REJECTION_REASONS, RejectionReport, iter_normalized, \
+    normalize_listings
+from knowledge_graph_creation.triple_export import EMBEDDING_RELATIONS
 
 
 class ApartmentGraph:
-    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password", db_name="neo4j"):
-        print("Connecting to Neo4j")
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    # backend is "neo4j", "memory" for the in-process graph, or a GraphBackend instance. With schema=True the
+    # constraints and indexes of schema.py are created, if missing, before every import. queries is the
+    # QueryRecorder the Neo4j backend runs its Cypher through, e.g. QueryRecorder(profile=True, log="queries.jsonl").
+    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password", db_name="neo4j",
+                 backend="neo4j", schema=True, queries=None):
+        if backend == "neo4j":
+            backend = Neo4jBackend(uri, user, password, db_name, queries)
+        elif backend == "memory":
+            backend = MemoryBackend()
+        self.backend = backend
         self.db_name = db_name
+        self.schema = schema
+        self.driver = getattr(backend, "driver", None)
+        self.queries = getattr(backend, "queries", None)
 
     def close(self):
-        self.driver.close()
+        self.backend.close()
 
-    def import_json(self, json_file):
-        with self.driver.session() as session:
-            session.execute_write(self.create_districts)
-        with open(json_file, 'r') as json_file:
-            data = json.load(json_file)
-            for apartment in data:
-                self.create_apartment_data(apartment)
+    def prepare_import(self):
+        if self.schema:
+            self.backend.ensure_schema()
+        self.backend.import_districts(vienna_districts)
 
+    # Listings are normalized in batches of normalize_batch_size into typed columns, see normalization.py.
+    # Returns the import statistics with the per-reason rejection report.
+    def import_json(self, json_file, bulk=False, batch_size=1000, normalize_batch_size=100000):
+        if bulk:
+            return self.bulk_import_json(json_file, batch_size, normalize_batch_size)
+        start = time.perf_counter()
+        report = RejectionReport()
+        self.prepare_import()
+        imported = 0
+        for columns in self.normalized(json_file, report, normalize_batch_size):
+            for row in columns.rows():
+                self.backend.import_apartment(row)
+                imported += 1
+        return self.import_result(report, imported, time.perf_counter() - start)
+
+    # Imports all listings in batches, for Neo4j over a single session with UNWIND queries
+    def bulk_import_json(self, json_file, batch_size=1000, normalize_batch_size=100000):
+        start = time.perf_counter()
+        report = RejectionReport()
+
+        def rows():
+            for columns in self.normalized(json_file, report, normalize_batch_size):
+                yield from columns.rows()
+
+        self.prepare_import()
+        imported = self.backend.import_apartments(rows(), batch_size)
+        return self.import_result(report, imported, time.perf_counter() - start)
+
+    def normalized(self, json_file, report, batch_size=100000):
+        postal_codes = [district["postal_code"] for district in vienna_districts]
+        return iter_normalized(iter_listings(json_file), postal_codes, report, batch_size)
+
+    def import_result(self, report, imported, elapsed):
+        rows_per_sec = imported / elapsed if elapsed > 0 else 0.0
+        print(f"Imported {imported} of {report.listings} listings in {elapsed:.2f}s ({rows_per_sec:.0f} rows/sec)")
+        report.print()
+        return {"listings": report.listings, "imported": imported, "seconds": elapsed, "rows_per_sec": rows_per_sec,
+                "rejected": report.as_dict()}
+
+    # Writes the listings as CSV files for neo4j-admin database import instead of importing them, for cold builds
+    # of large graphs. Returns the command that imports them into database with the export statistics.
+    # See bulk_export.BulkCsvExporter for price_ranges, neighbors and radius.
+    def export_bulk_csv(self, json_file, directory, price_ranges=None, neighbors=False, radius=None,
+                        normalize_batch_size=100000, database=None):
+        start = time.perf_counter()
+        report = RejectionReport()
+        exporter = BulkCsvExporter(directory, vienna_districts, price_ranges, neighbors, radius, normalize_batch_size)
+        counts = exporter.export(self.normalized(json_file, report, normalize_batch_size))
+        elapsed = time.perf_counter() - start
+        command = exporter.command(database or self.db_name)
+        print(f"Exported {counts['Apartment']} of {report.listings} listings to {directory} in {elapsed:.2f}s")
+        report.print()
+        print(" ".join(command))
+        return {"listings": report.listings, "files": counts, "seconds": elapsed, "command": command,
+                "rejected": report.as_dict()}
+
+    # Imports only what changed since the last delta import. Every normalized listing is hashed and compared
+    # with the manifest of the previous run, new and changed apartments are upserted in batches and apartments
+    # that are no longer listed are removed, or tombstoned. The manifest belongs to the database it was
+    # written for, delete it after clear_db.
+    def delta_import_json(self, json_file, manifest_path="import_manifest.json", batch_size=1000, tombstone=False,
+                          normalize_batch_size=100000):
+        start = time.perf_counter()
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        report = RejectionReport()
+        current = {}
+        changed = []
+        for columns in self.normalized(json_file, report, normalize_batch_size):
+            for row in columns.rows():
+                current[row["apartment_id"]] = row_hash(row)
+                if manifest.get(row["apartment_id"]) != current[row["apartment_id"]]:
+                    changed.append(row)
+        removed = [apartment_id for apartment_id in manifest if apartment_id not in current]
+
+        self.prepare_import()
+        self.backend.upsert_apartments(changed, batch_size)
+        self.backend.remove_apartments(removed, tombstone)
+        with open(manifest_path + ".tmp", 'w', encoding='utf-8') as file:
+            json.dump(current, file)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+        elapsed = time.perf_counter() - start
+        print(f"Delta import of {report.listings} listings in {elapsed:.2f}s: {len(changed)} upserted, "
+              f"{len(current) - len(changed)} unchanged, {len(removed)} removed")
+        report.print()
+        return {"listings": report.listings, "upserted": [row["apartment_id"] for row in changed], "removed": removed,
+                "unchanged": len(current) - len(changed), "seconds": elapsed, "rejected": report.as_dict()}
+
+    # Imports a single raw listing, returns the reason it was rejected for or None
     def create_apartment_data(self, apartment):
-        with self.driver.session() as session:
-            if not "location_quality" in apartment or type(apartment["location_quality"]) != int:
-                return
-            if not "price" in apartment or type(apartment["price"]) == str:
-                return
-            else:
-                apartment["price"] = int(apartment["price"])
-            if not "floor" in apartment or type(apartment["floor"]) == str:
-                return
-            else:
-                apartment["floor"] = int(apartment["floor"])
-            if not "lon" in apartment:
-                apartment["lon"] = None
-            else:
-                apartment["lon"] = float(apartment["lon"])
-            if not "lat" in apartment:
-                apartment["lat"] = None
-            else:
-                apartment["lon"] = float(apartment["lat"])
-            if not "estate_size" in apartment:
-                return
-            if not "number_of_rooms" in apartment:
-                return
-
-            if "orgname" in apartment:
-                session.execute_write(self.create_update_apartment_owner, apartment["orgname"])
-                session.execute_write(self.create_apartment, apartment)
-            else:
-                session.execute_write(self.create_apartment_without_owner, apartment)
-
-    def create_apartment(self, tx, apartment):
-        query = f'''
-                USE {self.db_name}
-                MATCH (o:Owner {{name: $owner_name}})   
-                MATCH (d:District {{postal_code: $postal_code}})
-                
-                MERGE (a:Apartment {{id: $apartment_id}})
-                ON CREATE SET a.price = $price, a.floor = $floor, a.lon = $lon, a.lat = $lat, a.quality = $quality, 
-                a.size = $size, a.number_of_rooms = $number_of_rooms
-                
-                MERGE (a)-[r1:OWNED_BY]->(o)
-                MERGE (a)-[r2:LOCATED_IN]->(d)
-                '''
-        tx.run(query, owner_name=apartment["orgname"], postal_code=apartment["postcode"], apartment_id=apartment["id"]
-               , price=apartment["price"], lon=apartment["lon"], lat=apartment["lat"],
-               quality=apartment["location_quality"],
-               size=apartment["estate_size"], number_of_rooms=apartment["number_of_rooms"], floor=apartment["floor"])
-
-    def create_apartment_without_owner(self, tx, apartment):
-        query = f'''
-                USE {self.db_name}
-                MATCH (d:District {{postal_code: $postal_code}})
-                MERGE (a:Apartment {{id: $apartment_id}})
-                ON CREATE SET a.price = $price, a.floor = $floor, a.lon = $lon, a.lat = $lat, a.quality = $quality, 
-                a.size = $size, a.number_of_rooms = $number_of_rooms
-        
-                MERGE (a)-[r2:LOCATED_IN]->(d)
-                '''
-        tx.run(query, postal_code=apartment["postcode"], apartment_id=apartment["id"]
-               , price=apartment["price"], lon=apartment["lon"], lat=apartment["lat"],
-               quality=apartment["location_quality"],
-               size=apartment["estate_size"], number_of_rooms=apartment["number_of_rooms"], floor=apartment["floor"])
-
-    def create_districts(self, tx):
-        vienna_districts = [
-            {"postal_code": 1010, "name": "Innere Stadt"},
-            {"postal_code": 1020, "name": "Leopoldstadt"},
-            {"postal_code": 1030, "name": "Landstraße"},
-            {"postal_code": 1040, "name": "Wieden"},
-            {"postal_code": 1050, "name": "Margareten"},
-            {"postal_code": 1060, "name": "Mariahilf"},
-            {"postal_code": 1070, "name": "Neubau"},
-            {"postal_code": 1080, "name": "Josefstadt"},
-            {"postal_code": 1090, "name": "Alsergrund"},
-            {"postal_code": 1100, "name": "Favoriten"},
-            {"postal_code": 1110, "name": "Simmering"},
-            {"postal_code": 1120, "name": "Meidling"},
-            {"postal_code": 1130, "name": "Hietzing"},
-            {"postal_code": 1140, "name": "Penzing"},
-            {"postal_code": 1150, "name": "Rudolfsheim-Fünfhaus"},
-            {"postal_code": 1160, "name": "Ottakring"},
-            {"postal_code": 1170, "name": "Hernals"},
-            {"postal_code": 1180, "name": "Währing"},
-            {"postal_code": 1190, "name": "Döbling"},
-            {"postal_code": 1200, "name": "Brigittenau"},
-            {"postal_code": 1210, "name": "Floridsdorf"},
-            {"postal_code": 1220, "name": "Donaustadt"},
-            {"postal_code": 1230, "name": "Liesing"}]
-        for district in vienna_districts:
-            query = f'''
-                    USE {self.db_name}
-                    MERGE (d:District {{postal_code: $postal_code}})
-                    ON CREATE SET d.name = $name
-                    '''
-            tx.run(query, postal_code=district["postal_code"], name=district["name"])
-
-    def create_update_apartment_owner(self, tx, name):
-        query = f'''
-                USE {self.db_name}
-                MERGE (o:Owner {{name: $name}})
-                '''
-        tx.run(query, name=name)
+        columns, reasons = normalize_listings([apartment], [district["postal_code"] for district in vienna_districts])
+        if reasons[0] >= 0:
+            return REJECTION_REASONS[reasons[0]]
+        for row in columns.rows():
+            self.backend.import_apartment(row)
 
     def clear_db(self):
-        with self.driver.session() as session:
-            session.run(f"USE {self.db_name} MATCH (n) DETACH DELETE n")
-
-    def get_data_for_embedding(self, file_path=""):
-        result = []
-        query = f'''
-                USE {self.db_name}
-                MATCH (a:Apartment)
-                MATCH (a)-[r:LOCATED_IN]->(d:District)
-                RETURN a.id AS subject, "LOCATED_IN" AS predicate, d.postal_code AS object;'''
-        with self.driver.session() as session:
-            graph_response = session.run(query)
-            result = pd.DataFrame([r.values() for r in graph_response], columns=graph_response.keys())
-        query = f'''
-                USE {self.db_name}
-                MATCH (a:Apartment)
-                MATCH (a)-[r:IN_PRICE_RANGE]->(p:PriceRange)
-                RETURN a.id AS subject, "IN_PRICE_RANGE" AS predicate, p.name AS object;'''
-        with self.driver.session() as session:
-            graph_response = session.run(query)
-            temp = pd.DataFrame([r.values() for r in graph_response], columns=graph_response.keys())
-        result = result.append(temp, ignore_index=True)
-        query = f'''
-                        USE {self.db_name}
-                        MATCH (a:Apartment)
-                        MATCH (a)-[r:OWNED_BY]->(o:Owner)
-                        RETURN a.id AS subject, "OWNED_BY" AS predicate, o.name AS object;'''
-        with self.driver.session() as session:
-            graph_response = session.run(query)
-            temp = pd.DataFrame([r.values() for r in graph_response], columns=graph_response.keys())
-        result = result.append(temp, ignore_index=True)
-        result["subject"] = result["subject"].astype(str)
-        result["object"] = result["object"].astype(str)
-        return result
+        self.backend.clear()
+
+    # Exports the apartment triples of the given relation types in one pass, optionally writing them to file_path
+    def get_data_for_embedding(self, file_path="", relations=EMBEDDING_RELATIONS):
+        triples = self.backend.read_triples(relations)
+        if file_path:
+            triples.save(file_path)
+        return triples.to_frame()
+
+
+# Stable content hash of a normalized apartment row
+def row_hash(row):
+    return hashlib.blake2b(json.dumps(row, sort_keys=True).encode('utf-8'), digest_size=12).hexdigest()
+
+
+vienna_districts = [
+    {"postal_code": 1010, "name": "Innere Stadt"},
+    {"postal_code": 1020, "name": "Leopoldstadt"},
+    {"postal_code": 1030, "name": "Landstraße"},
+    {"postal_code": 1040, "name": "Wieden"},
+    {"postal_code": 1050, "name": "Margareten"},
+    {"postal_code": 1060, "name": "Mariahilf"},
+    {"postal_code": 1070, "name": "Neubau"},
+    {"postal_code": 1080, "name": "Josefstadt"},
+    {"postal_code": 1090, "name": "Alsergrund"},
+    {"postal_code": 1100, "name": "Favoriten"},
+    {"postal_code": 1110, "name": "Simmering"},
+    {"postal_code": 1120, "name": "Meidling"},
+    {"postal_code": 1130, "name": "Hietzing"},
+    {"postal_code": 1140, "name": "Penzing"},
+    {"postal_code": 1150, "name": "Rudolfsheim-Fünfhaus"},
+    {"postal_code": 1160, "name": "Ottakring"},
+    {"postal_code": 1170, "name": "Hernals"},
+    {"postal_code": 1180, "name": "Währing"},
+    {"postal_code": 1190, "name": "Döbling"},
+    {"postal_code": 1200, "name": "Brigittenau"},
+    {"postal_code": 1210, "name": "Floridsdorf"},
+    {"postal_code": 1220, "name": "Donaustadt"},
+    {"postal_code": 1230, "name": "Liesing"}]
 
 
 if __name__ == "__main__":
     ag = ApartmentGraph()
     ag.clear_db()
-    ag.import_json("./result_for_db.json")
+    ag.import_json("./result_for_db.json", bulk=True)
     ag.close()
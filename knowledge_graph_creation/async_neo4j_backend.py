@@ -0,0 +1,51 @@
+from neo4j import AsyncGraphDatabase
+from knowledge_graph_creation.neo4j_backend import apartments_per_district_query, average_price_per_district_query, \
+    expensive_apartments_query, overcrowded_districts_query, owner_with_most_apartments_query
+from knowledge_graph_creation.query_recorder import QueryRecorder
+
+# Analytics of Neo4jBackend that AsyncNeo4jBackend answers as coroutines, with the Cypher of the same query helpers
+ASYNC_READS = ["average_price_per_district", "apartments_per_district", "expensive_apartments",
+               "overcrowded_districts", "owner_with_most_apartments"]
+
+
+# Reads over the Neo4j async driver. Every read opens its own session from a pool of up to max_connection_pool_size
+# connections, so independent reads gathered with asyncio run concurrently, each on its own connection.
+class AsyncNeo4jBackend:
+
+    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password", db_name="neo4j",
+                 max_connection_pool_size=16, connection_acquisition_timeout=60, queries=None):
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(user, password),
+                                                max_connection_pool_size=max_connection_pool_size,
+                                                connection_acquisition_timeout=connection_acquisition_timeout)
+        self.db_name = db_name
+        self.queries = queries or QueryRecorder()
+
+    # Connects to the database of a synchronous Neo4jBackend, recording into the same QueryRecorder
+    @classmethod
+    def from_backend(cls, backend, max_connection_pool_size=16):
+        return cls(backend.uri, *backend.auth, backend.db_name, max_connection_pool_size, queries=backend.queries)
+
+    async def close(self):
+        await self.driver.close()
+
+    async def read(self, name, query, **parameters):
+        async with self.driver.session(default_access_mode="READ") as session:
+            return await self.queries.run_async(session, name, query, parameters,
+                                                handle=lambda records: [record.data() for record in records])
+
+
+    async def average_price_per_district(self):
+        return await self.read("average_price_per_district", average_price_per_district_query(self.db_name))
+
+    async def apartments_per_district(self):
+        return await self.read("apartments_per_district", apartments_per_district_query(self.db_name))
+
+    async def expensive_apartments(self, factor=3):
+        return await self.read("expensive_apartments", expensive_apartments_query(self.db_name), factor=factor)
+
+    async def overcrowded_districts(self, max_average_rooms=2.3):
+        return await self.read("overcrowded_districts", overcrowded_districts_query(self.db_name),
+                               max_average_rooms=max_average_rooms)
+
+    async def owner_with_most_apartments(self):
+        return await self.read("owner_with_most_apartments", owner_with_most_apartments_query(self.db_name))
@@ -0,0 +1,11 @@
+from itertools import islice
+
+
+# Splits an iterable into lists of at most size items without materializing it
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
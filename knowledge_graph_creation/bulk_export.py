@@ -0,0 +1,197 @@
+import os
+import numpy as np
+import pandas as pd
+from knowledge_graph_creation.aggregates import AGGREGATE_PROPERTIES, Aggregates, contributions
+from knowledge_graph_creation.batching import batched
+from knowledge_graph_creation.price_buckets import assign_buckets
+from knowledge_graph_creation.spatial_index import neighbor_pairs
+
+# Aggregates that are sums over fractional values, rooms can be e.g. 2.5
+FRACTIONAL_AGGREGATES = {"price_sum_squares", "rooms_sum"}
+
+# Node files as label -> header. The unnamed :ID column holds the key the imports MERGE on, its id space is the
+# label, and the key is stored again as a typed property, so the ids are stable and the properties match the
+# transactional import.
+NODE_HEADERS = {
+    "District": [":ID(District)", "postal_code:long", "name"]
+                + [f"{name}:{'double' if name in FRACTIONAL_AGGREGATES else 'long'}" for name in AGGREGATE_PROPERTIES],
+    "Owner": [":ID(Owner)", "name"]
+             + [f"{name}:{'double' if name in FRACTIONAL_AGGREGATES else 'long'}" for name in AGGREGATE_PROPERTIES],
+    "Apartment": [":ID(Apartment)", "id", "price:long", "floor:long", "lon:double", "lat:double", "quality:long",
+                  "size:double", "number_of_rooms:double", "location:point{crs:WGS-84}"],
+    "PriceRange": [":ID(PriceRange)", "name", "min_price:long", "max_price:long"],
+}
+
+# Relationship files as type -> (start id space, end id space)
+RELATIONSHIP_TYPES = {
+    "LOCATED_IN": ("Apartment", "District"),
+    "OWNED_BY": ("Apartment", "Owner"),
+    "IN_PRICE_RANGE": ("Apartment", "PriceRange"),
+    "NEIGHBOR_OF": ("Apartment", "Apartment"),
+}
+
+
+def header_file(directory, name):
+    return os.path.join(directory, f"{name}.header.csv")
+
+
+def data_file(directory, name):
+    return os.path.join(directory, f"{name}.csv")
+
+
+def write_frame(path, frame):
+    frame.to_csv(path, mode='a', header=False, index=False)
+
+
+# Writes the CSV files of a neo4j-admin database import for the graph import_json builds from the same listings:
+# District, Owner, Apartment, LOCATED_IN and OWNED_BY, and with price_ranges given the PriceRange nodes and
+# IN_PRICE_RANGE edges, with neighbors the NEIGHBOR_OF edges add_neighbors would write for radius.
+# Apartments and their edges are appended batch by batch of normalized ListingColumns. Only the District and Owner
+# aggregates and, for neighbors, the id and coordinates of every apartment are kept until the end.
+class BulkCsvExporter:
+
+    def __init__(self, directory, districts, price_ranges=None, neighbors=False, radius=None, batch_size=100000):
+        self.directory = directory
+        self.districts = list(districts)
+        self.district_rows = {district["postal_code"]: row for row, district in enumerate(self.districts)}
+        self.owner_rows = {}
+        self.price_ranges = price_ranges
+        self.neighbors = neighbors
+        self.radius = radius
+        self.batch_size = batch_size
+        self.aggregates = {"District": Aggregates(), "Owner": Aggregates()}
+        self.points = []
+        self.counts = {}
+
+    def files(self):
+        names = ["District", "Owner", "Apartment", "LOCATED_IN", "OWNED_BY"]
+        if self.price_ranges is not None:
+            names += ["PriceRange", "IN_PRICE_RANGE"]
+        if self.neighbors:
+            names.append("NEIGHBOR_OF")
+        return names
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in self.files():
+            header = NODE_HEADERS.get(name)
+            if header is None:
+                start, end = RELATIONSHIP_TYPES[name]
+                header = [f":START_ID({start})", f":END_ID({end})"]
+            with open(header_file(self.directory, name), 'w', encoding='utf-8') as file:
+                file.write(",".join(header) + "\n")
+            open(data_file(self.directory, name), 'w', encoding='utf-8').close()
+            self.counts[name] = 0
+
+    def append(self, name, frame):
+        write_frame(data_file(self.directory, name), frame)
+        self.counts[name] += len(frame)
+
+    # Exports a stream of ListingColumns batches, e.g. normalization.iter_normalized, and returns the rows per file
+    def export(self, batches):
+        self.start()
+        for columns in batches:
+            self.add_batch(columns)
+        self.finish()
+        return self.counts
+
+    def add_batch(self, columns):
+        has_location = ~(np.isnan(columns.lon) | np.isnan(columns.lat))
+        location = np.where(has_location, [f"{{longitude:{lon!r},latitude:{lat!r}}}" for lon, lat
+                                           in zip(columns.lon.tolist(), columns.lat.tolist())], "")
+        self.append("Apartment", pd.DataFrame({
+            "key": columns.ids, "id": columns.ids, "price": columns.price, "floor": columns.floor,
+            "lon": columns.lon, "lat": columns.lat, "quality": columns.quality, "size": columns.size,
+            "number_of_rooms": columns.number_of_rooms, "location": location}))
+
+        postal_codes = np.asarray(columns.postcode)
+        self.append("LOCATED_IN", pd.DataFrame({"start": columns.ids, "end": postal_codes}))
+        owned = columns.owner.codes >= 0
+        owners = np.asarray(columns.owner)[owned]
+        self.append("OWNED_BY", pd.DataFrame({"start": columns.ids[owned], "end": owners}))
+
+        apartments = {"price": (columns.price, np.ones(len(columns), dtype=bool)),
+                      "number_of_rooms": (columns.number_of_rooms, np.ones(len(columns), dtype=bool))}
+        rows = np.arange(len(columns))
+        district_rows = np.array([self.district_rows[code] for code in postal_codes.tolist()], dtype=np.int64)
+        self.aggregates["District"].add(district_rows, contributions(apartments, rows))
+        owner_rows = np.array([self.owner_rows.setdefault(name, len(self.owner_rows)) for name in owners.tolist()],
+                              dtype=np.int64)
+        self.aggregates["Owner"].add(owner_rows, contributions(apartments, rows[owned]))
+
+        if self.price_ranges is not None:
+            names, buckets = assign_buckets(columns.price.astype(np.float64), np.ones(len(columns), dtype=bool),
+                                            self.price_ranges)
+            ranged = buckets >= 0
+            self.append("IN_PRICE_RANGE", pd.DataFrame({"start": columns.ids[ranged],
+                                                        "end": np.array(names, dtype=object)[buckets[ranged]]}))
+        if self.neighbors:
+            self.points += zip(columns.ids[has_location].tolist(), columns.lon[has_location].tolist(),
+                               columns.lat[has_location].tolist())
+
+    # Nodes that aggregate over apartments carry the aggregate properties only once an apartment was linked to
+    # them, like the ON CREATE SET of the import; the others are written with empty aggregate columns
+    def aggregate_frame(self, label, keys):
+        values = self.aggregates[label].values
+        values = np.pad(values, ((0, 0), (0, max(0, len(keys) - values.shape[1]))))
+        linked = values[AGGREGATE_PROPERTIES.index("apartment_count")] > 0
+        frame = {}
+        for index, name in enumerate(AGGREGATE_PROPERTIES):
+            column = values[index] if name in FRACTIONAL_AGGREGATES else values[index].astype(np.int64)
+            frame[name] = pd.Series(column).where(linked)
+            if name not in FRACTIONAL_AGGREGATES:
+                frame[name] = frame[name].astype("Int64")
+        return pd.DataFrame(frame)
+
+    def finish(self):
+        postal_codes = [district["postal_code"] for district in self.districts]
+        districts = pd.DataFrame({"key": postal_codes, "postal_code": postal_codes,
+                                  "name": [district["name"] for district in self.districts]})
+        self.append("District", pd.concat([districts, self.aggregate_frame("District", postal_codes)], axis=1))
+        owners = list(self.owner_rows)
+        self.append("Owner", pd.concat([pd.DataFrame({"key": owners, "name": owners}),
+                                        self.aggregate_frame("Owner", owners)], axis=1))
+        if self.price_ranges is not None:
+            self.append("PriceRange", pd.DataFrame(
+                [(name, name, low, high) for name, (low, high) in self.price_ranges.items()],
+                columns=["key", "name", "min_price", "max_price"]))
+        if self.neighbors:
+            for batch in batched(neighbor_pairs(self.points, self.radius), self.batch_size):
+                self.append("NEIGHBOR_OF", pd.DataFrame(batch, columns=["start", "end"]))
+            self.points = []
+
+    # Arguments of neo4j-admin for a full import of the exported files into database. The import only works on a
+    # new or overwritten database and creates no constraints or indexes, run Neo4jBackend.ensure_schema afterwards.
+    def command(self, database="neo4j"):
+        arguments = ["neo4j-admin", "database", "import", "full", database, "--overwrite-destination=true"]
+        for name in self.files():
+            kind = "relationships" if name in RELATIONSHIP_TYPES else "nodes"
+            arguments.append(f"--{kind}={name}={header_file(self.directory, name)},{data_file(self.directory, name)}")
+        return arguments
+
+
+# Reads an export back as {"nodes": {label: {id: properties}}, "relationships": {type: {(start id, end id)}}}
+# with the property types of the headers and missing values left out, to compare it with an imported graph
+def read_export(directory):
+    graph = {"nodes": {}, "relationships": {}}
+    converters = {"long": int, "double": float}
+    for name in list(NODE_HEADERS) + list(RELATIONSHIP_TYPES):
+        if not os.path.exists(header_file(directory, name)):
+            continue
+        with open(header_file(directory, name), 'r', encoding='utf-8') as file:
+            header = file.readline().rstrip("\n").split(",")
+        frame = pd.read_csv(data_file(directory, name), header=None, names=range(len(header)), dtype=str,
+                            keep_default_na=False)
+        if name in RELATIONSHIP_TYPES:
+            graph["relationships"][name] = set(zip(frame[0], frame[1]))
+            continue
+        nodes = graph["nodes"][name] = {}
+        for values in frame.itertuples(index=False):
+            properties = {}
+            for column, value in zip(header[1:], values[1:]):
+                if value == "":
+                    continue
+                key, _, kind = column.partition(":")
+                properties[key] = converters.get(kind, str)(value)
+            nodes[values[0]] = properties
+    return graph
@@ -1,15 +1,15 @@
-import json
-from os import listdir
-from os.path import isfile, join
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 
+from knowledge_graph_creation.listings_io import iter_listings, write_listings
 
-filePaths = [".\\data_from_willhaben.json"]
 
-exportData = []
-
-properties = [
-	"coordinates", 
-	"postcode", 
+properties = frozenset([
+	"coordinates",
+	"postcode",
 	"id",
 	"orgname",
 
@@ -17,34 +17,65 @@ properties = [
 	"number_of_rooms",
 	"location_quality",
 	"estate_size",
-	"estate_size/living_area", 
+	"estate_size/living_area",
 	"rooms",
 
 	"price",
 
 	"published",
-]
-
-for filePath in filePaths:
-	print(filePath)
-	with open(filePath) as file:
-		data = json.load(file)
-		for advert in data:
-			objData = {}
-			for attribute in advert:
-				if attribute in properties:
-					objData[attribute] = advert[attribute]
-
-			if 'coordinates' not in objData:
-				continue
-
-			latLon = objData['coordinates'].split(",")
-
-			objData['lat'] = latLon[0]
-			objData['lon'] = latLon[1]
-			del objData['coordinates']
-		
-			exportData.append(objData)
-			
-with open('result_for_db.json', 'w') as file:
-	json.dump(exportData, file)
+])
+
+# Keeps the attributes of an advert that go into the graph and splits its coordinates,
+# returns None for adverts without coordinates
+def extract_advert(advert):
+	objData = {attribute: value for attribute, value in advert.items() if attribute in properties}
+
+	if 'coordinates' not in objData:
+		return None
+
+	latLon = objData.pop('coordinates').split(",")
+
+	objData['lat'] = latLon[0]
+	objData['lon'] = latLon[1]
+	return objData
+
+def extract_file(filePath):
+	return [objData for objData in map(extract_advert, iter_listings(filePath)) if objData is not None]
+
+# Orders page files like 1.json, 2.json, ..., 10.json the way the crawler numbered them
+def natural_key(filePath):
+	return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', filePath)]
+
+def expand(patterns):
+	filePaths = []
+	for pattern in patterns:
+		filePaths.extend(sorted(glob.glob(pattern), key=natural_key) or [pattern])
+	return list(dict.fromkeys(filePaths))
+
+# Extracts the page files in a process pool and yields the adverts in file order,
+# an advert id that was already yielded from an earlier page is skipped
+def extract(filePaths, workers=None):
+	seen = set()
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		for adverts in executor.map(extract_file, filePaths, chunksize=max(1, len(filePaths) // (8 * (workers or os.cpu_count() or 1)))):
+			for objData in adverts:
+				if 'id' in objData:
+					if objData['id'] in seen:
+						continue
+					seen.add(objData['id'])
+				yield objData
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Extract the graph attributes of willhaben crawler page files")
+	parser.add_argument("patterns", nargs="+", help="page files or glob patterns, e.g. 'pages/*.json'")
+	parser.add_argument("-o", "--output", default="result_for_db.jsonl",
+						help="JSON Lines output, a .json path writes a JSON array instead")
+	parser.add_argument("-w", "--workers", type=int, default=None)
+	args = parser.parse_args(argv)
+
+	filePaths = expand(args.patterns)
+	count = write_listings(args.output, extract(filePaths, args.workers))
+	print(f"Extracted {count} adverts from {len(filePaths)} files to {args.output}")
+
+if __name__ == "__main__":
+	main()
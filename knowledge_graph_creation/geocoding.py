@@ -0,0 +1,155 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# Interface for reverse geocoders, returns the address for a coordinate or None if there is none
+class Geocoder:
+
+    def reverse(self, lat, lon):
+        raise NotImplementedError
+
+
+class NominatimGeocoder(Geocoder):
+
+    def __init__(self, user_agent="address_converter", timeout=10):
+        from geopy.geocoders import Nominatim
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    def reverse(self, lat, lon):
+        location = self.geolocator.reverse(f'''{lat}, {lon}''')
+        return None if location is None else location.address
+
+
+# In-memory geocoder that answers from a {(lat, lon): name} dict and counts its calls, e.g. to check without the
+# Nominatim service that a rerun over the same apartments is answered from the cache alone
+class DictGeocoder(Geocoder):
+
+    def __init__(self, addresses=None):
+        self.addresses = dict(addresses or {})
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def reverse(self, lat, lon):
+        with self.lock:
+            self.calls += 1
+        return self.addresses.get((lat, lon))
+
+
+# Spaces out calls over all threads so that at most calls_per_second calls are started per second
+class RateLimiter:
+
+    def __init__(self, calls_per_second):
+        self.interval = 1.0 / calls_per_second if calls_per_second else 0.0
+        self.lock = threading.Lock()
+        self.next_call = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_call)
+            self.next_call = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+# On-disk cache of reverse geocoding results keyed by coordinates rounded to precision decimals.
+# Entries older than ttl seconds are ignored and the least recently used ones are evicted above max_entries.
+class GeocodingCache:
+
+    def __init__(self, path="geocoding_cache.sqlite", precision=6, ttl=None, max_entries=None):
+        self.precision = precision
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS addresses (
+                lat_key INTEGER NOT NULL,
+                lon_key INTEGER NOT NULL,
+                name TEXT,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (lat_key, lon_key))''')
+        self.connection.execute("CREATE INDEX IF NOT EXISTS addresses_accessed_at ON addresses (accessed_at)")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def key(self, lat, lon):
+        scale = 10 ** self.precision
+        return round(lat * scale), round(lon * scale)
+
+    # Returns {key: name} for all keys that are cached and not expired, a cached name can be None
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        for key in keys:
+            row = self.connection.execute(
+                "SELECT name, created_at FROM addresses WHERE lat_key = ? AND lon_key = ?", key).fetchone()
+            if row is None or (self.ttl is not None and row[1] < now - self.ttl):
+                continue
+            found[key] = row[0]
+        self.connection.executemany("UPDATE addresses SET accessed_at = ? WHERE lat_key = ? AND lon_key = ?",
+                                    [(now, *key) for key in found])
+        self.connection.commit()
+        return found
+
+    def put_many(self, entries):
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO addresses (lat_key, lon_key, name, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            [(*key, name, now, now) for key, name in entries.items()])
+        self.evict(now)
+        self.connection.commit()
+
+    def evict(self, now=None):
+        now = time.time() if now is None else now
+        if self.ttl is not None:
+            self.connection.execute("DELETE FROM addresses WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            self.connection.execute('''
+                DELETE FROM addresses WHERE rowid IN (
+                    SELECT rowid FROM addresses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)''',
+                                    (self.max_entries,))
+
+
+# Resolves the address names of (lat, lon) coordinates. Cached coordinates are answered from the cache,
+# the remaining ones are looked up once per rounded coordinate by a bounded, rate limited worker pool.
+def reverse_geocode(coordinates, geocoder, cache, max_workers=4, calls_per_second=1.0):
+    keys = {}
+    for lat, lon in coordinates:
+        keys.setdefault(cache.key(lat, lon), (lat, lon))
+    names = cache.get_many(keys)
+    missing = [key for key in keys if key not in names]
+
+    rate_limiter = RateLimiter(calls_per_second)
+
+    def lookup(key):
+        rate_limiter.wait()
+        lat, lon = keys[key]
+        return geocoder.reverse(lat, lon)
+
+    if missing:
+        looked_up = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(lookup, key): key for key in missing}
+            for future in as_completed(futures):
+                try:
+                    looked_up[futures[future]] = future.result()
+                except Exception as e:
+                    error = error or e
+        # keep what was resolved so a rerun after a failure only looks up the rest
+        cache.put_many(looked_up)
+        if error is not None:
+            raise error
+        names.update(looked_up)
+    return {coordinate: names[cache.key(*coordinate)] for coordinate in coordinates}
@@ -0,0 +1,122 @@
+# Storage operations ApartmentGraph and ApartmentReasoner run against. Apartment rows are the dicts
+# built by normalization.ListingColumns.rows, read operations return the same shapes as the Cypher records'
+# data() of the Neo4j backend, so callers don't need to know which backend they are talking to.
+class GraphBackend:
+
+    def close(self):
+        pass
+
+    # Names the graph the backend stores, so data cached from it isn't reused for another database or backend
+    def identity(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    # Creates the uniqueness constraints and indexes of schema.py that are missing, safe to run before every import.
+    # Backends without a query planner have nothing to create.
+    def ensure_schema(self):
+        pass
+
+    def drop_schema(self):
+        pass
+
+    # Context manager under which the read operations only collect the query plans they would run, in the
+    # list it yields, and return empty results
+    def explain(self):
+        raise NotImplementedError
+
+    def import_districts(self, districts):
+        raise NotImplementedError
+
+    # Same semantics as importing the rows one after another with import_apartment
+    def import_apartments(self, rows, batch_size=1000):
+        count = 0
+        for row in rows:
+            self.import_apartment(row)
+            count += 1
+        return count
+
+    def import_apartment(self, row):
+        raise NotImplementedError
+
+    # Like import_apartments, but properties of existing apartments are overwritten and their
+    # LOCATED_IN / OWNED_BY edges are replaced by the ones of the row
+    def upsert_apartments(self, rows, batch_size=1000):
+        raise NotImplementedError
+
+    # Deletes the apartments and their edges. With tombstone the node is kept as RemovedApartment with a
+    # removed_at timestamp, detached from the rest of the graph.
+    def remove_apartments(self, apartment_ids, tombstone=False):
+        raise NotImplementedError
+
+    # Deletes the edges of the given relation types that start or end at one of the apartments
+    def delete_relationships(self, apartment_ids, relations):
+        raise NotImplementedError
+
+    # Returns (id, lon, lat) of all apartments with coordinates
+    def apartment_coordinates(self):
+        raise NotImplementedError
+
+    # Merges NEIGHBOR_OF edges for (apartment id, apartment id) pairs
+    def merge_neighbors(self, pairs, batch_size=10000):
+        raise NotImplementedError
+
+    # Merges Address nodes from dicts with name, lon, lat and apartment_ids and links the apartments to them
+    def merge_addresses(self, addresses):
+        raise NotImplementedError
+
+    # Sets property of the nodes of the label whose key property is one of keys to the matching row of vectors
+    def write_embeddings(self, label, key, keys, vectors, property="sage_embeddings", batch_size=1000):
+        raise NotImplementedError
+
+    # Returns (ids, prices, valid) arrays of all apartments, or only of the given ones, prices as float64
+    def read_prices(self, apartment_ids=None):
+        raise NotImplementedError
+
+    # Returns the name -> (min_price, max_price) definitions of the PriceRange nodes and an apartment id -> range name
+    # dict of the IN_PRICE_RANGE edges, of all apartments or only the given ones
+    def read_price_ranges(self, apartment_ids=None):
+        raise NotImplementedError
+
+    # Merges a PriceRange node for every name -> (min, max) entry, deletes the ones not in price_ranges and replaces
+    # the IN_PRICE_RANGE edges of the (apartment id, range name or None) assignments
+    def write_price_ranges(self, price_ranges, assignments, batch_size=10000):
+        raise NotImplementedError
+
+    # Returns a TripleBuffer with (apartment id, relation type, district postal code or node name) triples
+    def read_triples(self, relations):
+        raise NotImplementedError
+
+    # Returns an analytics.ApartmentSnapshot of the apartment, district and owner columns,
+    # with the NEIGHBOR_OF edges only if neighbors is set
+    def read_snapshot(self, neighbors=False):
+        raise NotImplementedError
+
+    # District and Owner nodes carry aggregates.AGGREGATE_PROPERTIES over the apartments linked to them, kept up to
+    # date by the import, upsert and remove operations. rebuild_aggregates recomputes them all, e.g. for a graph
+    # imported before they existed; check_aggregates compares them with a full recompute and returns the mismatches.
+    def rebuild_aggregates(self):
+        raise NotImplementedError
+
+    def check_aggregates(self):
+        raise NotImplementedError
+
+    # Number of District and Owner nodes with apartments linked to them but no aggregates
+    def stale_aggregates(self):
+        raise NotImplementedError
+
+    def average_price_per_district(self):
+        raise NotImplementedError
+
+    def apartments_per_district(self):
+        raise NotImplementedError
+
+    def expensive_apartments(self, factor=3):
+        raise NotImplementedError
+
+    def overcrowded_districts(self, max_average_rooms=2.3):
+        raise NotImplementedError
+
+    def owner_with_most_apartments(self):
+        raise NotImplementedError
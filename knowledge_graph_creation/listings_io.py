@@ -0,0 +1,105 @@
+import json
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+
+# Sliding text window over a file, only the unconsumed part of the last chunks is kept in memory
+class _ChunkBuffer:
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return None
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # a number or literal at the end of the window might continue in the next chunk
+            if end == len(self.text) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_array(buffer):
+    buffer.pos += 1
+    if buffer.peek() == "]":
+        return
+    while True:
+        yield buffer.decode()
+        char = buffer.peek()
+        if char == ",":
+            buffer.pos += 1
+        elif char == "]":
+            return
+        else:
+            raise ValueError(f"Expected ',' or ']' in listing array, got {char!r}")
+
+
+def _iter_lines(buffer):
+    while buffer.peek() is not None:
+        yield buffer.decode()
+
+
+# Yields the listings of a crawler dump one at a time, so memory does not grow with the file size.
+# Works for a top-level JSON array as written by json.dump and for JSON Lines files.
+def iter_listings(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer = _ChunkBuffer(file, chunk_size)
+        first = buffer.peek()
+        if first is None:
+            return
+        if first == "[":
+            yield from _iter_array(buffer)
+        else:
+            yield from _iter_lines(buffer)
+
+
+# Writes listings as they come in, as JSON Lines for .jsonl/.ndjson paths and as a JSON array otherwise
+def write_listings(path, listings):
+    count = 0
+    json_lines = path.endswith(".jsonl") or path.endswith(".ndjson")
+    with open(path, 'w', encoding='utf-8') as file:
+        if not json_lines:
+            file.write("[")
+        for listing in listings:
+            if json_lines:
+                file.write(json.dumps(listing))
+                file.write("\n")
+            else:
+                if count:
+                    file.write(", ")
+                file.write(json.dumps(listing))
+            count += 1
+        if not json_lines:
+            file.write("]")
+    return count
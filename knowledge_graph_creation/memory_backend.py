@@ -0,0 +1,437 @@
+import time
+import numpy as np
+from knowledge_graph_creation.aggregates import AGGREGATED_RELATIONS, Aggregates, contributions
+from knowledge_graph_creation.analytics import APARTMENT_PROPERTIES, AnalyticsEngine, ApartmentSnapshot
+from knowledge_graph_creation.batching import batched
+from knowledge_graph_creation.graph_backend import GraphBackend
+from knowledge_graph_creation.triple_export import TripleBuffer
+
+INITIAL_CAPACITY = 1024
+
+
+# Growable NumPy column with a validity mask for missing values. Integer columns are promoted
+# to float64 when a non-integral number arrives, so values read back keep their Python type.
+class Column:
+
+    def __init__(self, dtype=np.int64):
+        self.values = np.zeros(INITIAL_CAPACITY, dtype=dtype)
+        self.valid = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self.size = 0
+
+    @classmethod
+    def from_arrays(cls, values, valid=None):
+        column = cls(values.dtype)
+        column.values = np.array(values)
+        column.valid = np.ones(len(values), dtype=bool) if valid is None else np.array(valid)
+        column.size = len(values)
+        return column
+
+    def __len__(self):
+        return self.size
+
+    def append(self, value):
+        if self.size == len(self.values):
+            self.values = np.resize(self.values, max(2 * len(self.values), INITIAL_CAPACITY))
+            self.valid = np.resize(self.valid, max(2 * len(self.valid), INITIAL_CAPACITY))
+        self.size += 1
+        self.set(self.size - 1, value)
+
+    def set(self, row, value):
+        if value is None:
+            self.valid[row] = False
+            return
+        if self.values.dtype == np.int64 and not isinstance(value, (int, np.integer)):
+            self.values = self.values.astype(np.float64 if isinstance(value, (float, np.floating)) else object)
+        elif self.values.dtype == np.float64 and not isinstance(value, (int, float, np.number)):
+            self.values = self.values.astype(object)
+        self.values[row] = value
+        self.valid[row] = True
+
+    def get(self, row):
+        if not self.valid[row]:
+            return None
+        value = self.values[row]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def array(self):
+        return self.values[:self.size]
+
+    def mask(self):
+        return self.valid[:self.size]
+
+
+# Node table with one column per property, rows are looked up by the MERGE key property
+class NodeTable:
+
+    def __init__(self, key, properties):
+        self.key = key
+        self.columns = {name: Column(dtype) for name, dtype in properties.items()}
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row(self, key):
+        return self.rows.get(key)
+
+    # MERGE on the key, properties are only set when the node is created
+    def merge(self, key, properties=None):
+        row = self.rows.get(key)
+        if row is not None:
+            return row, False
+        row = len(self.rows)
+        self.rows[key] = row
+        properties = dict(properties or {}, **{self.key: key})
+        for name, column in self.columns.items():
+            column.append(properties.get(name))
+        return row, True
+
+    def update(self, row, properties):
+        for name, value in properties.items():
+            self.columns[name].set(row, value)
+
+    # Keeps only the rows where keep is True and returns the old to new row mapping, -1 for dropped rows
+    def compact(self, keep):
+        remap = np.full(len(keep), -1, dtype=np.int64)
+        remap[keep] = np.arange(int(keep.sum()))
+        for name, column in self.columns.items():
+            self.columns[name] = Column.from_arrays(column.array()[keep], column.mask()[keep])
+        self.rows = {key: row for row, key in enumerate(self.columns[self.key].array())}
+        return remap
+
+    def node(self, row):
+        return {name: value for name, value in ((name, column.get(row)) for name, column in self.columns.items())
+                if value is not None}
+
+    def column(self, name):
+        return self.columns[name].array()
+
+    def mask(self, name):
+        return self.columns[name].mask()
+
+
+# Typed edges between two node tables, kept as source/target row columns plus a CSR view for traversals
+class EdgeTable:
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.sources = Column()
+        self.targets = Column()
+        self.pairs = set()
+        self.csr_cache = None
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def merge(self, source_row, target_row):
+        if (source_row, target_row) in self.pairs:
+            return False
+        self.pairs.add((source_row, target_row))
+        self.sources.append(source_row)
+        self.targets.append(target_row)
+        self.csr_cache = None
+        return True
+
+    def arrays(self):
+        return self.sources.array(), self.targets.array()
+
+    def filter(self, keep):
+        sources, targets = self.arrays()
+        self.sources = Column.from_arrays(sources[keep])
+        self.targets = Column.from_arrays(targets[keep])
+        self.pairs = set(zip(self.sources.array().tolist(), self.targets.array().tolist()))
+        self.csr_cache = None
+
+    # Drops the edges touching the given source or target rows
+    def remove(self, source_rows=(), target_rows=()):
+        sources, targets = self.arrays()
+        self.filter(~(np.isin(sources, list(source_rows)) | np.isin(targets, list(target_rows))))
+
+    # Moves edges to new row numbers after a NodeTable.compact, edges to dropped rows are removed
+    def remap(self, source_remap=None, target_remap=None):
+        sources, targets = self.arrays()
+        sources = sources if source_remap is None else source_remap[sources]
+        targets = targets if target_remap is None else target_remap[targets]
+        keep = (sources >= 0) & (targets >= 0)
+        self.sources = Column.from_arrays(sources)
+        self.targets = Column.from_arrays(targets)
+        self.filter(keep)
+
+    # Returns (indptr, indices) so that the targets of source row i are indices[indptr[i]:indptr[i + 1]]
+    def csr(self):
+        if self.csr_cache is None:
+            sources, targets = self.arrays()
+            order = np.argsort(sources, kind='stable')
+            counts = np.bincount(sources, minlength=len(self.source))
+            self.csr_cache = np.concatenate([[0], np.cumsum(counts)]), targets[order]
+        return self.csr_cache
+
+
+# In-process graph of districts, owners, apartments and their typed edges, for running the pipeline
+# and profiling it without a Neo4j server
+class MemoryBackend(GraphBackend):
+
+    def __init__(self):
+        self.clear()
+
+    def identity(self):
+        return "memory"
+
+    def clear(self):
+        self.nodes = {
+            "District": NodeTable("postal_code", {"postal_code": np.int64, "name": object}),
+            "Owner": NodeTable("name", {"name": object}),
+            "Apartment": NodeTable("id", {"id": object, "price": np.int64, "floor": np.int64, "lon": np.float64,
+                                          "lat": np.float64, "quality": np.int64, "size": np.int64,
+                                          "number_of_rooms": np.int64}),
+            "PriceRange": NodeTable("name", {"name": object, "min_price": np.int64, "max_price": np.int64}),
+            "Address": NodeTable("name", {"name": object, "lon": np.float64, "lat": np.float64}),
+        }
+        self.edges = {
+            "LOCATED_IN": EdgeTable(self.nodes["Apartment"], self.nodes["District"]),
+            "OWNED_BY": EdgeTable(self.nodes["Apartment"], self.nodes["Owner"]),
+            "NEIGHBOR_OF": EdgeTable(self.nodes["Apartment"], self.nodes["Apartment"]),
+            "IN_PRICE_RANGE": EdgeTable(self.nodes["Apartment"], self.nodes["PriceRange"]),
+            "LOCATED_AT_ADDRESS": EdgeTable(self.nodes["Apartment"], self.nodes["Address"]),
+        }
+        self.tombstones = {}
+        self.aggregates = {label: Aggregates() for label in AGGREGATED_RELATIONS.values()}
+
+    def import_districts(self, districts):
+        for district in districts:
+            self.nodes["District"].merge(district["postal_code"], {"name": district["name"]})
+
+    def import_apartment(self, row):
+        owner_row = None
+        if row["owner_name"] is not None:
+            owner_row, _ = self.nodes["Owner"].merge(row["owner_name"])
+        district_row = self.nodes["District"].row(row["postal_code"])
+        if district_row is None:
+            return
+        apartment_row, _ = self.nodes["Apartment"].merge(row["apartment_id"], {
+            "price": row["price"], "floor": row["floor"], "lon": row["lon"], "lat": row["lat"],
+            "quality": row["quality"], "size": row["size"], "number_of_rooms": row["number_of_rooms"]})
+        if owner_row is not None and self.edges["OWNED_BY"].merge(apartment_row, owner_row):
+            self.link_aggregates("OWNED_BY", apartment_row, owner_row)
+        if self.edges["LOCATED_IN"].merge(apartment_row, district_row):
+            self.link_aggregates("LOCATED_IN", apartment_row, district_row)
+
+    def link_aggregates(self, relation, apartment_row, target_row):
+        columns = self.nodes["Apartment"].columns
+        self.aggregates[AGGREGATED_RELATIONS[relation]].add_one(
+            target_row, columns["price"].get(apartment_row), columns["number_of_rooms"].get(apartment_row))
+
+    # Takes the apartments out of the aggregates of the nodes their edges of the given relations point to,
+    # before the edges are removed
+    def unlink_aggregates(self, apartment_rows, relations=tuple(AGGREGATED_RELATIONS)):
+        apartments = self.nodes["Apartment"]
+        columns = {name: (apartments.column(name), apartments.mask(name)) for name in ("price", "number_of_rooms")}
+        for relation in relations:
+            if relation in AGGREGATED_RELATIONS:
+                sources, targets = self.edges[relation].arrays()
+                selected = np.isin(sources, apartment_rows)
+                self.aggregates[AGGREGATED_RELATIONS[relation]].add(
+                    targets[selected], contributions(columns, sources[selected]), sign=-1)
+
+    # Like import_apartments, but properties of existing apartments are overwritten and their
+    # LOCATED_IN / OWNED_BY edges are replaced by the ones of the row
+    def upsert_apartments(self, rows, batch_size=1000):
+        apartments = self.nodes["Apartment"]
+        count = 0
+        for batch in batched(rows, batch_size):
+            existing = [row for row in (apartments.row(r["apartment_id"]) for r in batch) if row is not None]
+            if existing:
+                self.unlink_aggregates(existing)
+                self.edges["LOCATED_IN"].remove(source_rows=existing)
+                self.edges["OWNED_BY"].remove(source_rows=existing)
+            for row in batch:
+                apartment_row = apartments.row(row["apartment_id"])
+                if apartment_row is not None:
+                    apartments.update(apartment_row, {
+                        "price": row["price"], "floor": row["floor"], "lon": row["lon"], "lat": row["lat"],
+                        "quality": row["quality"], "size": row["size"], "number_of_rooms": row["number_of_rooms"]})
+                self.import_apartment(row)
+            count += len(batch)
+        return count
+
+    def remove_apartments(self, apartment_ids, tombstone=False):
+        apartments = self.nodes["Apartment"]
+        rows = [row for row in (apartments.row(apartment_id) for apartment_id in apartment_ids) if row is not None]
+        if not rows:
+            return 0
+        if tombstone:
+            removed_at = int(time.time() * 1000)
+            for row in rows:
+                self.tombstones[apartments.columns["id"].get(row)] = dict(apartments.node(row), removed_at=removed_at)
+        self.unlink_aggregates(rows)
+        keep = np.ones(len(apartments), dtype=bool)
+        keep[rows] = False
+        remap = apartments.compact(keep)
+        for edges in self.edges.values():
+            edges.remap(remap if edges.source is apartments else None, remap if edges.target is apartments else None)
+        return len(rows)
+
+    def delete_relationships(self, apartment_ids, relations):
+        apartments = self.nodes["Apartment"]
+        rows = [row for row in (apartments.row(apartment_id) for apartment_id in apartment_ids) if row is not None]
+        self.unlink_aggregates(rows, relations)
+        for relation in relations:
+            edges = self.edges[relation]
+            edges.remove(source_rows=rows, target_rows=rows if edges.target is apartments else ())
+
+    def apartment_coordinates(self):
+        apartments = self.nodes["Apartment"]
+        rows = np.flatnonzero(apartments.mask("lon") & apartments.mask("lat"))
+        ids = apartments.column("id")
+        lons = apartments.column("lon")
+        lats = apartments.column("lat")
+        return [(ids[row], float(lons[row]), float(lats[row])) for row in rows]
+
+    def merge_neighbors(self, pairs, batch_size=10000):
+        apartments = self.nodes["Apartment"]
+        count = 0
+        for first, second in pairs:
+            first_row, second_row = apartments.row(first), apartments.row(second)
+            if first_row is not None and second_row is not None:
+                self.edges["NEIGHBOR_OF"].merge(first_row, second_row)
+            count += 1
+        return count
+
+    def merge_addresses(self, addresses):
+        apartments = self.nodes["Apartment"]
+        for address in addresses:
+            address_row, _ = self.nodes["Address"].merge(address["name"], {"lon": address["lon"],
+                                                                           "lat": address["lat"]})
+            for apartment_id in address["apartment_ids"]:
+                apartment_row = apartments.row(apartment_id)
+                if apartment_row is not None:
+                    self.edges["LOCATED_AT_ADDRESS"].merge(apartment_row, address_row)
+
+    # The vectors become an object column of the node table, as lists of floats like Neo4j returns them
+    def write_embeddings(self, label, key, keys, vectors, property="sage_embeddings", batch_size=1000):
+        table = self.nodes[label]
+        if property not in table.columns:
+            table.columns[property] = Column.from_arrays(np.empty(len(table), dtype=object),
+                                                         np.zeros(len(table), dtype=bool))
+        rows = {value: row for row, value in enumerate(table.column(key).tolist())}
+        count = 0
+        for value, vector in zip(keys, np.asarray(vectors).tolist()):
+            row = rows.get(value)
+            if row is not None:
+                table.columns[property].set(row, vector)
+                count += 1
+        return count
+
+    def apartment_rows(self, apartment_ids=None):
+        apartments = self.nodes["Apartment"]
+        if apartment_ids is None:
+            return np.arange(len(apartments))
+        return np.array([row for row in map(apartments.row, apartment_ids) if row is not None], dtype=np.int64)
+
+    def read_prices(self, apartment_ids=None):
+        apartments = self.nodes["Apartment"]
+        rows = self.apartment_rows(apartment_ids)
+        return (apartments.column("id")[rows], apartments.column("price")[rows].astype(np.float64),
+                apartments.mask("price")[rows])
+
+    def read_price_ranges(self, apartment_ids=None):
+        ranges = self.nodes["PriceRange"]
+        definitions = {ranges.columns["name"].get(row): (ranges.columns["min_price"].get(row),
+                                                         ranges.columns["max_price"].get(row))
+                       for row in range(len(ranges))}
+        sources, targets = self.edges["IN_PRICE_RANGE"].arrays()
+        if apartment_ids is not None:
+            selected = np.isin(sources, self.apartment_rows(apartment_ids))
+            sources, targets = sources[selected], targets[selected]
+        return definitions, dict(zip(self.nodes["Apartment"].column("id")[sources].tolist(),
+                                     ranges.column("name")[targets].tolist()))
+
+    def write_price_ranges(self, price_ranges, assignments, batch_size=10000):
+        ranges = self.nodes["PriceRange"]
+        keep = np.array([name in price_ranges for name in ranges.column("name")], dtype=bool)
+        if not keep.all():
+            self.edges["IN_PRICE_RANGE"].remap(target_remap=ranges.compact(keep))
+        range_rows = {}
+        for name, (min_price, max_price) in price_ranges.items():
+            range_rows[name], _ = ranges.merge(name)
+            ranges.update(range_rows[name], {"min_price": min_price, "max_price": max_price})
+        apartments = self.nodes["Apartment"]
+        rows = [apartments.row(apartment_id) for apartment_id, _ in assignments]
+        self.edges["IN_PRICE_RANGE"].remove(source_rows=[row for row in rows if row is not None])
+        for row, (_, name) in zip(rows, assignments):
+            if row is not None and name is not None:
+                self.edges["IN_PRICE_RANGE"].merge(row, range_rows[name])
+        return len(assignments)
+
+    # Mirrors coalesce(o.postal_code, o.name) of the Cypher export
+    def node_label(self, table, row):
+        for name in ("postal_code", "name"):
+            if name in table.columns and table.columns[name].valid[row]:
+                return table.columns[name].get(row)
+        return None
+
+    def read_triples(self, relations):
+        triples = TripleBuffer(sum(len(self.edges[relation]) for relation in relations if relation in self.edges))
+        apartment_ids = self.nodes["Apartment"].column("id")
+        for relation in relations:
+            if relation not in self.edges:
+                continue
+            edges = self.edges[relation]
+            labels = [self.node_label(edges.target, row) for row in range(len(edges.target))]
+            for source_row, target_row in zip(*edges.arrays()):
+                triples.append(apartment_ids[source_row], relation, labels[target_row])
+        return triples
+
+    # Zero-copy snapshot of the column tables for the analytics engine
+    def read_snapshot(self, neighbors=False):
+        apartments = self.nodes["Apartment"]
+        districts = self.nodes["District"]
+        return ApartmentSnapshot(
+            {name: (apartments.column(name), apartments.mask(name)) for name in APARTMENT_PROPERTIES},
+            districts.column("postal_code"), districts.column("name"), self.nodes["Owner"].column("name"),
+            self.edges["LOCATED_IN"].arrays(), self.edges["OWNED_BY"].arrays(),
+            self.edges["NEIGHBOR_OF"].arrays() if neighbors else None)
+
+    # Engine over the materialized aggregates, only expensive_apartments still looks at the apartments
+    def analytics(self):
+        return AnalyticsEngine(self.read_snapshot(), self.aggregates["District"], self.aggregates["Owner"])
+
+    def rebuild_aggregates(self):
+        snapshot = self.read_snapshot()
+        self.aggregates = {
+            "District": Aggregates.recompute(snapshot.apartments, snapshot.located_in, len(self.nodes["District"])),
+            "Owner": Aggregates.recompute(snapshot.apartments, snapshot.owned_by, len(self.nodes["Owner"])),
+        }
+
+    def check_aggregates(self):
+        snapshot = self.read_snapshot()
+        districts = Aggregates.recompute(snapshot.apartments, snapshot.located_in, len(self.nodes["District"]))
+        owners = Aggregates.recompute(snapshot.apartments, snapshot.owned_by, len(self.nodes["Owner"]))
+        return (self.aggregates["District"].mismatches(districts, self.nodes["District"].column("postal_code"),
+                                                       "District")
+                + self.aggregates["Owner"].mismatches(owners, self.nodes["Owner"].column("name"), "Owner"))
+
+    def stale_aggregates(self):
+        stale = 0
+        for relation, label in AGGREGATED_RELATIONS.items():
+            linked = np.unique(self.edges[relation].arrays()[1])
+            counts = self.aggregates[label].values[0]
+            stale += int(np.count_nonzero(linked >= len(counts))
+                         + np.count_nonzero(counts[linked[linked < len(counts)]] == 0))
+        return stale
+
+    def average_price_per_district(self):
+        return self.analytics().average_price_per_district()
+
+    def apartments_per_district(self):
+        return self.analytics().apartments_per_district()
+
+    def expensive_apartments(self, factor=3):
+        return self.analytics().expensive_apartments(factor)
+
+    def overcrowded_districts(self, max_average_rooms=2.3):
+        return self.analytics().overcrowded_districts(max_average_rooms)
+
+    def owner_with_most_apartments(self):
+        return self.analytics().owner_with_most_apartments()
@@ -0,0 +1,564 @@
+from contextlib import contextmanager
+import numpy as np
+from neo4j import GraphDatabase
+from knowledge_graph_creation.aggregates import AGGREGATE_PROPERTIES, mismatch, same_aggregate
+from knowledge_graph_creation.analytics import APARTMENT_PROPERTIES, ApartmentSnapshot, to_column
+from knowledge_graph_creation.batching import batched
+from knowledge_graph_creation.graph_backend import GraphBackend
+from knowledge_graph_creation.query_recorder import QueryRecorder
+from knowledge_graph_creation.schema import drop_statements, location_expression, schema_statements
+from knowledge_graph_creation.triple_export import TripleBuffer
+
+
+def edge_arrays(pairs):
+    array = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    return array[:, 0], array[:, 1]
+
+
+# Cypher for the contribution of apartment {a} to each of the aggregates.AGGREGATE_PROPERTIES
+aggregate_terms = {
+    "apartment_count": "1",
+    "price_count": "CASE WHEN {a}.price IS NULL THEN 0 ELSE 1 END",
+    "price_sum": "coalesce({a}.price, 0)",
+    "price_sum_squares": "toFloat(coalesce({a}.price, 0)) ^ 2",
+    "rooms_count": "CASE WHEN {a}.number_of_rooms IS NULL THEN 0 ELSE 1 END",
+    "rooms_sum": "coalesce({a}.number_of_rooms, 0)",
+}
+
+
+def location(lon, lat):
+    return location_expression.format(lon=lon, lat=lat)
+
+
+# SET items adding (sign "+") or removing (sign "-") the contribution of apartment to the aggregate
+# properties of the District or Owner node. SET on a null node of an OPTIONAL MATCH does nothing.
+def aggregate_update(node, apartment, sign="+"):
+    return ", ".join(f"{node}.{name} = coalesce({node}.{name}, 0) {sign} {term.format(a=apartment)}"
+                     for name, term in aggregate_terms.items())
+
+
+# Cypher of the analytics, shared by Neo4jBackend and AsyncNeo4jBackend. They read the aggregates materialized on
+# the District and Owner nodes, only expensive_apartments still matches the apartments. It returns their listing
+# properties only, not location or embeddings.
+def average_price_per_district_query(db_name):
+    return f'''
+                USE {db_name}
+                MATCH (d:District)
+                WHERE d.price_count > 0
+                RETURN d.name AS district, d.price_sum / toFloat(d.price_count) AS average_price
+                ORDER BY average_price DESC;'''
+
+
+def apartments_per_district_query(db_name):
+    return f'''
+                USE {db_name}
+                MATCH (d:District)
+                WHERE d.apartment_count > 0
+                RETURN d.name AS district, d.apartment_count AS apartment_count
+                ORDER BY apartment_count DESC'''
+
+
+# Parameter $factor
+def expensive_apartments_query(db_name):
+    return f'''
+                USE {db_name}
+                MATCH (d:District)
+                WHERE d.price_count > 0
+                WITH d, d.price_sum / toFloat(d.price_count) AS district_avg_price
+
+                MATCH (a:Apartment)-[:LOCATED_IN]->(d)
+                WHERE a.price > (district_avg_price * $factor)
+
+                RETURN a {{{", ".join("." + name for name in APARTMENT_PROPERTIES)}}} AS a, district_avg_price;'''
+
+
+# Parameter $max_average_rooms
+def overcrowded_districts_query(db_name):
+    return f'''
+                USE {db_name}
+                MATCH (d:District)
+                WHERE d.rooms_count > 0
+                WITH d, d.rooms_sum / toFloat(d.rooms_count) AS avgRooms
+                WHERE avgRooms < $max_average_rooms
+
+                RETURN d {{.postal_code, .name}} AS d, avgRooms;'''
+
+
+def owner_with_most_apartments_query(db_name):
+    return f'''
+                USE {db_name}
+                MATCH (o:Owner)
+                WHERE o.apartment_count > 0
+                RETURN o {{.name}} AS o, o.apartment_count AS apartmentCount
+                ORDER BY apartmentCount DESC
+                LIMIT 1;'''
+
+
+class Neo4jBackend(GraphBackend):
+
+    # Every query runs through queries, a QueryRecorder, under the name of the operation that runs it
+    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password", db_name="neo4j", queries=None):
+        print("Connecting to Neo4j")
+        self.uri = uri
+        self.auth = (user, password)
+        self.driver = GraphDatabase.driver(uri, auth=self.auth)
+        self.db_name = db_name
+        self.queries = queries or QueryRecorder()
+        self.plans = None
+
+    def close(self):
+        self.driver.close()
+
+    def identity(self):
+        return f"{self.uri}/{self.db_name}"
+
+    def clear(self):
+        with self.driver.session() as session:
+            self.queries.run(session, "clear", f"USE {self.db_name} MATCH (n) DETACH DELETE n")
+
+    # Inside explain() queries are only planned: their EXPLAIN plans are collected and no records are returned
+    def read(self, name, query, **parameters):
+        with self.driver.session() as session:
+            if self.plans is not None:
+                self.plans.append(session.run("EXPLAIN " + query.strip(), parameters).consume().plan)
+                return []
+            return self.queries.run(session, name, query, parameters,
+                                    handle=lambda records: [record.data() for record in records])
+
+    @contextmanager
+    def explain(self):
+        self.plans = []
+        try:
+            yield self.plans
+        finally:
+            self.plans = None
+
+    # Creates the constraints and indexes of schema.py that don't exist yet and waits until they are online
+    def ensure_schema(self):
+        with self.driver.session(database=self.db_name) as session:
+            for statement in schema_statements():
+                self.queries.run(session, "ensure_schema", statement, profile=False)
+            self.queries.run(session, "ensure_schema.await_indexes", "CALL db.awaitIndexes(300)", profile=False)
+
+    def drop_schema(self):
+        with self.driver.session(database=self.db_name) as session:
+            for statement in drop_statements():
+                self.queries.run(session, "drop_schema", statement, profile=False)
+
+    def import_districts(self, districts):
+        with self.driver.session() as session:
+            session.execute_write(self.create_districts, districts)
+
+    def import_apartment(self, row):
+        with self.driver.session() as session:
+            if row["owner_name"] is not None:
+                session.execute_write(self.create_update_apartment_owner, row["owner_name"])
+                session.execute_write(self.create_apartment, row)
+            else:
+                session.execute_write(self.create_apartment_without_owner, row)
+
+    # Writes the rows over a single session in batches of UNWIND queries
+    def import_apartments(self, rows, batch_size=1000):
+        count = 0
+        with self.driver.session() as session:
+            for batch in batched(rows, batch_size):
+                session.execute_write(self.create_apartment_batch, batch)
+                count += len(batch)
+        return count
+
+    # Same semantics as create_update_apartment_owner followed by create_apartment or
+    # create_apartment_without_owner for every row, applied in row order
+    def create_apartment_batch(self, tx, rows):
+        owner_names = list(dict.fromkeys(row["owner_name"] for row in rows if row["owner_name"] is not None))
+        query = f'''
+                USE {self.db_name}
+                UNWIND $owner_names AS name
+                MERGE (o:Owner {{name: name}})
+                '''
+        self.queries.run(tx, "import_apartments.owners", query, {"owner_names": owner_names})
+        query = f'''
+                USE {self.db_name}
+                UNWIND $rows AS row
+                MATCH (d:District {{postal_code: row.postal_code}})
+                OPTIONAL MATCH (o:Owner {{name: row.owner_name}})
+
+                MERGE (a:Apartment {{id: row.apartment_id}})
+                ON CREATE SET a.price = row.price, a.floor = row.floor, a.lon = row.lon, a.lat = row.lat,
+                a.location = {location("row.lon", "row.lat")},
+                a.quality = row.quality, a.size = row.size, a.number_of_rooms = row.number_of_rooms
+
+                FOREACH (owner IN CASE WHEN o IS NULL THEN [] ELSE [o] END |
+                    MERGE (a)-[:OWNED_BY]->(owner) ON CREATE SET {aggregate_update("owner", "a")})
+                MERGE (a)-[:LOCATED_IN]->(d) ON CREATE SET {aggregate_update("d", "a")}
+                '''
+        self.queries.run(tx, "import_apartments.apartments", query, {"rows": rows})
+
+    def upsert_apartments(self, rows, batch_size=1000):
+        count = 0
+        with self.driver.session() as session:
+            for batch in batched(rows, batch_size):
+                session.execute_write(self.upsert_apartment_batch, batch)
+                count += len(batch)
+        return count
+
+    def upsert_apartment_batch(self, tx, rows):
+        owner_names = list(dict.fromkeys(row["owner_name"] for row in rows if row["owner_name"] is not None))
+        query = f'''
+                USE {self.db_name}
+                UNWIND $owner_names AS name
+                MERGE (o:Owner {{name: name}})
+                '''
+        self.queries.run(tx, "upsert_apartments.owners", query, {"owner_names": owner_names})
+        query = f'''
+                USE {self.db_name}
+                UNWIND $rows AS row
+                MATCH (d:District {{postal_code: row.postal_code}})
+                OPTIONAL MATCH (o:Owner {{name: row.owner_name}})
+
+                MERGE (a:Apartment {{id: row.apartment_id}})
+
+                WITH a, d, o, row
+                OPTIONAL MATCH (a)-[old:LOCATED_IN|OWNED_BY]->(linked)
+                SET {aggregate_update("linked", "a", "-")}
+                DELETE old
+
+                WITH DISTINCT a, d, o, row
+                SET a.price = row.price, a.floor = row.floor, a.lon = row.lon, a.lat = row.lat,
+                a.location = {location("row.lon", "row.lat")},
+                a.quality = row.quality, a.size = row.size, a.number_of_rooms = row.number_of_rooms
+                FOREACH (owner IN CASE WHEN o IS NULL THEN [] ELSE [o] END |
+                    MERGE (a)-[:OWNED_BY]->(owner) ON CREATE SET {aggregate_update("owner", "a")})
+                MERGE (a)-[:LOCATED_IN]->(d) ON CREATE SET {aggregate_update("d", "a")}
+                '''
+        self.queries.run(tx, "upsert_apartments.apartments", query, {"rows": rows})
+
+    def remove_apartments(self, apartment_ids, tombstone=False):
+        if tombstone:
+            query = f'''
+                    USE {self.db_name}
+                    UNWIND $apartment_ids AS apartment_id
+                    MATCH (a:Apartment {{id: apartment_id}})
+                    OPTIONAL MATCH (a)-[old:LOCATED_IN|OWNED_BY]->(linked)
+                    SET {aggregate_update("linked", "a", "-")}
+                    WITH DISTINCT a
+                    OPTIONAL MATCH (a)-[r]-()
+                    DELETE r
+                    WITH DISTINCT a
+                    REMOVE a:Apartment
+                    SET a:RemovedApartment, a.removed_at = timestamp()'''
+        else:
+            query = f'''
+                    USE {self.db_name}
+                    UNWIND $apartment_ids AS apartment_id
+                    MATCH (a:Apartment {{id: apartment_id}})
+                    OPTIONAL MATCH (a)-[old:LOCATED_IN|OWNED_BY]->(linked)
+                    SET {aggregate_update("linked", "a", "-")}
+                    WITH DISTINCT a
+                    DETACH DELETE a'''
+        count = 0
+        with self.driver.session() as session:
+            for batch in batched(apartment_ids, 10000):
+                session.execute_write(lambda tx: self.queries.run(tx, "remove_apartments", query,
+                                                                  {"apartment_ids": batch}))
+                count += len(batch)
+        return count
+
+    def delete_relationships(self, apartment_ids, relations):
+        query = f'''
+                USE {self.db_name}
+                UNWIND $apartment_ids AS apartment_id
+                MATCH (a:Apartment {{id: apartment_id}})-[r]-(linked)
+                WHERE type(r) IN $relations
+                FOREACH (_ IN CASE WHEN type(r) IN ['LOCATED_IN', 'OWNED_BY'] AND startNode(r) = a THEN [1] ELSE [] END |
+                    SET {aggregate_update("linked", "a", "-")})
+                DELETE r'''
+        with self.driver.session() as session:
+            for batch in batched(apartment_ids, 10000):
+                session.execute_write(lambda tx: self.queries.run(tx, "delete_relationships", query,
+                                                                  {"apartment_ids": batch, "relations": relations}))
+
+    def create_apartment(self, tx, row):
+        query = f'''
+                USE {self.db_name}
+                MATCH (o:Owner {{name: $owner_name}})
+                MATCH (d:District {{postal_code: $postal_code}})
+
+                MERGE (a:Apartment {{id: $apartment_id}})
+                ON CREATE SET a.price = $price, a.floor = $floor, a.lon = $lon, a.lat = $lat,
+                a.location = {location("$lon", "$lat")}, a.quality = $quality,
+                a.size = $size, a.number_of_rooms = $number_of_rooms
+
+                MERGE (a)-[r1:OWNED_BY]->(o) ON CREATE SET {aggregate_update("o", "a")}
+                MERGE (a)-[r2:LOCATED_IN]->(d) ON CREATE SET {aggregate_update("d", "a")}
+                '''
+        self.queries.run(tx, "import_apartment.apartment", query, row)
+
+    def create_apartment_without_owner(self, tx, row):
+        query = f'''
+                USE {self.db_name}
+                MATCH (d:District {{postal_code: $postal_code}})
+                MERGE (a:Apartment {{id: $apartment_id}})
+                ON CREATE SET a.price = $price, a.floor = $floor, a.lon = $lon, a.lat = $lat,
+                a.location = {location("$lon", "$lat")}, a.quality = $quality,
+                a.size = $size, a.number_of_rooms = $number_of_rooms
+
+                MERGE (a)-[r2:LOCATED_IN]->(d) ON CREATE SET {aggregate_update("d", "a")}
+                '''
+        self.queries.run(tx, "import_apartment.apartment", query, row)
+
+    def create_districts(self, tx, districts):
+        for district in districts:
+            query = f'''
+                    USE {self.db_name}
+                    MERGE (d:District {{postal_code: $postal_code}})
+                    ON CREATE SET d.name = $name
+                    '''
+            self.queries.run(tx, "import_districts", query, {"postal_code": district["postal_code"],
+                                                             "name": district["name"]})
+
+    def create_update_apartment_owner(self, tx, name):
+        query = f'''
+                USE {self.db_name}
+                MERGE (o:Owner {{name: $name}})
+                '''
+        self.queries.run(tx, "import_apartment.owner", query, {"name": name})
+
+    def apartment_coordinates(self):
+        query = f'''
+                USE {self.db_name}
+                MATCH (a:Apartment)
+                WHERE a.lon IS NOT NULL AND a.lat IS NOT NULL
+                RETURN a.id AS id, a.lon AS lon, a.lat AS lat'''
+        return [(record["id"], record["lon"], record["lat"]) for record in self.read("apartment_coordinates", query)]
+
+    def merge_neighbors(self, pairs, batch_size=10000):
+        query = f'''
+                USE {self.db_name}
+                UNWIND $pairs AS pair
+                MATCH (a1:Apartment {{id: pair[0]}})
+                MATCH (a2:Apartment {{id: pair[1]}})
+                MERGE (a1)-[:NEIGHBOR_OF]->(a2)'''
+        count = 0
+        with self.driver.session() as session:
+            for batch in batched(pairs, batch_size):
+                session.execute_write(lambda tx: self.queries.run(tx, "merge_neighbors", query, {"pairs": batch}))
+                count += len(batch)
+        return count
+
+    def merge_addresses(self, addresses):
+        query = f'''
+                USE {self.db_name}
+                UNWIND $addresses AS address
+                MERGE (ad:Address {{name: address.name}})
+                ON CREATE SET ad.lon = address.lon, ad.lat = address.lat
+                WITH ad, address
+                UNWIND address.apartment_ids AS apartment_id
+                MATCH (a:Apartment {{id: apartment_id}})
+                MERGE (a)-[:LOCATED_AT_ADDRESS]->(ad)'''
+        with self.driver.session() as session:
+            session.execute_write(lambda tx: self.queries.run(tx, "merge_addresses", query, {"addresses": addresses}))
+
+    def write_embeddings(self, label, key, keys, vectors, property="sage_embeddings", batch_size=1000):
+        query = f'''
+                USE {self.db_name}
+                UNWIND $rows AS row
+                MATCH (n:{label} {{{key}: row.key}})
+                SET n.{property} = row.embedding'''
+        rows = ({"key": value, "embedding": vector} for value, vector in zip(keys, np.asarray(vectors).tolist()))
+        count = 0
+        with self.driver.session() as session:
+            for batch in batched(rows, batch_size):
+                session.execute_write(lambda tx: self.queries.run(tx, f"write_embeddings.{label}", query,
+                                                                  {"rows": batch}))
+                count += len(batch)
+        return count
+
+    # Given ids are looked up one by one through the Apartment.id constraint instead of filtering a label scan
+    def apartment_match(self, apartment_ids):
+        if apartment_ids is None:
+            return "MATCH (a:Apartment)"
+        return "UNWIND $apartment_ids AS apartment_id MATCH (a:Apartment {id: apartment_id})"
+
+    def read_prices(self, apartment_ids=None):
+        records = self.read("read_prices", f'''
+                USE {self.db_name}
+                {self.apartment_match(apartment_ids)}
+                RETURN a.id AS id, a.price AS price''', apartment_ids=apartment_ids)
+        prices, valid = to_column([record["price"] for record in records])
+        return np.array([record["id"] for record in records], dtype=object), prices.astype(np.float64), valid
+
+    def read_price_ranges(self, apartment_ids=None):
+        definitions = {record["name"]: (record["min_price"], record["max_price"])
+                       for record in self.read("read_price_ranges.definitions", f'''
+                USE {self.db_name}
+                MATCH (p:PriceRange)
+                RETURN p.name AS name, p.min_price AS min_price, p.max_price AS max_price''')}
+        assignments = {record["id"]: record["name"] for record in self.read("read_price_ranges.assignments", f'''
+                USE {self.db_name}
+                {self.apartment_match(apartment_ids)}
+                MATCH (a)-[:IN_PRICE_RANGE]->(p:PriceRange)
+                RETURN a.id AS id, p.name AS name''', apartment_ids=apartment_ids)}
+        return definitions, assignments
+
+    # The range nodes are written first, then the moved apartments in batches of UNWIND transactions
+    def write_price_ranges(self, price_ranges, assignments, batch_size=10000):
+        ranges_query = f'''
+                USE {self.db_name}
+                UNWIND $price_ranges AS price_range
+                MERGE (p:PriceRange {{name: price_range[0]}})
+                SET p.min_price = price_range[1][0], p.max_price = price_range[1][1]'''
+        stale_query = f'''
+                USE {self.db_name}
+                MATCH (p:PriceRange)
+                WHERE NOT p.name IN $names
+                DETACH DELETE p'''
+        assignments_query = f'''
+                USE {self.db_name}
+                UNWIND $rows AS row
+                MATCH (a:Apartment {{id: row.id}})
+                OPTIONAL MATCH (a)-[old:IN_PRICE_RANGE]->()
+                DELETE old
+                WITH DISTINCT a, row
+                MATCH (p:PriceRange {{name: row.name}})
+                MERGE (a)-[:IN_PRICE_RANGE]->(p)'''
+        with self.driver.session() as session:
+            session.execute_write(lambda tx: (
+                self.queries.run(tx, "write_price_ranges.ranges", ranges_query,
+                                 {"price_ranges": list(price_ranges.items())}),
+                self.queries.run(tx, "write_price_ranges.stale", stale_query, {"names": list(price_ranges)})))
+            rows = [{"id": apartment_id, "name": name} for apartment_id, name in assignments]
+            for batch in batched(rows, batch_size):
+                session.execute_write(lambda tx: self.queries.run(tx, "write_price_ranges.assignments",
+                                                                  assignments_query, {"rows": batch}))
+        return len(assignments)
+
+    def read_triples(self, relations):
+        with self.driver.session() as session:
+            return session.execute_read(self.read_triples_tx, relations)
+
+    def read_triples_tx(self, tx, relations):
+        query = f'''
+                USE {self.db_name}
+                MATCH (a:Apartment)-[r]->(o)
+                WHERE type(r) IN $relations
+                RETURN count(r) AS count;'''
+        count = self.queries.run(tx, "read_triples.count", query, {"relations": relations})[0]["count"]
+        triples = TripleBuffer(count)
+        query = f'''
+                USE {self.db_name}
+                MATCH (a:Apartment)-[r]->(o)
+                WHERE type(r) IN $relations
+                RETURN a.id AS subject, type(r) AS predicate, coalesce(o.postal_code, o.name) AS object;'''
+
+        def append(records):
+            for record in records:
+                triples.append(record[0], record[1], record[2])
+        self.queries.run(tx, "read_triples", query, {"relations": relations}, handle=append)
+        return triples
+
+    # Reads the apartment columns and the LOCATED_IN / OWNED_BY edges once in a single read transaction
+    def read_snapshot(self, neighbors=False):
+        with self.driver.session() as session:
+            return session.execute_read(self.read_snapshot_tx, neighbors)
+
+    def read_snapshot_tx(self, tx, neighbors=False):
+        properties = ", ".join(f"a.{name} AS {name}" for name in APARTMENT_PROPERTIES)
+        records = self.queries.run(tx, "read_snapshot.apartments", f'''
+                USE {self.db_name}
+                MATCH (a:Apartment)
+                RETURN {properties}''')
+        apartments = {name: to_column([record[name] for record in records]) for name in APARTMENT_PROPERTIES}
+        apartment_rows = {apartment_id: row for row, apartment_id in enumerate(apartments["id"][0])}
+
+        districts = self.queries.run(tx, "read_snapshot.districts", f'''
+                USE {self.db_name}
+                MATCH (d:District)
+                RETURN d.postal_code AS postal_code, d.name AS name''')
+        district_rows = {record["postal_code"]: row for row, record in enumerate(districts)}
+        located_in = self.queries.run(tx, "read_snapshot.located_in", f'''
+                USE {self.db_name}
+                MATCH (a:Apartment)-[:LOCATED_IN]->(d:District)
+                RETURN a.id AS id, d.postal_code AS postal_code''', handle=lambda records: [
+            (apartment_rows[record["id"]], district_rows[record["postal_code"]]) for record in records])
+
+        owner_rows = {}
+        owned_by = self.queries.run(tx, "read_snapshot.owned_by", f'''
+                USE {self.db_name}
+                MATCH (a:Apartment)-[:OWNED_BY]->(o:Owner)
+                RETURN a.id AS id, o.name AS name''', handle=lambda records: [
+            (apartment_rows[record["id"]], owner_rows.setdefault(record["name"], len(owner_rows)))
+            for record in records])
+
+        neighbor_of = None
+        if neighbors:
+            neighbor_of = edge_arrays(self.queries.run(tx, "read_snapshot.neighbor_of", f'''
+                USE {self.db_name}
+                MATCH (a:Apartment)-[:NEIGHBOR_OF]->(b:Apartment)
+                RETURN a.id AS source, b.id AS target''', handle=lambda records: [
+                (apartment_rows[record["source"]], apartment_rows[record["target"]]) for record in records]))
+
+        return ApartmentSnapshot(
+            apartments, np.array([record["postal_code"] for record in districts], dtype=np.int64),
+            np.array([record["name"] for record in districts], dtype=object), np.array(list(owner_rows), dtype=object),
+            edge_arrays(located_in), edge_arrays(owned_by), neighbor_of)
+
+    # Full recompute of the aggregates of every District and Owner from their apartments
+    def recomputed_aggregates(self, tx):
+        expected = ", ".join(f"{name}: {name}" for name in AGGREGATE_PROPERTIES)
+        stored = ", ".join(f".{name}" for name in AGGREGATE_PROPERTIES)
+        return self.queries.run(tx, "recomputed_aggregates", f'''
+                USE {self.db_name}
+                MATCH (n)
+                WHERE n:District OR n:Owner
+                OPTIONAL MATCH (n)<-[:LOCATED_IN|OWNED_BY]-(a:Apartment)
+                WITH n, count(a) AS apartment_count, count(a.price) AS price_count,
+                coalesce(sum(a.price), 0) AS price_sum, coalesce(sum(toFloat(a.price) ^ 2), 0.0) AS price_sum_squares,
+                count(a.number_of_rooms) AS rooms_count, coalesce(sum(a.number_of_rooms), 0) AS rooms_sum
+                RETURN elementId(n) AS element_id, CASE WHEN n:District THEN 'District' ELSE 'Owner' END AS label,
+                coalesce(n.postal_code, n.name) AS key, {{{expected}}} AS expected, n {{{stored}}} AS stored''')
+
+    def rebuild_aggregates(self):
+        def rebuild(tx):
+            rows = [{"element_id": record["element_id"], "values": record["expected"]}
+                    for record in self.recomputed_aggregates(tx)]
+            for batch in batched(rows, 10000):
+                self.queries.run(tx, "rebuild_aggregates", f'''
+                    USE {self.db_name}
+                    UNWIND $rows AS row
+                    MATCH (n) WHERE elementId(n) = row.element_id
+                    SET n += row.values''', {"rows": batch})
+        with self.driver.session() as session:
+            session.execute_write(rebuild)
+
+    def check_aggregates(self):
+        with self.driver.session() as session:
+            records = session.execute_read(self.recomputed_aggregates)
+        return [mismatch(record["label"], record["key"], name, record["stored"][name], record["expected"][name])
+                for record in records for name in AGGREGATE_PROPERTIES
+                if not same_aggregate(record["stored"][name], record["expected"][name])]
+
+    # Number of Districts and Owners with apartments linked to them but no aggregates, as in a database imported
+    # before the aggregates were materialized
+    def stale_aggregates(self):
+        return self.read("stale_aggregates", f'''
+                USE {self.db_name}
+                MATCH (n)
+                WHERE (n:District OR n:Owner) AND n.apartment_count IS NULL
+                AND EXISTS {{ (n)<-[:LOCATED_IN|OWNED_BY]-(:Apartment) }}
+                RETURN count(n) AS nodes''')[0]["nodes"]
+
+    def average_price_per_district(self):
+        return self.read("average_price_per_district", average_price_per_district_query(self.db_name))
+
+    def apartments_per_district(self):
+        return self.read("apartments_per_district", apartments_per_district_query(self.db_name))
+
+    def expensive_apartments(self, factor=3):
+        return self.read("expensive_apartments", expensive_apartments_query(self.db_name), factor=factor)
+
+    def overcrowded_districts(self, max_average_rooms=2.3):
+        return self.read("overcrowded_districts", overcrowded_districts_query(self.db_name),
+                         max_average_rooms=max_average_rooms)
+
+    def owner_with_most_apartments(self):
+        return self.read("owner_with_most_apartments", owner_with_most_apartments_query(self.db_name))
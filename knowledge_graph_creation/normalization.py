@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+# Listing attributes the normalization reads, everything else in a listing is ignored
+LISTING_FIELDS = ["id", "orgname", "postcode", "price", "floor", "lon", "lat", "location_quality", "estate_size",
+                  "number_of_rooms"]
+
+# Reasons a listing is rejected for, in the order they are checked; a listing counts for the first one that applies
+REJECTION_REASONS = ["missing_id", "unknown_postcode", "invalid_location_quality", "missing_price", "invalid_price",
+                     "missing_floor", "invalid_floor", "missing_size", "invalid_size", "missing_rooms",
+                     "invalid_rooms", "duplicate_id"]
+
+INT32_MAX = np.iinfo(np.int32).max
+
+
+# Rejected listings per reason over all batches, with the ids of the first few of every reason
+class RejectionReport:
+
+    def __init__(self, examples=5):
+        self.listings = 0
+        self.counts = dict.fromkeys(REJECTION_REASONS, 0)
+        self.examples = {reason: [] for reason in REJECTION_REASONS}
+        self.max_examples = examples
+
+    @property
+    def rejected(self):
+        return sum(self.counts.values())
+
+    def add(self, listings, reasons, ids):
+        self.listings += listings
+        for code, reason in enumerate(REJECTION_REASONS):
+            selected = np.flatnonzero(reasons == code)
+            self.counts[reason] += len(selected)
+            missing = self.max_examples - len(self.examples[reason])
+            if missing > 0:
+                self.examples[reason] += [None if pd.isna(ids[row]) else str(ids[row]) for row in selected[:missing]]
+
+    def as_dict(self):
+        return {"listings": self.listings, "rejected": self.rejected,
+                "reasons": {reason: count for reason, count in self.counts.items() if count},
+                "examples": {reason: ids for reason, ids in self.examples.items() if ids}}
+
+    def print(self):
+        print(f"Rejected {self.rejected} of {self.listings} listings")
+        for reason, count in self.counts.items():
+            if count:
+                print(f"\t{reason:<26} {count:>9}  e.g. {', '.join(map(str, self.examples[reason]))}")
+
+
+# Typed columns of a batch of accepted listings: int32 price and floor, int8 location quality, float64 size and
+# rooms, which can be fractional like 2.5 rooms, float64 lon / lat with NaN for missing coordinates and categorical
+# owner and postcode
+class ListingColumns:
+
+    def __init__(self, ids, owner, postcode, price, floor, lon, lat, quality, size, number_of_rooms):
+        self.ids = ids
+        self.owner = owner
+        self.postcode = postcode
+        self.price = price
+        self.floor = floor
+        self.lon = lon
+        self.lat = lat
+        self.quality = quality
+        self.size = size
+        self.number_of_rooms = number_of_rooms
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return sum(int(array.nbytes) for array in (self.ids, self.owner.codes, self.postcode.codes, self.price,
+                                                   self.floor, self.lon, self.lat, self.quality, self.size,
+                                                   self.number_of_rooms))
+
+    # The apartment rows the backends import, one dict per listing
+    def rows(self):
+        owners = np.asarray(self.owner.categories, dtype=object)
+        owner_names = np.where(self.owner.codes >= 0, owners[self.owner.codes], None) if len(owners) \
+            else np.full(len(self), None, dtype=object)
+        postal_codes = np.asarray(self.postcode.categories)[self.postcode.codes]
+        lon = np.where(np.isnan(self.lon), None, self.lon)
+        lat = np.where(np.isnan(self.lat), None, self.lat)
+        for values in zip(self.ids.tolist(), owner_names.tolist(), postal_codes.tolist(), self.price.tolist(),
+                          self.floor.tolist(), lon.tolist(), lat.tolist(), self.quality.tolist(),
+                          whole_numbers(self.size), whole_numbers(self.number_of_rooms)):
+            yield dict(zip(("apartment_id", "owner_name", "postal_code", "price", "floor", "lon", "lat", "quality",
+                            "size", "number_of_rooms"), values))
+
+
+# Whole numbers as ints and fractional ones as floats, so the properties keep the type the listing gave them
+def whole_numbers(values):
+    return [int(value) if value.is_integer() else value for value in values.tolist()]
+
+
+# float64 array of a column of raw values, NaN for missing or unparsable ones. Columns of numbers and numeric strings
+# convert in one step, only columns with text like "Preis auf Anfrage" fall back to pandas' element wise parsing.
+def numeric(values):
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(np.array(values, dtype=object), errors='coerce').astype(np.float64)
+
+
+# Normalizes a list of raw listings at once. Every field is coerced as a whole column, numbers given as strings
+# are accepted, text like "Preis auf Anfrage" or a floor "DG" is invalid. price and floor are truncated to
+# whole numbers, size and rooms are kept as they are, e.g. 2.5 rooms. Missing or unparsable coordinates, or ones
+# outside of the valid range, become NaN instead of rejecting the listing. Listings whose id was accepted before,
+# in seen or earlier in the batch, are duplicates.
+# Returns the ListingColumns of the accepted listings and the rejection reason code of every listing, -1 if accepted.
+def normalize_listings(listings, postal_codes, seen=None):
+    frame = {field: [listing.get(field) for listing in listings] for field in LISTING_FIELDS}
+    reasons = np.full(len(listings), -1, dtype=np.int8)
+
+    def reject(reason, mask):
+        reasons[(reasons < 0) & mask] = REJECTION_REASONS.index(reason)
+
+    ids = np.array(frame["id"], dtype=object)
+    reject("missing_id", pd.isna(ids))
+    postcode = numeric(frame["postcode"])
+    reject("unknown_postcode", ~np.isin(postcode, list(postal_codes)))
+    quality = numeric(frame["location_quality"])
+    reject("invalid_location_quality", ~(np.abs(quality) <= np.iinfo(np.int8).max) | (quality != np.floor(quality)))
+    required = {"price": (0, INT32_MAX), "floor": (-INT32_MAX, INT32_MAX), "estate_size": (0, INT32_MAX),
+                "number_of_rooms": (0, INT32_MAX)}
+    values = {}
+    for field, (low, high) in required.items():
+        reason = {"estate_size": "size", "number_of_rooms": "rooms"}.get(field, field)
+        missing = pd.isna(np.array(frame[field], dtype=object))
+        values[field] = numeric(frame[field])
+        reject(f"missing_{reason}", missing)
+        reject(f"invalid_{reason}", ~missing & ~((values[field] >= low) & (values[field] <= high)))
+
+    ids = np.array([str(value) for value in ids], dtype=object)
+    accepted = reasons < 0
+    duplicate = np.zeros(len(listings), dtype=bool)
+    duplicate[accepted] = pd.Index(ids[accepted]).duplicated()
+    if seen is not None:
+        duplicate[accepted] |= np.fromiter((value in seen for value in ids[accepted]), dtype=bool,
+                                           count=int(accepted.sum()))
+    reject("duplicate_id", duplicate)
+    accepted = reasons < 0
+    if seen is not None:
+        seen.update(ids[accepted].tolist())
+
+    lon = numeric(frame["lon"])[accepted]
+    lat = numeric(frame["lat"])[accepted]
+    invalid_coordinates = ~((np.abs(lon) <= 180) & (np.abs(lat) <= 90))
+    lon[invalid_coordinates] = np.nan
+    lat[invalid_coordinates] = np.nan
+    owner = np.array(frame["orgname"], dtype=object)[accepted]
+    columns = ListingColumns(
+        ids[accepted],
+        pd.Categorical(np.where(pd.isna(owner), None, owner)),
+        pd.Categorical(postcode[accepted].astype(np.int64)),
+        np.trunc(values["price"][accepted]).astype(np.int32),
+        np.trunc(values["floor"][accepted]).astype(np.int32),
+        lon, lat,
+        quality[accepted].astype(np.int8),
+        values["estate_size"][accepted],
+        values["number_of_rooms"][accepted])
+    return columns, reasons
+
+
+# Normalizes a stream of raw listings in batches of batch_size, yielding the ListingColumns of every batch.
+# Rejections are counted into report, duplicates are detected over the whole stream.
+def iter_normalized(listings, postal_codes, report, batch_size=100000):
+    seen = set()
+    batch = []
+    for listing in listings:
+        batch.append(listing)
+        if len(batch) == batch_size:
+            yield normalized_batch(batch, postal_codes, report, seen)
+            batch = []
+    if batch:
+        yield normalized_batch(batch, postal_codes, report, seen)
+
+
+def normalized_batch(batch, postal_codes, report, seen):
+    columns, reasons = normalize_listings(batch, postal_codes, seen)
+    report.add(len(batch), reasons, np.array([listing.get("id") for listing in batch], dtype=object))
+    return columns
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+# Names, lower and upper bounds of name -> (min_price, max_price) ranges, ordered by their lower bound.
+# Bounds are inclusive on both ends like the Cypher range check, so ranges must not overlap.
+def range_bounds(price_ranges):
+    items = sorted(price_ranges.items(), key=lambda item: item[1][0])
+    names = [name for name, _ in items]
+    lower = np.array([bounds[0] for _, bounds in items], dtype=np.float64)
+    upper = np.array([bounds[1] for _, bounds in items], dtype=np.float64)
+    if np.any(lower[1:] <= upper[:-1]):
+        raise ValueError(f"Overlapping price ranges: {price_ranges}")
+    return names, lower, upper
+
+
+# Index into names of the range each price falls into, found with one binary search over the lower bounds
+# per price; -1 for missing prices and prices in a gap between or outside of the ranges
+def assign_buckets(prices, valid, price_ranges):
+    names, lower, upper = range_bounds(price_ranges)
+    buckets = np.searchsorted(lower, prices, side='right') - 1
+    inside = valid & (buckets >= 0)
+    inside[inside] = prices[inside] <= upper[buckets[inside]]
+    return names, np.where(inside, buckets, -1)
+
+
+# count ranges with about the same number of apartments each, named Q1, Q2, ... unless names are given.
+# Prices are whole euros, so every range starts one above the end of the previous one. Quantiles that
+# coincide, e.g. with many identical prices, are merged, so there can be fewer ranges than count.
+def quantile_price_ranges(prices, count=4, names=None):
+    prices = np.asarray(prices, dtype=np.float64)
+    if len(prices) == 0:
+        return {}
+    upper = np.unique(np.quantile(prices, np.linspace(0, 1, count + 1)[1:], method='higher'))
+    lower = np.concatenate([[prices.min()], upper[:-1] + 1])
+    names = names or [f"Q{index + 1}" for index in range(len(upper))]
+    if len(names) < len(upper):
+        raise ValueError(f"{len(upper)} quantile ranges but only {len(names)} names")
+    return {name: (int(low), int(high)) for name, low, high in zip(names, lower, upper)}
@@ -0,0 +1,163 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Update counters of the driver's ResultSummary.counters that are summed per query
+COUNTERS = ["nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted", "properties_set",
+            "labels_added", "labels_removed", "indexes_added", "indexes_removed", "constraints_added",
+            "constraints_removed"]
+
+
+# Sum of the db hits of every operator in a PROFILE plan
+def db_hits(profile):
+    return profile.get("dbHits", 0) + sum(db_hits(child) for child in profile.get("children", []))
+
+
+# Running totals of one named query
+class QueryStats:
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.available_after = 0.0
+        self.consumed_after = 0.0
+        self.db_hits = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.profile = None
+
+    def as_dict(self):
+        return {"calls": self.calls, "seconds": self.seconds, "max_seconds": self.max_seconds, "rows": self.rows,
+                "result_available_after": self.available_after, "result_consumed_after": self.consumed_after,
+                "db_hits": self.db_hits, "counters": self.counters}
+
+
+# The one place Cypher is executed through. Every query has a name, e.g. "import_apartments.create_apartment_batch",
+# under which its calls, wall time, the server's result_available_after / result_consumed_after, rows returned and
+# update counters are summed up. With profile=True queries run as PROFILE and the db hits and the last plan of every
+# query are kept as well. With log set, one JSON line per execution is written to that path or file object.
+class QueryRecorder:
+
+    def __init__(self, profile=False, log=None):
+        self.profile = profile
+        self.own_log = isinstance(log, str)
+        self.log = open(log, 'a', encoding='utf-8') if self.own_log else log
+        self.stats = {}
+
+    # Runs query on a session or transaction, hands the records to handle and returns what it returns.
+    # handle gets an iterator, so large results can be consumed as they stream in. profile=False overrides
+    # the recorder's setting for statements that can't be profiled, like schema commands.
+    def run(self, runner, name, query, parameters=None, handle=list, profile=None):
+        rows = 0
+
+        def records(result):
+            nonlocal rows
+            for record in result:
+                rows += 1
+                yield record
+
+        start = time.perf_counter()
+        profile = self.profile if profile is None else profile
+        result = runner.run(("PROFILE " + query.strip()) if profile else query, parameters or {})
+        value = handle(records(result))
+        summary = result.consume()
+        self.add(name, time.perf_counter() - start, rows, summary)
+        return value
+
+    # run for a session or transaction of the async driver
+    async def run_async(self, runner, name, query, parameters=None, handle=list, profile=None):
+        profile = self.profile if profile is None else profile
+        start = time.perf_counter()
+        result = await runner.run(("PROFILE " + query.strip()) if profile else query, parameters or {})
+        records = [record async for record in result]
+        summary = await result.consume()
+        self.add(name, time.perf_counter() - start, len(records), summary)
+        return handle(iter(records))
+
+    def add(self, name, seconds, rows, summary=None):
+        stats = self.stats.setdefault(name, QueryStats())
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+        stats.rows += rows
+        entry = {"query": name, "seconds": seconds, "rows": rows}
+        if summary is not None:
+            available_after = (summary.result_available_after or 0) / 1000
+            consumed_after = (summary.result_consumed_after or 0) / 1000
+            stats.available_after += available_after
+            stats.consumed_after += consumed_after
+            counters = {counter: getattr(summary.counters, counter) for counter in COUNTERS
+                        if getattr(summary.counters, counter)}
+            for counter, value in counters.items():
+                stats.counters[counter] += value
+            entry.update(result_available_after=available_after, result_consumed_after=consumed_after,
+                         counters=counters)
+            if summary.profile:
+                stats.profile = summary.profile
+                stats.db_hits += db_hits(summary.profile)
+                entry["db_hits"] = db_hits(summary.profile)
+        if self.log is not None:
+            self.log.write(json.dumps(entry) + "\n")
+            self.log.flush()
+
+    # Records the wall time of work that doesn't go through run, e.g. GDS procedures called by the client library.
+    # The block can set rows on the yielded dict.
+    @contextmanager
+    def timed(self, name):
+        entry = {"rows": 0}
+        start = time.perf_counter()
+        yield entry
+        self.add(name, time.perf_counter() - start, entry["rows"])
+
+    # GraphDataScience.run_cypher with the call recorded, returns its DataFrame
+    def run_cypher(self, gds, name, query, params=None):
+        with self.timed(name) as entry:
+            frame = gds.run_cypher(query, params=params)
+            entry["rows"] = len(frame)
+        return frame
+
+    def reset(self):
+        self.stats = {}
+
+    def report(self, top=None):
+        ranked = sorted(self.stats.items(), key=lambda item: item[1].seconds, reverse=True)[:top]
+        print(f"{'query':<48} {'calls':>6} {'total s':>9} {'max s':>8} {'rows':>9} {'db hits':>10}")
+        for name, stats in ranked:
+            print(f"{name:<48} {stats.calls:>6} {stats.seconds:>9.3f} {stats.max_seconds:>8.3f} {stats.rows:>9} "
+                  f"{stats.db_hits:>10}")
+        return {name: stats.as_dict() for name, stats in ranked}
+
+    # Prometheus text exposition format of the totals, every metric labelled with the query name
+    def prometheus(self, prefix="apartment_graph_query"):
+        metrics = [
+            ("calls_total", "Executions of the query", lambda stats: stats.calls),
+            ("seconds_total", "Wall time spent in the query on the client", lambda stats: stats.seconds),
+            ("max_seconds", "Slowest execution of the query", lambda stats: stats.max_seconds),
+            ("rows_total", "Rows returned by the query", lambda stats: stats.rows),
+            ("result_available_after_seconds_total", "Server time until the first record was available",
+             lambda stats: stats.available_after),
+            ("result_consumed_after_seconds_total", "Server time until all records were consumed",
+             lambda stats: stats.consumed_after),
+            ("db_hits_total", "Database hits of profiled executions", lambda stats: stats.db_hits),
+        ]
+        lines = []
+        for metric, description, value in metrics:
+            kind = "gauge" if metric == "max_seconds" else "counter"
+            lines += [f"# HELP {prefix}_{metric} {description}", f"# TYPE {prefix}_{metric} {kind}"]
+            lines += [f'{prefix}_{metric}{{query="{name}"}} {value(stats)}' for name, stats in self.stats.items()]
+        lines += [f"# HELP {prefix}_updates_total Graph updates reported by the server",
+                  f"# TYPE {prefix}_updates_total counter"]
+        lines += [f'{prefix}_updates_total{{query="{name}",counter="{counter}"}} {value}'
+                  for name, stats in self.stats.items() for counter, value in stats.counters.items() if value]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path + ".tmp", 'w', encoding='utf-8') as file:
+            file.write(self.prometheus())
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        if self.own_log:
+            self.log.close()
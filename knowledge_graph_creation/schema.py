@@ -0,0 +1,58 @@
+# Uniqueness constraints on the keys the imports MERGE on, as (name, label, property). Each one is backed by a
+# range index, so the MERGE / MATCH lookups by key become index seeks instead of label scans.
+constraints = [
+    ("apartment_id", "Apartment", "id"),
+    ("owner_name", "Owner", "name"),
+    ("district_postal_code", "District", "postal_code"),
+    ("address_name", "Address", "name"),
+    ("price_range_name", "PriceRange", "name"),
+]
+
+# Range indexes as (name, label, properties)
+range_indexes = [
+    ("apartment_price", "Apartment", ["price"]),
+    ("apartment_lon_lat", "Apartment", ["lon", "lat"]),
+]
+
+# Point indexes as (name, label, property), Apartment.location is point(lon, lat) and set on import
+point_indexes = [
+    ("apartment_location", "Apartment", "location"),
+]
+
+# Cypher expression of the location point of an apartment from its lon and lat expressions,
+# null if either of them is null
+location_expression = "point({{longitude: toFloat({lon}), latitude: toFloat({lat})}})"
+
+
+def schema_statements():
+    statements = [f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:{label}) REQUIRE n.{key} IS UNIQUE"
+                  for name, label, key in constraints]
+    statements += [f"CREATE INDEX {name} IF NOT EXISTS FOR (n:{label}) ON ({', '.join('n.' + p for p in properties)})"
+                   for name, label, properties in range_indexes]
+    statements += [f"CREATE POINT INDEX {name} IF NOT EXISTS FOR (n:{label}) ON (n.{key})"
+                   for name, label, key in point_indexes]
+    return statements
+
+
+def drop_statements():
+    return [f"DROP CONSTRAINT {name} IF EXISTS" for name, _, _ in constraints] + \
+           [f"DROP INDEX {name} IF EXISTS" for name, _, _ in range_indexes + point_indexes]
+
+
+# Yields (operator, details) of every operator in an EXPLAIN / PROFILE plan of the Python driver,
+# operators without the "@neo4j" suffix of newer versions
+def plan_operators(plan):
+    yield plan["operatorType"].split("@")[0], plan.get("args", plan.get("arguments", {})).get("Details", "")
+    for child in plan.get("children", []):
+        yield from plan_operators(child)
+
+
+# Splits the operators of a plan into index lookups and label or all node scans
+def index_usage(plan):
+    usage = {"indexes": [], "scans": []}
+    for operator, details in plan_operators(plan):
+        if "Index" in operator or operator == "PointDistanceSeek":
+            usage["indexes"].append(f"{operator} {details}")
+        elif operator.endswith("LabelScan") or operator == "AllNodesScan":
+            usage["scans"].append(f"{operator} {details}")
+    return usage
@@ -0,0 +1,73 @@
+import math
+from collections import defaultdict
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+# Buckets points into a regular lon/lat grid whose cells are at least radius meters wide,
+# so all points within radius of a point lie in its own or one of the 8 adjacent cells
+class SpatialGrid:
+
+    def __init__(self, points, radius):
+        self.radius = radius
+        self.points = points
+        max_lat = max((abs(lat) for _, _, lat in points), default=0.0)
+        self.lat_step = radius / METERS_PER_DEGREE
+        self.lon_step = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(max_lat)), 1e-6))
+        self.cells = defaultdict(list)
+        for index, (_, lon, lat) in enumerate(points):
+            self.cells[self.cell(lon, lat)].append(index)
+
+    def cell(self, lon, lat):
+        return math.floor(lon / self.lon_step), math.floor(lat / self.lat_step)
+
+    def within(self, index):
+        _, lon, lat = self.points[index]
+        cell_lon, cell_lat = self.cell(lon, lat)
+        for d_lon in (-1, 0, 1):
+            for d_lat in (-1, 0, 1):
+                for other in self.cells.get((cell_lon + d_lon, cell_lat + d_lat), ()):
+                    if other == index:
+                        continue
+                    _, other_lon, other_lat = self.points[other]
+                    if haversine(lon, lat, other_lon, other_lat) <= self.radius:
+                        yield other
+
+
+# Yields (id, id) pairs of apartments with identical coordinates, in both directions
+def exact_neighbor_pairs(points, touched=None):
+    groups = defaultdict(list)
+    for apartment_id, lon, lat in points:
+        groups[(lon, lat)].append(apartment_id)
+    for ids in groups.values():
+        if touched is not None and not any(apartment_id in touched for apartment_id in ids):
+            continue
+        for first in ids:
+            for second in ids:
+                if first != second and (touched is None or first in touched or second in touched):
+                    yield first, second
+
+
+# Yields (id, id) pairs of apartments at most radius meters apart, in both directions.
+# points is a list of (id, lon, lat) tuples, points without coordinates have to be filtered out before.
+# With touched set, only pairs with at least one apartment out of touched are yielded.
+def neighbor_pairs(points, radius=None, touched=None):
+    if not radius:
+        yield from exact_neighbor_pairs(points, touched)
+        return
+    grid = SpatialGrid(points, radius)
+    for index, (apartment_id, _, _) in enumerate(points):
+        if touched is not None and apartment_id not in touched:
+            continue
+        for other in grid.within(index):
+            other_id = points[other][0]
+            yield apartment_id, other_id
+            if touched is not None and other_id not in touched:
+                yield other_id, apartment_id
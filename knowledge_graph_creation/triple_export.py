@@ -0,0 +1,72 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+EMBEDDING_RELATIONS = ["LOCATED_IN", "IN_PRICE_RANGE", "OWNED_BY"]
+
+
+# Encodes labels to consecutive integer codes in order of first appearance
+class LabelEncoder:
+
+    def __init__(self):
+        self.codes = {}
+        self.labels = []
+
+    def encode(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.codes[label] = code
+            self.labels.append(label)
+        return code
+
+
+# Columnar (subject, predicate, object) store with integer encoded labels. Subjects and objects share one
+# entity vocabulary, the columns are preallocated for the expected size and only grow if it was too small.
+class TripleBuffer:
+
+    def __init__(self, capacity=0):
+        self.size = 0
+        self.columns = np.empty((max(capacity, 1), 3), dtype=np.int32)
+        self.entities = LabelEncoder()
+        self.relations = LabelEncoder()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, subject, predicate, obj):
+        if self.size == len(self.columns):
+            self.columns = np.resize(self.columns, (2 * len(self.columns), 3))
+        row = self.columns[self.size]
+        row[0] = self.entities.encode(str(subject))
+        row[1] = self.relations.encode(predicate)
+        row[2] = self.entities.encode(str(obj))
+        self.size += 1
+
+    def triples(self):
+        return self.columns[:self.size]
+
+    def to_frame(self):
+        triples = self.triples()
+        entities = pd.Index(self.entities.labels, dtype=object)
+        relations = pd.Index(self.relations.labels, dtype=object)
+        return pd.DataFrame({
+            "subject": pd.Categorical.from_codes(triples[:, 0], categories=entities),
+            "predicate": pd.Categorical.from_codes(triples[:, 1], categories=relations),
+            "object": pd.Categorical.from_codes(triples[:, 2], categories=entities),
+        })
+
+    # Writes the triples as Parquet, Feather/Arrow or as an int32 .npy matrix with a .labels.json sidecar
+    def save(self, file_path):
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension == ".parquet":
+            self.to_frame().to_parquet(file_path, index=False)
+        elif extension in (".feather", ".arrow"):
+            self.to_frame().to_feather(file_path)
+        elif extension == ".npy":
+            np.save(file_path, self.triples())
+            with open(file_path[:-len(extension)] + ".labels.json", 'w', encoding='utf-8') as file:
+                json.dump({"entities": self.entities.labels, "relations": self.relations.labels}, file)
+        else:
+            raise ValueError(f"Unsupported triple file format: {file_path}")